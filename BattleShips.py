@@ -17,10 +17,16 @@ def game():
 	clockObj = pygame.time.Clock()
 	while game.gameStage != STAGES.CLOSING:
 		# Process events - always handle these even when window doesn't have focus
-		events = pygame.fastevent.get()
+		# While idle sleep until an event comes, network responses post one too
+		if game.isIdle():
+			events = [pygame.event.wait(Constants.IDLE_WAIT)] + pygame.fastevent.get()
+		else:
+			events = pygame.fastevent.get()
 		for event in events:
 			if event.type == pygame.QUIT:
 				game.quit()
+			elif event.type == Constants.NETWORK_EVENT:
+				game.networkEventPosted = False  # handled below by handleConnections
 			elif event.type == pygame.USEREVENT:
 				# Only advance animations if window has focus (saves CPU when minimized)
 				if Frontend.Runtime.windowHasFocus:
@@ -0,0 +1,92 @@
+"""
+Fragments per message and encode time of the legacy JSON/base64 chunker
+against the current fragmentation layer and compression, for fleet layouts
+and game-end grids.
+
+Run from the repository root:
+	python -m Benchmarks.fragmentation_bench
+"""
+import json
+import base64
+import uuid
+import timeit
+
+from Shared import MeshCorePrimitives, WireCodec
+from Shared.FleetCodec import Fleet
+from Shared.Enums import COM
+
+MAX_MESSAGE_SIZE = MeshCorePrimitives.MAX_MESSAGE_SIZE
+REPEATS = 2000
+
+def legacy_chunk_message(message_str: str) -> list[str]:
+	'''the chunker as it was before the fragmentation layer, kept for comparison'''
+	if len(message_str.encode('utf-8')) <= MAX_MESSAGE_SIZE:
+		return [message_str]
+	chunks = []
+	message_bytes = message_str.encode('utf-8')
+	chunk_id = str(uuid.uuid4())[:8]
+	total_chunks = (len(message_bytes) + MAX_MESSAGE_SIZE - 1) // MAX_MESSAGE_SIZE
+	DATA_CHUNK_SIZE = MAX_MESSAGE_SIZE - 50
+	for i in range(total_chunks):
+		start = i * DATA_CHUNK_SIZE
+		end = min(start + DATA_CHUNK_SIZE, len(message_bytes))
+		chunk_msg = {'c': chunk_id, 'n': i, 't': total_chunks, 'd': base64.b64encode(message_bytes[start:end]).decode('utf-8')}
+		chunk_str = json.dumps(chunk_msg)
+		while len(chunk_str.encode('utf-8')) > MAX_MESSAGE_SIZE:
+			DATA_CHUNK_SIZE = max(20, DATA_CHUNK_SIZE - 10)
+			start = i * DATA_CHUNK_SIZE
+			end = min(start + DATA_CHUNK_SIZE, len(message_bytes))
+			chunk_msg['d'] = base64.b64encode(message_bytes[start:end]).decode('utf-8')
+			chunk_str = json.dumps(chunk_msg)
+		chunks.append(chunk_str)
+	return chunks
+
+def legacy_intact(message_str: str, chunks: list[str]) -> bool:
+	if len(chunks) == 1: return chunks[0] == message_str
+	data = b''.join(base64.b64decode(json.loads(c)['d']) for c in chunks)
+	return data == message_str.encode('utf-8')
+
+def fleet(hitted=False) -> list[dict]:
+	layout = [([3, 0], 2, True), ([4, 3], 2, False), ([5, 7], 3, True), ([1, 5], 4, False), ([8, 4], 1, True),
+		([6, 1], 1, False), ([5, 9], 2, True), ([1, 1], 2, False), ([9, 0], 3, False)]
+	# in canonical order, as Grid.shipsDicts() sends it
+	return Fleet.from_dicts([{'pos': pos, 'size': size, 'horizontal': horizontal, 'hitted': [hitted] * size} for pos, size, horizontal in layout]).to_dicts()
+
+CASES = {
+	'layout (GAME_READINESS)': (COM.GAME_READINESS, {'ships': fleet(), 'ready': True, 'id': 734512}),
+	'game-end grid (SHOOT reply)': (COM.SHOOT, {'hitted': True, 'sunken_ship': fleet(True)[0], 'game_won': True,
+		'opponent_grid': {'ships': fleet(True)}, 'game_end_msg': 'You lost!   :(', 'stay_connected': False}),
+}
+
+def main():
+	print(f'frame size {MAX_MESSAGE_SIZE} chars, {REPEATS} encodes per measurement\n')
+	print(f"{'message':30} {'encoder':22} {'frames':>6} {'chars':>6} {'us/msg':>8} {'intact':>6}")
+	for name, (command, payload) in CASES.items():
+		msg_str = json.dumps({'id': 734512, 'command': command, 'payload': payload}, separators=(',', ':'))
+		chunks = legacy_chunk_message(msg_str)
+		t = timeit.timeit(lambda: legacy_chunk_message(msg_str), number=REPEATS) / REPEATS * 1e6
+		print(f'{name:30} {"legacy json+base64":22} {len(chunks):>6} {sum(map(len, chunks)):>6} {t:>8.1f} {str(legacy_intact(msg_str, chunks)):>6}')
+
+		# same JSON string as the legacy chunker gets, so only the fragmentation is timed
+		fragmenter = MeshCorePrimitives._fragmenter
+		msg_bytes = msg_str.encode('utf-8')
+		frames = fragmenter.fragment(msg_bytes)
+		t = timeit.timeit(lambda: fragmenter.fragment(msg_bytes), number=REPEATS) / REPEATS * 1e6
+		decoded = [msg for f in frames for msg in MeshCorePrimitives.decode_frame(f)][-1]
+		print(f'{name:30} {"fragmenter json":22} {len(frames):>6} {sum(map(len, frames)):>6} {t:>8.1f} {str(decoded == (734512, command, payload)):>6}')
+
+		# what actually goes on the air: binary codec, fragmented only when needed
+		frames = MeshCorePrimitives.encode_message(734512, command, payload)
+		t = timeit.timeit(lambda: MeshCorePrimitives.encode_message(734512, command, payload), number=REPEATS) / REPEATS * 1e6
+		decoded = [msg for f in frames for msg in MeshCorePrimitives.decode_frame(f)][-1]
+		print(f'{name:30} {"binary codec + frag.":22} {len(frames):>6} {sum(map(len, frames)):>6} {t:>8.1f} {str(decoded == (734512, command, payload)):>6}')
+
+		# between peers which negotiated compression
+		frames, = MeshCorePrimitives.encode_messages(734512, [(command, payload)], compress=True)
+		t = timeit.timeit(lambda: MeshCorePrimitives.encode_messages(734512, [(command, payload)], compress=True), number=REPEATS) / REPEATS * 1e6
+		decoded = [msg for f in frames for msg in MeshCorePrimitives.decode_frame(f)][-1]
+		print(f'{name:30} {"binary + deflate":22} {len(frames):>6} {sum(map(len, frames)):>6} {t:>8.1f} {str(decoded == (734512, command, payload)):>6}')
+		print()
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,111 @@
+'''
+Session running its networking on one asyncio event loop instead of Thread-Send and Thread-Recv.
+
+The game talks to it through the same api as to `Session`. Requests reach
+the loop through `call_soon_threadsafe`, pushed messages the same way, so
+nothing wakes up unless there is work, and quitting cancels the loop's tasks
+instead of waiting for poll timeouts. The radio is awaited natively
+(worker replies, meshcli subprocesses), other transports through their
+`*_async` methods.
+
+Pick it with the '--async-session' command line flag.
+'''
+import time
+import asyncio
+import logging
+import threading
+
+from Shared.Transport import Transport
+from Shared.Helpers import runFuncLogged
+from .Session import Session, Request
+
+class AsyncSession(Session):
+	POLL_INTERVAL = 0.1  # s, for transports which can't push messages
+
+	def __init__(self, transport: Transport=None):
+		self.loop = asyncio.new_event_loop()
+		self._reqs: asyncio.Queue[Request] = None
+		self._tasks: list[asyncio.Task] = []
+		self._loopReady = threading.Event()
+		super().__init__(transport)
+
+	# session hooks -----------------------------
+	def _startWorkers(self):
+		self.loopThread = threading.Thread(target=lambda: runFuncLogged(self._runLoop), name='Thread-Async', daemon=True)
+		self.loopThread.start()
+		self._loopReady.wait()
+	def _stopWorkers(self):
+		if self.loop.is_running():
+			asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result()
+		self.loopThread.join()
+	def checkThreads(self):
+		if not self.loopThread.is_alive():
+			raise RuntimeError('Thread-Async ended')
+	def _submit(self, req: Request):
+		self.loop.call_soon_threadsafe(self._reqs.put_nowait, req)
+	def _pushMessage(self, msg: tuple[int, str, dict]):
+		'''called by the transport as soon as a message arrives, on its reader thread'''
+		try:
+			self.loop.call_soon_threadsafe(self._routeMessage, msg)
+		except RuntimeError:
+			pass  # the loop is closed, the session quit
+
+	# event loop --------------------------------
+	def _runLoop(self):
+		asyncio.set_event_loop(self.loop)
+		try:
+			self.loop.run_until_complete(self._main())
+		finally:
+			self.loop.run_until_complete(self.loop.shutdown_default_executor())
+			self.loop.close()
+	async def _main(self):
+		self._reqs = asyncio.Queue()
+		self._tasks = [asyncio.create_task(self._sendLoop()), asyncio.create_task(self._recvLoop())]
+		self._loopReady.set()
+		# a task ending by an exception ends the loop too, so checkThreads notices
+		done, pending = await asyncio.wait(self._tasks, return_when=asyncio.FIRST_EXCEPTION)
+		for task in pending: task.cancel()
+		for task in done:
+			if not task.cancelled() and task.exception(): raise task.exception()
+	async def _shutdown(self):
+		for task in self._tasks: task.cancel()
+
+	async def _sendLoop(self):
+		'''sends reqs as the game queues them, see Session.sendLoop'''
+		throttled = False
+		while 1:
+			if not len(self.scheduler):
+				self.scheduler.push(await self._reqs.get())
+				await self._collectReqsAsync(time.monotonic() + self.COALESCE_WINDOW)
+			if delay := self.scheduler.delay():
+				if not throttled: self.scheduler.noteThrottled()
+				throttled = True
+				await self._collectReqsAsync(time.monotonic() + delay)
+				continue
+			throttled = False
+			await self._sendReqsAsync(self.scheduler.popBurst(self._airtime))
+	async def _collectReqsAsync(self, deadline: float):
+		'''moves reqs arriving until deadline into the scheduler'''
+		while (remaining := deadline - time.monotonic()) > 0:
+			try:
+				self.scheduler.push(await asyncio.wait_for(self._reqs.get(), remaining))
+			except asyncio.TimeoutError:
+				break
+	async def _sendReqsAsync(self, reqs: list[Request]):
+		if not (toSend := self._prepareReqs(reqs)):
+			return
+		try:
+			success = await self.transport.send_messages_async(self.opponent_node_name, self.id, self._wireMessages(toSend))
+		except Exception as e:
+			logging.error(f'Error sending {[req.command for req in toSend]}: {e}')
+			success = False
+		self._finishReqs(toSend, success)
+
+	async def _recvLoop(self):
+		'''polls the transport until it can push messages, these are routed by _pushMessage
+		a replaced radio connection keeps pushing to the subscription (see `MeshCorePrimitives.use_connection`)'''
+		while 1:
+			if await self.transport.subscribe_messages_async(self._pushMessage): return
+			for msg in await self.transport.receive_async():
+				self._routeMessage(msg)
+			await asyncio.sleep(self.POLL_INTERVAL)
@@ -0,0 +1,115 @@
+'''
+Getting back into a match after a crash or a dropped link.
+
+At every turn boundary the game saves what the match can't be rebuilt
+without into a small file: both grids, the opponent's state (its layout),
+who is on turn, the session id, the peer and the shots so far. The file is
+written next to its final place and renamed over it, so a crash leaves the
+old checkpoint or the new one, never a torn one.
+
+Started again, the game restores the checkpoint instead of pairing, and the
+two sides compare their matches with RESUME messages:
+	{'turn': shots so far, 'hash': stateHash of the match, 'moves': positions of the last DELTA shots}
+The side with fewer shots takes the missing ones from the other's 'moves'
+and checks the hashes agree then. That is a round trip or two instead of
+pairing and placing again. A side playing the match answers every RESUME
+with its own, a resuming side repeats its RESUME every RESUME_RETRY until
+it hears one. 'turn' NO_MATCH says the sender doesn't play that match.
+
+The file is '~/.battleships_match.json', '--checkpoint PATH' moves it.
+'''
+import os
+import json
+import zlib
+import struct
+import logging
+import argparse
+from typing import Optional
+
+from Shared.FleetCodec import Fleet, FleetError
+
+CHECKPOINT_FILE = os.path.expanduser('~/.battleships_match.json')
+FORMAT = 1  # of the file, a checkpoint of another format is ignored
+DELTA = 4  # shots a RESUME carries, a crash loses the one in flight at most
+NO_MATCH = -1
+RESUME_RETRY = 5.  # s
+RESUME_TIMEOUT = 60.  # s, then the match is given up and pairing starts over
+
+Move = list[int]  # [shooter id, x, y]
+
+class MatchCheckpoint:
+	'''the checkpoint file of the match in progress, a path of None keeps no checkpoint'''
+	def __init__(self, path: Optional[str]):
+		self.path = path
+		self.saves = 0
+
+	@ classmethod
+	def fromArgs(cls) -> 'MatchCheckpoint':
+		parser = argparse.ArgumentParser(add_help=False)
+		parser.add_argument('--checkpoint', default=CHECKPOINT_FILE)
+		args, unknown = parser.parse_known_args()
+		return cls(args.checkpoint)
+
+	def save(self, state: dict):
+		'''replaces the checkpoint atomically'''
+		if not self.path: return
+		tmpPath = f'{self.path}.tmp'
+		try:
+			with open(tmpPath, 'w') as f:
+				json.dump({'format': FORMAT, **state}, f, separators=(',', ':'))
+				f.flush()
+				os.fsync(f.fileno())
+			os.replace(tmpPath, self.path)
+			self.saves += 1
+		except OSError as e:
+			logging.warning(f'Could not checkpoint the match: {e}')
+	def load(self) -> Optional[dict]:
+		if not self.path: return None
+		try:
+			with open(self.path) as f:
+				state = json.load(f)
+		except (OSError, ValueError):
+			return None
+		return state if isinstance(state, dict) and state.get('format') == FORMAT else None
+	def clear(self):
+		if not self.path: return
+		try:
+			os.remove(self.path)
+		except FileNotFoundError:
+			pass
+		except OSError as e:
+			logging.warning(f'Could not remove the match checkpoint: {e}')
+
+def stateHash(layouts: dict[int, list[dict]], moves: list[Move]) -> int:
+	'''crc32 of the players' layouts (player id -> ship dicts) and the shots, the same on both sides of a match'''
+	crc = 0
+	for playerId in sorted(layouts):
+		unhit = [{**ship, 'hitted': [False] * ship['size']} for ship in layouts[playerId]]
+		crc = zlib.crc32(struct.pack('<I', playerId) + Fleet.from_dicts(unhit).encode(), crc)
+	for shooter, x, y in moves:
+		crc = zlib.crc32(struct.pack('<IBB', shooter, x, y), crc)
+	return crc
+
+def summary(layouts: dict[int, list[dict]], moves: list[Move]) -> dict:
+	'''RESUME payload of a match'''
+	return {'turn': len(moves), 'hash': stateHash(layouts, moves), 'moves': [[x, y] for shooter, x, y in moves[-DELTA:]]}
+
+def noMatch() -> dict:
+	'''RESUME payload of a side which doesn't play the match asked about'''
+	return {'turn': NO_MATCH, 'hash': 0, 'moves': []}
+
+def missingMoves(layouts: dict[int, list[dict]], moves: list[Move], players: tuple[int, int], peer: dict) -> Optional[list[Move]]:
+	'''the moves the peer's RESUME has and ours don't
+	players - (the first shooter, the other one), turns alternate
+	@return: [] if the peer has no more shots, None if its match is another one or too far ahead'''
+	try:
+		turn, peerHash, peerMoves = peer['turn'], peer['hash'], peer['moves']
+		if turn < 0: return None
+		if turn <= len(moves):
+			return [] if stateHash(layouts, moves[:turn]) == peerHash else None
+		missing = turn - len(moves)
+		if missing > len(peerMoves): return None
+		added = [[players[(len(moves) + i) % 2], x, y] for i, (x, y) in enumerate(peerMoves[-missing:])]
+		return added if stateHash(layouts, moves + added) == peerHash else None
+	except (KeyError, TypeError, ValueError, FleetError):
+		return None
@@ -1,4 +1,4 @@
-from pygame import Rect
+from pygame import Rect, USEREVENT
 
 GRID_HEIGHT = 10
 GRID_WIDTH = 10
@@ -45,3 +45,5 @@ SCREEN_HEIGHT = GRID_Y_OFFSET + GRID_Y_SPACING * GRID_HEIGHT + 8 + SCREEN_PADDIN
 
 FPS = 60  # Reduced from 100 - 60 FPS is sufficient for smooth gameplay and reduces CPU usage
 ANIMATION_TIMING = 400
+NETWORK_EVENT = USEREVENT + 1  # posted by the session when a response or message arrives
+IDLE_WAIT = 500  # ms the main loop sleeps at most while nothing animates, waking up earlier on any event
@@ -0,0 +1,147 @@
+'''
+Finding an opponent among the contacts of the mesh.
+
+Every known contact is sent a PAIR probe, a few at a time, and the first
+node to accept becomes the opponent. Discovery on the other end treats our
+probe the same way, so two players looking for a game at once pair with
+whichever of them is heard first.
+
+A node which cancels our probe (it matched someone else) or doesn't answer
+it (e.g. a player in a match, whose discovery has stopped) is probed again
+the next round, but every further miss doubles the time between its probes,
+up to MAX_REST. So players busy in their matches don't cost the airtime of
+a probe every round.
+
+PAIR messages of the handshake:
+	probe   {'name', 'id'}                                    looking for a game
+	accept  {'name', 'id', 'paired': True, 'opponent': {'id', 'name'}}
+	cancel  {'name', 'id', 'paired': False}                   matched someone else
+'''
+import time
+import logging
+import threading
+from collections import deque
+from typing import Optional, Deque
+
+from Shared.Enums import COM
+from .Session import Session
+
+class OpponentDiscovery:
+	'''probes contacts in the background until one of them accepts, `match` holds the result
+
+	Probes, answers and cancels are sent on Thread-Discovery; the PAIR messages
+	arrive on Thread-Recv through the session's unsolicited handler.'''
+	MAX_IN_FLIGHT = 3  # probes awaiting an answer at once, bounds the airtime of a large contact list
+	PROBE_TIMEOUT = 10.  # s, a few hops and the ARQ retries of the answer
+	ROUND_PAUSE = 5.  # s between rounds over all contacts when nobody answered
+	MAX_REST = 300.  # s, the longest a node which keeps missing our probes is left out
+
+	def __init__(self, session: Session, playerName: str):
+		self.session = session
+		self.playerName = playerName
+		self.match: Optional[tuple[str, dict]] = None  # (node name, opponent {'id', 'name'})
+		self._lock = threading.Lock()
+		self._wake = threading.Event()
+		self._stop = threading.Event()
+		self._outbox: Deque[tuple[str, dict, Optional[int]]] = deque()  # (node, payload, seq answered) answers to send
+		self._cancelled: Deque[str] = deque()  # nodes which cancelled, Thread-Discovery rests them
+		self._misses: dict[str, int] = {}  # node -> probes it cancelled or didn't answer
+		self._restedUntil: dict[str, float] = {}  # node -> when it may be probed again
+		self._thread: Optional[threading.Thread] = None
+		self.probesSent = 0
+		self.timeouts = 0
+		self.lost = 0  # matches cancelled by the other side
+
+	# api ---------------------------------------
+	def start(self):
+		self._stop.clear()
+		self.session.unsolicitedHandlers[COM.PAIR] = self.onPair
+		self._ensureRunning()
+	def stop(self):
+		'''stops probing and answering PAIR messages'''
+		self._stop.set()
+		self._wake.set()
+		if self.session.unsolicitedHandlers.get(COM.PAIR) == self.onPair:
+			del self.session.unsolicitedHandlers[COM.PAIR]
+
+	def onPair(self, id_val: int, payload: dict, seq: Optional[int] = None):
+		'''session unsolicited handler, decides on every PAIR message heard while discovering'''
+		node = payload.get('node')
+		if not node: return
+		with self._lock:
+			matchedNode = self.match[0] if self.match else None
+			if payload.get('paired') is False:
+				if node == matchedNode:
+					logging.info(f'{node} cancelled the pairing, looking further')
+					self.match = None
+					self.lost += 1
+				self._cancelled.append(node)
+			elif matchedNode is None or matchedNode == node:
+				if matchedNode is None:
+					self.match = (node, {'id': payload.get('id', id_val), 'name': payload.get('name', node)})
+					logging.info(f'Matched with {node}')
+				if 'paired' not in payload:  # a probe, accept it
+					self._outbox.append((node, {**self._ownInfo(), 'paired': True, 'opponent': {'id': self.session.id, 'name': self.playerName}}, seq))
+			else:
+				self._outbox.append((node, {**self._ownInfo(), 'paired': False}, seq))
+		self._ensureRunning()
+		self._wake.set()
+
+	# probing -----------------------------------
+	def _ownInfo(self) -> dict:
+		return {'name': self.playerName, 'id': self.session.id}
+	def _rest(self, node: str, now: float):
+		'''node missed a probe, the next round probes it again, after that it's left out of 1, 3, 7, ... rounds'''
+		misses = self._misses[node] = self._misses.get(node, 0) + 1
+		self._restedUntil[node] = now + min(self.ROUND_PAUSE * (2 ** (misses - 1) - 1), self.MAX_REST)
+	def _ensureRunning(self):
+		with self._lock:
+			if self._stop.is_set() or (self._thread is not None and self._thread.is_alive()): return
+			self._thread = threading.Thread(target=self._loop, name='Thread-Discovery', daemon=True)
+			self._thread.start()
+	def _loop(self):
+		pending: Deque[str] = deque()
+		inFlight: dict[str, float] = {}  # node -> deadline of its probe
+		probed: set[str] = set()  # nodes probed, cancelled if another one wins
+		nextRound = 0.
+		while 1:
+			stopping = self._stop.is_set()  # a last pass sends the answers decided before, e.g. the accept of the match the game goes on with
+			self._wake.clear()  # before looking at the state, a PAIR arriving meanwhile wakes the next wait
+			now = time.monotonic()
+			toProbe, contacts = [], []
+			if self.match is None and not stopping and not pending and not inFlight and now >= nextRound:
+				ownName = self.session.transport.get_own_node_name()
+				contacts = [c for c in self.session.transport.get_contacts() if c != ownName and self._restedUntil.get(c, 0.) <= now]
+				nextRound = now + self.ROUND_PAUSE
+			with self._lock:
+				outbox, self._outbox = self._outbox, deque()
+				cancelled, self._cancelled = self._cancelled, deque()
+				if self.match is not None:
+					matchedNode = self.match[0]
+					outbox.extend((node, {**self._ownInfo(), 'paired': False}, None) for node in probed if node != matchedNode)
+					probed.clear()
+					pending.clear()
+					inFlight.clear()
+				elif not stopping:
+					for node in cancelled:
+						if inFlight.pop(node, None) is not None: self._rest(node, now)  # frees the slot for the next one
+					for node, deadline in list(inFlight.items()):
+						if deadline <= now:
+							del inFlight[node]
+							self.timeouts += 1
+							self._rest(node, now)
+					pending.extend(contacts)
+					while pending and len(inFlight) < self.MAX_IN_FLIGHT:
+						node = pending.popleft()
+						inFlight[node] = now + self.PROBE_TIMEOUT
+						toProbe.append(node)
+			for node, payload, re in outbox:
+				self.session.sendTo(node, COM.PAIR, payload, re)
+			for node in toProbe:
+				probed.add(node)
+				self.probesSent += 1
+				self.session.sendTo(node, COM.PAIR, self._ownInfo())
+			if stopping: return
+			if self.match is not None: wait = None  # matched, only onPair or stop has something for us
+			else: wait = max(min(inFlight.values(), default=nextRound) - time.monotonic(), 0.05)  # the next probe deadline or round
+			self._wake.wait(wait)
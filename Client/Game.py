@@ -1,19 +1,38 @@
-import logging, sys, string
+import logging, sys, string, json, time
 from pygame import Rect, mouse
 import pygame
 from typing import TypeVar, Optional
 import random
+from collections import deque
 
 from . import Constants
 from . import Frontend
+from . import Checkpoint
 from .Session import Session
+from .AsyncSession import AsyncSession
+from .Discovery import OpponentDiscovery
+from .Subscriptions import StateSubscription
+from .RadioJobs import BleScanner, RadioConnector, autoCandidates, candidateLabel
 from Shared.Enums import SHOTS, STAGES, COM
-from Shared import MeshCorePrimitives
+from Shared import Journal
+from Shared.FleetCodec import Fleet, FleetError
 
 class Game:
-	def __init__(self):
-		self.session = Session()
+	def __init__(self, session: Optional[Session] = None):
+		self.session = session or (AsyncSession() if '--async-session' in sys.argv else Session())
+		self.rng = random.Random()  # who shoots first, replays substitute the recorded choice
 		self.options = Options()
+		self.bleScanner = BleScanner()
+		self.bleScanVersion = -1  # scanner version last shown in the menu
+		self.radioConnector = RadioConnector()
+		self.radioConnectorVersion = 0
+		self.discovery: Optional[OpponentDiscovery] = None
+		self.subscription: Optional[StateSubscription] = None  # the opponent's state, while a match lasts
+		self.networkEventPosted = False  # a NETWORK_EVENT is on its way, don't queue another
+		self.session.onIncoming = self.wakeMainLoop
+		self.checkpoint = Checkpoint.MatchCheckpoint.fromArgs()
+		self.resumes: deque[tuple[int, Optional[str], dict, Optional[int]]] = deque()  # RESUMEs heard (id, node, payload, seq), appended on Thread-Recv
+		self.session.unsolicitedHandlers[COM.RESUME] = self.onResume
 		self.redrawNeeded = True
 		self.gameStage: STAGES = STAGES.MAIN_MENU
 		self.repeatableInit()
@@ -27,16 +46,48 @@ class Game:
 		
 		# P2P game state
 		self.opponent_game_state: dict = {'ready': False, 'ships': []}  # Opponent's game state
+		self.opponentFleet: Fleet = Fleet()  # opponent's ships, shots are resolved against it
 		self.player_on_turn: int = 0  # 0 = not started, otherwise player ID
 		self.last_shotted_pos = [-1, -1]  # Last position opponent shot at
 		self.game_active: bool = True
+		self.matchJournaled = False  # the end of the match was noted in the journal
+		self.moves: list[Checkpoint.Move] = []  # shots of the match in order, what resuming compares
+		self.firstTurn: int = 0  # player who shot first, 0 = not started
+		self.pendingShot: Optional[list[int]] = None  # own shot awaiting its answer
+		self.resumeStarted: Optional[float] = None  # when the restored match started resuming, None unless resuming
+		self.resumeSent = 0.  # when our last RESUME went out
+	def wakeMainLoop(self):
+		'''lets the main loop, possibly waiting for events, handle what the session received'''
+		if self.networkEventPosted: return
+		self.networkEventPosted = True
+		try:
+			pygame.event.post(pygame.event.Event(Constants.NETWORK_EVENT))
+		except pygame.error:
+			self.networkEventPosted = False  # display already gone
+	def isIdle(self) -> bool:
+		'''nothing animates or waits to be drawn, so the main loop can sleep until the next event'''
+		if self.redrawNeeded or self.transition or Frontend.Runtime.windowGrabbedPos: return False
+		if self.gameStage == STAGES.RADIO_CONNECTION:  # the background jobs are polled
+			return not self.bleScanner.running() and self.bleScanner.version == self.bleScanVersion \
+				and not self.radioConnector.running() and self.radioConnector.version == self.radioConnectorVersion
+		return True
 	def quit(self):
 		logging.info('Closing due to client quit')
+		if self.firstTurn: self.checkpoint.clear()  # left the match for good
 		if self.session.connected: self.session.disconnect()
 		self.newGameStage(STAGES.CLOSING)
 	def newGameStage(self, stage: STAGES):
 		assert STAGES.COUNT == 12  # Added RADIO_CONNECTION
 		assert stage != self.gameStage
+		if self.gameStage == STAGES.RADIO_CONNECTION:
+			self.bleScanner.cancel()
+			self.radioConnector.cancel()
+		if stage not in [STAGES.PAIRING, STAGES.PLACING] and self.discovery:
+			self.discovery.stop()  # paired for good, or gave up
+			self.discovery = None
+		if stage not in [STAGES.PLACING, STAGES.GAME_WAIT, STAGES.SHOOTING, STAGES.GAME_END, STAGES.END_GRID_SHOW] and self.subscription:
+			self.subscription.stop()
+			self.subscription = None
 		self.gameStage = stage
 		logging.debug(f'New game stage: {str(stage)}')
 		Frontend.Runtime.resetVars()
@@ -74,8 +125,8 @@ class Game:
 				self.options.serialPort = []
 			if not hasattr(self.options, 'connectionStatus'):
 				self.options.connectionStatus = 'Not connected'
-			# Scan for BLE devices
-			if self.options.radioConnectionType == 'BLE' and not self.options.bleDevices:
+			# Scan for BLE devices, unless a recent scan is cached
+			if self.options.radioConnectionType == 'BLE':
 				self._scanBLEDevices()
 	def changeGridShown(self, my:bool=None, *, transition=False):
 		if my is None: my = not self.options.myGridShown
@@ -95,7 +146,7 @@ class Game:
 		self.session.id = (name_hash % (2**20 - 1000)) + 1000  # Same ID range as before
 		self.session.connected = True
 		logging.info(f'Initialized as player {self.session.id} ({name})')
-		self.newGameStage(STAGES.PAIRING)
+		if not self._resumeMatch(): self.newGameStage(STAGES.PAIRING)
 	def pairCallback(self, res, rematched=False):
 		if ('paired' in res and res['paired']) or (rematched and 'rematched' in res and res['rematched']):
 			verb = 'Rematched' if rematched else 'Paired'
@@ -103,28 +154,33 @@ class Game:
 			self.options.opponentName = res['opponent']['name']
 			self.newGameStage(STAGES.PLACING)
 			self.options.hudMsg = f"{verb} with {res['opponent']['name']}"
+			if not rematched or not self.subscription: self._subscribeState(res['opponent']['id'])  # a rematch goes on with the versions of the match
 	def opponentReadyCallback(self, res):
 		self.options.opponentReady = res['opponent_ready']
 		self.redrawHUD()
 	def gameReadiness(self):
 		assert self.gameStage in [STAGES.PLACING, STAGES.GAME_WAIT]
-		if self.session.alreadySent[COM.GAME_READINESS]: return
 		wasPlacing = self.gameStage == STAGES.PLACING
 		if wasPlacing: self.newGameStage(STAGES.GAME_WAIT)
 		our_state = {'ships': self.grid.shipsDicts(), 'ready': wasPlacing, 'id': self.session.id}
-		lamda = lambda res: self.gameReadinessCallback(wasPlacing, res, our_state)
-		self.session.tryToSend(COM.GAME_READINESS, our_state, lamda, blocking=False, mustSend=True)
+		# the layout is announced, the opponent's arrives the same way (see _syncState)
+		self.session.notify(COM.GAME_READINESS, our_state)
+		self.gameReadinessCallback(wasPlacing, {'approved': True}, our_state)
 	def gameReadinessCallback(self, wasPlacing, res, our_state):
 		# For P2P: Update opponent state from response
 		if 'opponent_state' in res:
 			self.opponent_game_state = res['opponent_state']
 			self.options.opponentReady = self.opponent_game_state.get('ready', False)
+			try:
+				self.opponentFleet = Fleet.from_dicts(self.opponent_game_state.get('ships', []))
+			except FleetError as e:
+				logging.error(f'Invalid opponent layout: {e}')
 		
 		# Check if both ready to start shooting
 		our_ready = our_state.get('ready', False)
 		opponent_ready = self.opponent_game_state.get('ready', False)
-		if wasPlacing and opponent_ready and our_ready:
-			self._startShooting()
+		if wasPlacing and opponent_ready and our_ready and self.session.id > self.opponent_game_state.get('id', 0):
+			self._startShooting()  # the player with the higher id picks who starts, the other one hears it in GAME_WAIT
 		elif not wasPlacing and res.get('approved', False):
 			self.newGameStage(STAGES.PLACING)
 		else:
@@ -242,7 +298,7 @@ class Game:
 		if self.options.radioConnectionType == 'BLE':
 			refresh_rect = Rect(connect_rect.right + button_spacing, button_y, button_width, button_height)
 			if refresh_rect.collidepoint(mousePos):
-				self._scanBLEDevices()
+				self._scanBLEDevices(force=True)
 				return
 		
 		# Back button
@@ -261,55 +317,57 @@ class Game:
 			self.options.serialPortActive = False
 	
 	def _attemptRadioConnection(self):
-		'''Attempt to connect to radio based on selected options'''
-		self.options.connectionStatus = 'Connecting...'
-		self.redrawNeeded = True
-		
-		success = False
+		'''Connect to the radio selected in the options in the background, or race the usual suspects if none is'''
+		self.bleScanner.cancel()  # the adapter is needed for connecting
+		connectionArgs = None
 		if self.options.radioConnectionType == 'BLE':
 			if self.options.selectedDeviceIndex >= 0 and self.options.selectedDeviceIndex < len(self.options.bleDevices):
 				device = self.options.bleDevices[self.options.selectedDeviceIndex]
 				address = device.get('address', '')
 				if address:
-					success = MeshCorePrimitives.connect_ble_device(address)
+					connectionArgs = ['--ble', address]
 		elif self.options.radioConnectionType == 'TCP':
-			hostname = ''.join(self.options.tcpHostname) or 'localhost'
+			hostname = ''.join(self.options.tcpHostname)
 			port_str = ''.join(self.options.tcpPort) or '5000'
-			try:
-				port = int(port_str)
-				success = MeshCorePrimitives.connect_tcp(hostname, port)
-			except ValueError:
+			if not port_str.isdigit() or not 0 < int(port_str) < 65536:
 				self.options.connectionStatus = 'Invalid port number'
+				self.redrawNeeded = True
 				return
+			if hostname:
+				connectionArgs = ['--tcp', hostname, str(int(port_str))]
 		elif self.options.radioConnectionType == 'Serial':
-			port = ''.join(self.options.serialPort) or '/dev/ttyUSB0'
-			success = MeshCorePrimitives.connect_serial(port)
+			port = ''.join(self.options.serialPort)
+			if port:
+				connectionArgs = ['--serial', port, '9600']
 		
-		if success:
-			self.options.connectionStatus = 'Connected!'
-			# Test connection
-			if MeshCorePrimitives.test_connection():
-				logging.info('Radio connection successful')
-				self.newGameStage(STAGES.CONNECTING)
-			else:
-				self.options.connectionStatus = 'Connection failed - device not responding'
-		else:
-			self.options.connectionStatus = 'Connection failed - check device and try again'
+		candidates = [(candidateLabel(connectionArgs), connectionArgs)] if connectionArgs else autoCandidates()
+		self.radioConnector.start(candidates)
+		self._pollRadioConnection()
+	def _pollRadioConnection(self):
+		'''shows the progress of the connection attempt, moves on once it succeeded'''
+		if self.radioConnector.version == self.radioConnectorVersion: return
+		self.radioConnectorVersion = self.radioConnector.version
+		self.options.connectionStatus = self.radioConnector.status
+		self.redrawNeeded = True
+		if self.radioConnector.state == RadioConnector.CONNECTED:
+			self.newGameStage(STAGES.CONNECTING)
 	
 	def _initiatePairing(self):
-		'''Initiate pairing by getting contacts and sending pairing request'''
-		contacts = MeshCorePrimitives.get_contacts()
-		if not contacts:
-			logging.warning('No contacts available for pairing')
-			return
-		
-		# For now, pair with first available contact
-		# TODO: Add UI for contact selection
-		if len(contacts) > 0:
-			opponent_name = contacts[0]
-			self.session.opponent_node_name = opponent_name
-			logging.info(f'Attempting to pair with {opponent_name}')
-			self.session.tryToSend(COM.PAIR, {'name': self.options.submittedPlayerName(), 'id': self.session.id}, self.pairCallback, blocking=True)
+		'''Look for an opponent among the contacts, the first one to accept is paired with'''
+		if self.discovery: self.discovery.stop()
+		self.discovery = OpponentDiscovery(self.session, self.options.submittedPlayerName())
+		self.discovery.start()
+	def _pollDiscovery(self):
+		'''pairs once discovery found a match, goes back to pairing if the match cancelled before the game started'''
+		match = self.discovery.match if self.discovery else None
+		if self.gameStage == STAGES.PAIRING and match:
+			nodeName, opponent = match
+			self.session.opponent_node_name = nodeName
+			self.pairCallback({'paired': True, 'opponent': opponent})
+		elif self.gameStage == STAGES.PLACING and not match and self.discovery:
+			logging.warning('Opponent cancelled the pairing')
+			self.session.opponent_node_name = None
+			self.newGameStage(STAGES.PAIRING)
 	
 	def _startShooting(self):
 		'''Start shooting phase - determine who goes first'''
@@ -317,9 +375,10 @@ class Game:
 		self.gameStage = STAGES.SHOOTING
 		# Randomly determine who goes first
 		players = [self.session.id, self.opponent_game_state.get('id', 0)]
-		self.player_on_turn = random.choice(players)
+		self.player_on_turn = self.rng.choice(players)
 		self.grid.initShipSizes()
 		self.changeGridShown(self.player_on_turn != self.session.id, transition=self.player_on_turn == self.session.id)
+		self._matchStarted()
 	def gameWaitCallback(self, res):
 		if res.get('started', False):
 			self.grid.initShipSizes()
@@ -327,6 +386,7 @@ class Game:
 			self.player_on_turn = res.get('on_turn', self.session.id)
 			self.changeGridShown(res['on_turn'] != self.session.id, transition=res['on_turn'] == self.session.id)
 			logging.info('Shooting started')
+			self._matchStarted()
 	def shootReq(self, gridPos):
 		assert self.gameStage == STAGES.SHOOTING
 		# Validate it's our turn
@@ -340,29 +400,15 @@ class Game:
 		# Send shot to opponent
 		callback = lambda res: self.shootCallback(gridPos, res, hitted, sunkenShip, gameWon)
 		self.session.tryToSend(COM.SHOOT, {'pos': gridPos}, callback, blocking=False, mustSend=True)
+		self.pendingShot = gridPos
 	
 	def _validateShoot(self, pos) -> tuple[bool, Optional['Ship'], bool]:
 		'''Validate shot against opponent's grid state. Returns (hitted, sunkenShip, gameWon)'''
-		# Check opponent's ships
-		for ship_dict in self.opponent_game_state.get('ships', []):
-			x, y = ship_dict['pos']
-			horizontal = ship_dict['horizontal']
-			size = ship_dict['size']
-			
-			if (x <= pos[0] <= x + (size - 1) * horizontal) and (y <= pos[1] <= y + (size - 1) * (not horizontal)):
-				hittedSpot = (pos[0] - x) if horizontal else (pos[1] - y)
-				# Mark as hit
-				if 'hitted' not in ship_dict:
-					ship_dict['hitted'] = [False] * size
-				ship_dict['hitted'][hittedSpot] = True
-				
-				sunkenShip = ship_dict if all(ship_dict['hitted']) else None
-				gameWon = all([all(s.get('hitted', [False]) for s in self.opponent_game_state.get('ships', []))])
-				return True, Ship.fromDict(sunkenShip) if sunkenShip else None, gameWon
-		
-		return False, None, False
+		hitted, sunkenShip, gameWon = self.opponentFleet.shoot(pos)
+		return hitted, Ship.fromDict(sunkenShip) if sunkenShip else None, gameWon
 	
 	def shootCallback(self, gridPos, res, hitted, sunkenShip, gameWon):
+		self.pendingShot = None
 		# Update opponent grid with shot result
 		self.opponentGrid.gotShotted(gridPos, hitted, sunkenShip)
 		
@@ -376,20 +422,35 @@ class Game:
 			self.options.gameEndMsg = 'You won!   :)'
 			if 'opponent_grid' in res:
 				self.opponentGrid.updateAfterGameEnd(res['opponent_grid'])
+		self._recordMove(self.session.id, gridPos)
 	def gettingShotCallback(self, res):
 		if not res.get('shotted', False): return
 		
 		pos = res['pos']
+		opponentId = self.opponent_game_state.get('id', 0)
+		if self.moves and self.moves[-1] == [opponentId, *pos]:
+			# shot again after a resume, its answer got lost
+			self._answerShot(*self.grid.localGridShotted(pos, update=False), res.get('seq'))
+			return
 		self.last_shotted_pos = pos
 		
 		# Process shot on our grid
 		hitted, sunkenShip = self.grid.localGridShotted(pos, update=True)
 		self.grid.gotShotted(pos, hitted, sunkenShip)
+		lost = self._answerShot(hitted, sunkenShip, res.get('seq'))
 		
-		# Check if we lost
+		self.changeGridShown(transition=not lost)
+		if lost:
+			logging.info('Game lost')
+			self.newGameStage(STAGES.GAME_END)
+			self.options.gameWon = False
+			self.options.gameEndMsg = 'You lost!   :('
+			# Switch turn back (game over)
+			self.player_on_turn = 0
+		self._recordMove(opponentId, pos)
+	def _answerShot(self, hitted, sunkenShip, re: Optional[int]) -> bool:
+		'''tells the opponent what its shot did, the answer names the shot's seq in 're', @return: if we lost'''
 		lost = all([all(ship.hitted) for ship in self.grid.ships])
-		
-		# Send response to opponent
 		response_payload = {
 			'hitted': hitted,
 			'sunken_ship': sunkenShip.asDict() if sunkenShip else None,
@@ -399,17 +460,9 @@ class Game:
 			response_payload['opponent_grid'] = {'ships': self.grid.shipsDicts()}
 			response_payload['game_end_msg'] = 'You lost!   :('
 		
-		# Send response (this is handled by the session when it receives SHOOT command)
-		# For now, we'll handle it in the message processing
-		
-		self.changeGridShown(transition=not lost)
-		if lost:
-			logging.info('Game lost')
-			self.newGameStage(STAGES.GAME_END)
-			self.options.gameWon = False
-			self.options.gameEndMsg = 'You lost!   :('
-			# Switch turn back (game over)
-			self.player_on_turn = 0
+		response_payload['stay_connected'] = True
+		self.session.notify(COM.SHOOT, response_payload, re=re)
+		return lost
 
 	def sendUpdateRematch(self, rematchDesired):
 		if self.session.alreadySent[COM.UPDATE_REMATCH]: return
@@ -442,8 +495,18 @@ class Game:
 		self.session.checkThreads()
 		self.handleResponses()
 		self.spawnReqs()
+		self._journalMatchEnd()
+	def matchSnapshot(self) -> dict:
+		'''ships (in placing independent order) and shots of both grids, what a replay of the match has to end with'''
+		return {name: {'ships': sorted((ship.asDict() for ship in grid.ships), key=lambda ship: (ship['size'], ship['pos'])), 'shots': [[int(shot) for shot in row] for row in grid.shots]}
+			for name, grid in [('grid', self.grid), ('opponentGrid', self.opponentGrid)]}
+	def _journalMatchEnd(self):
+		journal = self.session.transport.journal
+		if journal and not self.matchJournaled and self.gameStage in [STAGES.GAME_END, STAGES.END_GRID_SHOW]:
+			self.matchJournaled = True
+			journal.record(Journal.NOTE, self.session.opponent_node_name or '', json.dumps(self.matchSnapshot()))
 	def handleResponses(self):
-		assert len(COM) == 11  # CONNECTION_CHECK removed for P2P
+		assert len(COM) == 14  # CONNECTION_CHECK removed for P2P, STATE, RESUME and HEARTBEAT added
 		gameEndMsg, opponentState = self.session.loadResponses()
 		if self.gameStage in [STAGES.MAIN_MENU, STAGES.GAME_END]:
 			if '--autoplay-repeat' in sys.argv and self.session.fullyDisconnected():
@@ -457,41 +520,218 @@ class Game:
 			self.options.gameEndMsg = gameEndMsg
 			if opponentState is not None and 'ships' in opponentState: self.opponentGrid.updateAfterGameEnd(opponentState)
 			self.newGameStage(STAGES.GAME_END)
-	def _scanBLEDevices(self):
-		'''Scan for BLE devices'''
-		self.options.connectionStatus = 'Scanning for devices...'
+			if not self.session.opponentTimedOut: self.checkpoint.clear()  # a lost link may come back, the match is resumed then
+	def _scanBLEDevices(self, force=False):
+		'''Scan for BLE devices in the background, `force` rescans even if cached results are fresh'''
+		self.bleScanner.start(force)
+		self.redrawNeeded = True
+	def _pollBLEScan(self):
+		'''shows devices as the scanner finds them'''
+		if self.bleScanner.version == self.bleScanVersion: return
+		self.bleScanVersion = self.bleScanner.version
+		devices = self.bleScanner.devices()
+		# keep the selection on the same device while the list grows
+		index = self.options.selectedDeviceIndex
+		if 0 <= index < len(self.options.bleDevices):
+			address = self.options.bleDevices[index].get('address')
+			self.options.selectedDeviceIndex = next((i for i, d in enumerate(devices) if d.get('address') == address), -1)
+		self.options.bleDevices = devices
+		if self.bleScanner.running():
+			self.options.connectionStatus = f'Scanning for devices... {len(devices)} so far'
+		elif self.options.connectionStatus.startswith('Scanning') or self.options.connectionStatus == 'Not connected':
+			if devices: self.options.connectionStatus = f'Found {len(devices)} device(s)'
+			else: self.options.connectionStatus = 'No devices found. Click Refresh to scan again.'
 		self.redrawNeeded = True
-		# Scan will happen in next frame to avoid blocking
 	
 	def spawnReqs(self):
 		assert STAGES.COUNT == 12  # Added RADIO_CONNECTION
 		if self.gameStage == STAGES.RADIO_CONNECTION:
 			# Handle radio connection GUI interactions
-			if self.options.connectionStatus == 'Scanning for devices...':
-				self.options.bleDevices = MeshCorePrimitives.scan_ble_devices(timeout=2)
-				if self.options.bleDevices:
-					self.options.connectionStatus = f'Found {len(self.options.bleDevices)} device(s)'
-				else:
-					self.options.connectionStatus = 'No devices found. Click Refresh to scan again.'
-				self.redrawNeeded = True
+			self._pollBLEScan()
+			self._pollRadioConnection()
 		elif self.gameStage == STAGES.CONNECTING:
 			# CONNECT is now local - just initialize
 			if not self.session.connected:
 				self.connectCallback({})  # Empty response since it's local
 		elif self.gameStage == STAGES.PAIRING:
-			# For P2P: Get contacts and allow pairing
-			if not hasattr(self, '_pairing_initiated'):
-				self._pairing_initiated = True
+			# For P2P: discover an opponent among the contacts
+			if self.discovery is None:
 				self._initiatePairing()
+			self._pollDiscovery()
 		elif self.gameStage == STAGES.PLACING:
-			self.session.tryToSend(COM.OPPONENT_READY, {'expected': self.options.opponentReady}, self.opponentReadyCallback, blocking=True)
-		elif self.gameStage == STAGES.GAME_WAIT:
-			self.session.tryToSend(COM.GAME_WAIT, {}, self.gameWaitCallback, blocking=True)
-		elif self.gameStage == STAGES.SHOOTING and self.options.myGridShown:
-			self.session.tryToSend(COM.OPPONENT_SHOT, {}, self.gettingShotCallback, blocking=True)
+			self._pollDiscovery()
+			if self.gameStage == STAGES.PLACING: self._syncState()
+		elif self.gameStage in [STAGES.GAME_WAIT, STAGES.SHOOTING]:
+			self._syncState()
 		elif self.gameStage in [STAGES.GAME_END, STAGES.END_GRID_SHOW] and self.session.connected and self.options.rematchPossible:
-			self.session.tryToSend(COM.AWAIT_REMATCH, {'expected_opponent_rematch': self.options.opponentRematching}, self.awaitRematchCallback, blocking=True)
+			self._syncState()
+		self._handleResumes()
 		self.session.spawnConnectionCheck()
+	def _subscribeState(self, opponentId: int):
+		'''replaces the OPPONENT_READY, GAME_WAIT and AWAIT_REMATCH polls of a match, the opponent announces changes itself'''
+		if self.subscription: self.subscription.stop()
+		self.subscription = StateSubscription(self.session, opponentId)
+		self.subscription.start()
+	def _syncState(self):
+		'''publishes own state, hands the opponent's changes and shots to the callbacks the polls had'''
+		if not self.subscription: return
+		self.subscription.publish(ready=self.gameStage != STAGES.PLACING, on_turn=self.player_on_turn, rematch_desired=self.options.awaitingRematch)
+		self.subscription.tick()
+		for id_val, command, payload in self.session.unsolicited():
+			seq = payload.pop('seq', None)  # replies name it in 're'
+			if command == COM.GAME_READINESS and self.gameStage in [STAGES.PLACING, STAGES.GAME_WAIT]:
+				weReady = self.gameStage == STAGES.GAME_WAIT
+				self.gameReadinessCallback(weReady, {'opponent_state': payload}, {'ready': weReady})
+			elif command == COM.SHOOT and 'pos' in payload:  # the opponent's shot, answers to ours name it in 're' and never get here
+				if self.gameStage == STAGES.GAME_WAIT and self.options.opponentReady:  # the shot overtook the state saying the opponent starts
+					self.gameWaitCallback({'started': True, 'on_turn': self.opponent_game_state.get('id', id_val)})
+				if self.gameStage == STAGES.SHOOTING:
+					self.gettingShotCallback({'shotted': True, 'pos': payload['pos'], 'seq': seq})
+			elif command == COM.UPDATE_REMATCH:
+				self.session.notify(COM.UPDATE_REMATCH, {'approved': True}, re=seq)  # the wish itself arrives with the opponent's state
+		if self.gameStage in [STAGES.GAME_END, STAGES.END_GRID_SHOW] and self.options.awaitingRematch and self.subscription.peer['rematch_desired']:
+			self.execRematch({'rematched': True, 'opponent': {'id': self.opponent_game_state.get('id', 0), 'name': self.options.opponentName}})
+			return
+		if not (peer := self.subscription.changes()): return
+		if self.gameStage == STAGES.PLACING:
+			self.opponentReadyCallback({'opponent_ready': peer['ready']})
+		elif self.gameStage == STAGES.GAME_WAIT:
+			self.options.opponentReady = peer['ready']
+			if peer['on_turn']: self.gameWaitCallback({'started': True, 'on_turn': peer['on_turn']})
+		elif self.gameStage == STAGES.SHOOTING:
+			# the opponent shot, passing the turn; a state older than our last shot says so too, but it's stale
+			if peer['on_turn'] == self.session.id and self.moves and self.moves[-1][0] != self.session.id: self.player_on_turn = self.session.id
+		elif peer['rematch_desired'] != self.options.opponentRematching:
+			self.awaitRematchCallback({'changed': True, 'opponent_rematching': peer['rematch_desired']})
+
+	# checkpoint and resume -------------------------------------------------
+	def _matchStarted(self):
+		self.firstTurn = self.player_on_turn
+		self.moves = []
+		self._saveCheckpoint()
+	def _recordMove(self, shooter: int, pos: list[int]):
+		'''a shot was resolved on our side, a turn boundary'''
+		self.moves.append([shooter, *pos])
+		if self.gameStage == STAGES.SHOOTING: self._saveCheckpoint()
+		else: self.checkpoint.clear()  # the match is over
+	def _players(self) -> tuple[int, int]:
+		'''(the first shooter, the other player)'''
+		opponentId = self.opponent_game_state.get('id', 0)
+		return (self.firstTurn, opponentId if self.firstTurn == self.session.id else self.session.id)
+	def _layouts(self) -> dict[int, list[dict]]:
+		return {self.session.id: self.grid.shipsDicts(), self.opponent_game_state.get('id', 0): self.opponent_game_state.get('ships', [])}
+	def _saveCheckpoint(self):
+		players = self._players()
+		self.checkpoint.save({
+			'id': self.session.id, 'peer': self.session.opponent_node_name, 'opponent_name': self.options.opponentName,
+			'opponent_game_state': self.opponent_game_state, 'first_turn': self.firstTurn,
+			'player_on_turn': players[len(self.moves) % 2], 'moves': self.moves, **self.matchSnapshot(),
+		})
+	def _resumeMatch(self) -> bool:
+		'''restores the checkpointed match of this player, it goes on once the opponent answered our RESUME
+		@return: if there was one to restore'''
+		state = self.checkpoint.load()
+		if not state or state.get('id') != self.session.id: return False
+		try:
+			opponentFleet = Fleet.from_dicts(state['opponent_game_state']['ships'])
+			moves = [[int(shooter), int(x), int(y)] for shooter, x, y in state['moves']]
+			for shooter, x, y in moves:
+				if shooter == self.session.id: opponentFleet.shoot([x, y])
+			grids = []
+			for saved, isLocal in [(state['grid'], True), (state['opponentGrid'], False)]:
+				grid = Grid(isLocal)
+				grid.ships = [Ship.fromDict(ship) for ship in saved['ships']]
+				grid.shots = [[SHOTS(shot) for shot in row] for row in saved['shots']]
+				for ship in grid.ships:
+					if all(ship.hitted): grid.shipSizes[ship.size] -= 1
+				grids.append(grid)
+			peer, opponentName, onTurn, firstTurn = str(state['peer']), str(state['opponent_name']), int(state['player_on_turn']), int(state['first_turn'])
+		except (KeyError, TypeError, ValueError, FleetError) as e:
+			logging.warning(f'Discarding the match checkpoint: {e}')
+			self.checkpoint.clear()
+			return False
+		self.grid, self.opponentGrid = grids
+		self.opponent_game_state, self.opponentFleet = state['opponent_game_state'], opponentFleet
+		self.moves, self.firstTurn, self.player_on_turn = moves, firstTurn, onTurn
+		self.pendingShot = None
+		self.options.opponentName = opponentName
+		self.options.opponentReady = True
+		self.options.firstGameWait = False
+		self.session.opponent_node_name = peer
+		self.newGameStage(STAGES.SHOOTING)
+		self.changeGridShown(self.player_on_turn != self.session.id)
+		self.resumeStarted, self.resumeSent = time.monotonic(), 0.
+		self.options.hudMsg = f'Resuming the match with {opponentName}'
+		logging.info(f'Resuming the match with {peer} after {len(moves)} shots')
+		return True
+	def onResume(self, id_val: int, payload: dict, seq: Optional[int] = None):
+		'''session unsolicited handler, RESUMEs are answered on the main thread'''
+		self.resumes.append((id_val, payload.pop('node', None), payload, seq))
+	def _handleResumes(self):
+		'''answers the RESUMEs heard, repeats ours until the opponent answered
+		answers ('re') are never answered, so two sides can't keep answering each other'''
+		while self.resumes:
+			id_val, node, peer, seq = self.resumes.popleft()
+			isAnswer = peer.pop('re', None) is not None
+			if not node or not self.session.id: continue
+			ours = self.firstTurn and id_val == self.opponent_game_state.get('id', 0)
+			if ours and not isAnswer and self.session.opponentTimedOut and self.gameStage in [STAGES.GAME_END, STAGES.END_GRID_SHOW]:
+				ours = self._rejoinMatch()
+			agreed = ours and self._catchUp(peer)
+			if ours and self.resumeStarted is not None:
+				if agreed: self._resumed()
+				else: self._abandonMatch('the opponent plays another match' if peer.get('turn') == Checkpoint.NO_MATCH else 'the matches differ')
+			elif agreed and not isAnswer: self._opponentResumed(node)
+			elif ours and not agreed: logging.warning(f'{node} resumes a match which differs from ours')
+			if not isAnswer and self.session.id:
+				ours = ours and self.firstTurn and id_val == self.opponent_game_state.get('id', 0)
+				self.session.sendTo(node, COM.RESUME, Checkpoint.summary(self._layouts(), self.moves) if ours else Checkpoint.noMatch(), seq)
+		if self.resumeStarted is None: return
+		now = time.monotonic()
+		if now - self.resumeStarted > Checkpoint.RESUME_TIMEOUT:
+			self._abandonMatch('the opponent did not answer')
+		elif now - self.resumeSent >= Checkpoint.RESUME_RETRY:
+			self.resumeSent = now
+			self.session.sendTo(self.session.opponent_node_name, COM.RESUME, Checkpoint.summary(self._layouts(), self.moves))
+	def _catchUp(self, peer: dict) -> bool:
+		'''takes the shots the peer's RESUME has and we don't, @return: if it plays the same match'''
+		missing = Checkpoint.missingMoves(self._layouts(), self.moves, self._players(), peer)
+		if missing is None: return False
+		for shooter, x, y in missing:
+			if shooter != self.session.id:
+				self.gettingShotCallback({'shotted': True, 'pos': [x, y]})
+			elif self.pendingShot != [x, y]:  # ours answered before we crashed, a pending one is answered again
+				hitted, sunkenShip, gameWon = self._validateShoot([x, y])
+				self.opponentGrid.shots[y][x] = SHOTS.SHOTTED_UNKNOWN
+				self.shootCallback([x, y], {'opponent_grid': {'ships': self.opponent_game_state.get('ships', [])}}, hitted, sunkenShip, gameWon)
+		if missing and self.gameStage == STAGES.SHOOTING and missing[-1][0] != self.session.id: self.player_on_turn = self.session.id
+		return True
+	def _rejoinMatch(self) -> bool:
+		'''the opponent we gave up on when it stopped answering resumes the match, so do we
+		@return: if the match was still checkpointed'''
+		self.session.connected, self.session.opponentTimedOut = True, False
+		if not self._resumeMatch():
+			self.session.connected = False
+			return False
+		self.matchJournaled = False
+		return True
+	def _opponentResumed(self, node: str):
+		'''the opponent restarted and plays on, it gets the shot it may not have answered again'''
+		logging.info(f'{node} resumed the match')
+		if self.subscription: self.subscription.peerRestarted()
+		if self.pendingShot: self.session.resend()  # with its seq, a new SHOOT's answer wouldn't name our pending one
+		self.options.hudMsg = 'Opponent is back'
+		self.redrawHUD()
+	def _resumed(self):
+		logging.info(f'Match resumed after {len(self.moves)} shots')
+		self.resumeStarted = None
+		if self.gameStage in [STAGES.SHOOTING, STAGES.GAME_END, STAGES.END_GRID_SHOW]: self._subscribeState(self.opponent_game_state.get('id', 0))
+		if self.gameStage == STAGES.SHOOTING: self.options.hudMsg = 'Match resumed'
+		self.redrawHUD()
+	def _abandonMatch(self, reason: str):
+		logging.warning(f'Could not resume the match, {reason}')
+		self.checkpoint.clear()
+		self.newGameStage(STAGES.CONNECTING)  # pairs anew
 
 	# controls and API -------------------------------------------------
 	def rotateShip(self):
@@ -550,6 +790,7 @@ class Game:
 				self._attemptRadioConnection()
 			else:
 				stageChanges = {STAGES.MAIN_MENU: STAGES.MULTIPLAYER_MENU, STAGES.MULTIPLAYER_MENU: STAGES.RADIO_CONNECTION, STAGES.GAME_END: STAGES.MAIN_MENU, STAGES.END_GRID_SHOW: STAGES.GAME_END}
+				if not self.session.transport.needs_radio: stageChanges[STAGES.MULTIPLAYER_MENU] = STAGES.CONNECTING
 				if self.options.inputActive: self.options.inputActive = False
 				else: self.newGameStage(stageChanges[self.gameStage])
 		elif event.key in [pygame.K_LEFT, pygame.K_RIGHT]:
@@ -624,7 +865,7 @@ class Game:
 			self.redrawNeeded |= pygame.display.get_active()
 			Ship.advanceAnimations()
 	def shoot(self, mousePos):
-		if self.gameStage == STAGES.SHOOTING and not self.options.myGridShown and not self.transition:
+		if self.gameStage == STAGES.SHOOTING and not self.options.myGridShown and not self.transition and self.resumeStarted is None:
 			gridPos = self.opponentGrid.shoot(mousePos)
 			if gridPos:
 				self.shootReq(gridPos)
@@ -1020,8 +1261,11 @@ class Grid:
 	def initShipSizes(self):
 		self.shipSizes: dict[int, int] = {1: 2, 2: 4, 3: 2, 4: 1} # shipSize : shipCount
 
+	def fleet(self) -> Fleet:
+		return Fleet.from_dicts([ship.asDict() for ship in self.ships])
 	def shipsDicts(self):
-		return [ship.asDict() for ship in self.ships]
+		'''ships in canonical order, which is sent as a bitboard'''
+		return self.fleet().to_dicts()
 	def allShipsPlaced(self):
 			return not any(self.shipSizes.values())
 
@@ -1144,9 +1388,14 @@ class Grid:
 					self.shots[y][x] = SHOTS.HITTED_SUNKEN
 	def updateAfterGameEnd(self, dicts):
 		assert not self.isLocal
-		for ship in dicts['ships']:
-			ship = Ship.fromDict(ship)
-			if self.canPlaceShip(ship): self.ships.append(ship)
+		try:
+			fleet = Fleet.from_dicts(dicts['ships'])
+		except FleetError as e:
+			logging.error(f'Invalid opponent grid: {e}')
+			fleet = Fleet()
+		known = self.fleet().occupied  # the sunken ships are already shown
+		for i, ship in enumerate(fleet.ships):
+			if not fleet.mask(i) & known: self.ships.append(Ship.fromDict(ship))
 		for y, row in enumerate(self.shots):
 			for x, shot in enumerate(row):
 				if shot == SHOTS.HITTED: self.shots[y][x] = SHOTS.HITTED_SUNKEN
@@ -0,0 +1,104 @@
+'''
+Telling a quiet opponent from a gone one.
+
+Anything heard from the opponent shows it is there, so while a match has
+traffic (shots and their answers, state notifications and their
+heartbeats) nothing is sent for liveness alone. The opponent is probed
+with a HEARTBEAT once it has been silent for IDLE, or once a request sent
+since it was last heard waits longer than the retransmission timeout for
+its response. The session answers a probe on its receiving thread, so the
+answer doesn't wait for the opponent's game loop. Unanswered probes are
+repeated with the timeout doubling, after PROBES of them the opponent is
+gone and the session ends the game.
+
+An answered probe only shows the opponent's node is there, not that our
+request or its response got through. The session sends an unanswered
+request again with the same doubling timeout and gives up on the opponent,
+just like on a gone one, once the request is still unanswered after
+`Session.RETRIES` retransmissions.
+
+The timeout is that of `Shared.Reliability.RttEstimator`, fed with the
+round trips of the probes: every probe has its own sequence number, so
+each answer is an unambiguous sample. The first probe goes out as soon
+as the opponent is known, so a quick link gives up within seconds of
+going quiet and a multi-hop mesh path gets the patience it needs.
+
+HEARTBEAT payload: {}, an answer names the probe in 're'
+'''
+import time
+import threading
+import typing
+from typing import Optional
+
+from Shared.Reliability import RttEstimator
+
+if typing.TYPE_CHECKING:
+	from .Session import Request
+
+PROBE, GONE = 'probe', 'gone'
+
+class Liveness:
+	'''the opponent's liveness as one session sees it, heard on Thread-Recv, checked from the main thread'''
+	IDLE = 45.  # s, longer than the StateSubscription heartbeat, so a running match needs no probes
+	PROBES = 4  # unanswered in a row, then the opponent is gone
+
+	def __init__(self):
+		self.rtt = RttEstimator()
+		self.lastHeard: Optional[float] = None  # None while not watching
+		self.unanswered = 0  # probes sent since the opponent was last heard
+		self.gone = False
+		self._lastProbe: Optional['Request'] = None
+		self._outstanding: list['Request'] = []  # probes whose answer may still come, the last PROBES
+		self._lock = threading.Lock()
+		self.probesSent = 0
+		self.samples = 0
+
+	# api ---------------------------------------
+	def heard(self):
+		'''anything arrived from the opponent'''
+		with self._lock:
+			if self.lastHeard is None: return
+			self.lastHeard = time.monotonic()
+			self.unanswered = 0
+	def answered(self, re: int):
+		'''a HEARTBEAT answering our probe re arrived'''
+		now = time.monotonic()
+		with self._lock:
+			for probe in self._outstanding:
+				if probe.seq == re and probe.sentAt:
+					self._outstanding.remove(probe)
+					self.rtt.sample(now - probe.sentAt)
+					self.samples += 1
+					return
+	def check(self, waitingSince: Optional[float]) -> Optional[str]:
+		'''starts watching on the first call
+		waitingSince - when the latest request still awaiting its response was sent, None if there is none
+		@return: PROBE if a probe is due, GONE once the opponent stopped answering, None otherwise'''
+		now = time.monotonic()
+		with self._lock:
+			if self.gone: return None
+			if self.lastHeard is None: self.lastHeard = now
+			if self.unanswered:
+				if not self._lastProbe.sentAt or now - self._lastProbe.sentAt < self.backoff(self.unanswered): return None  # still queued, e.g. for airtime, or answer not due
+				if self.unanswered < self.PROBES: return PROBE
+				self.gone = True
+				return GONE
+			overdue = waitingSince is not None and waitingSince > self.lastHeard and now - waitingSince >= self.rtt.rto
+			firstSample = self.rtt.srtt is None and not self.probesSent
+			return PROBE if firstSample or overdue or now - self.lastHeard >= self.IDLE else None
+	def probing(self, probe: 'Request'):
+		'''probe was handed to the session for sending'''
+		with self._lock:
+			self._lastProbe = probe
+			self._outstanding = self._outstanding[1 - self.PROBES:] + [probe]
+			self.unanswered += 1
+			self.probesSent += 1
+	def stop(self):
+		'''stops watching, the round trip estimate is kept'''
+		with self._lock:
+			self.lastHeard = None
+			self.unanswered = 0
+			self.gone = False
+	def backoff(self, attempt: int) -> float:
+		'''how long the answer to the attempt-th probe or retransmission in a row is waited for'''
+		return min(self.rtt.MAX_RTO, self.rtt.rto * 2 ** (attempt - 1))
@@ -0,0 +1,201 @@
+'''
+Radio menu work running off the main thread.
+
+The pygame loop must keep drawing and reading input while slow radio
+operations run, so they are background jobs whose state the menu polls
+once per frame.
+'''
+import os
+import glob
+import json
+import time
+import asyncio
+import logging
+import threading
+import subprocess
+from typing import Optional
+
+from Shared import MeshCorePrimitives
+
+MESHCORE_NAME_PREFIX = 'MeshCore'  # companion radios advertise as 'MeshCore-<node name>'
+LAST_RADIO_FILE = os.path.expanduser('~/.battleships_radio.json')  # connection args of the last working radio
+SERIAL_PORT_PATTERNS = ['/dev/ttyUSB*', '/dev/ttyACM*']
+DEFAULT_BAUDRATE = 9600
+
+class BleScanner:
+	'''scans for BLE radios in the background, devices show up in `devices()` as they are discovered
+
+	Devices seen within CACHE_TTL survive a rescan, so reopening the menu
+	shows them at once and Refresh only adds to the list.'''
+	SCAN_TIME = 5.
+	CACHE_TTL = 60.
+
+	def __init__(self):
+		self._seen: dict[str, tuple[dict, float]] = {}  # address -> (device, last seen)
+		self._lock = threading.Lock()
+		self._thread: Optional[threading.Thread] = None
+		self._cancel = threading.Event()
+		self._proc: Optional[subprocess.Popen] = None
+		self.version = 0  # bumped on every change, so the menu knows when to redraw
+		self.finished = 0.  # time of the last completed scan
+
+	# api ---------------------------------------
+	def start(self, force=False):
+		'''scans unless a recent scan is still fresh, `force` always scans (keeping fresh devices)'''
+		if self.running(): return
+		if not force and self.finished and time.monotonic() - self.finished < self.CACHE_TTL: return
+		self._cancel.clear()
+		self._thread = threading.Thread(target=self._scan, name='Thread-BleScan', daemon=True)
+		self._thread.start()
+		self._changed()
+	def cancel(self):
+		self._cancel.set()
+		proc = self._proc
+		if proc and proc.poll() is None: proc.kill()
+	def running(self) -> bool:
+		return self._thread is not None and self._thread.is_alive()
+	def devices(self) -> list[dict]:
+		'''devices seen within CACHE_TTL, in discovery order'''
+		now = time.monotonic()
+		with self._lock:
+			return [device for device, seen in self._seen.values() if now - seen < self.CACHE_TTL]
+
+	# scanning -----------------------------------
+	def _changed(self):
+		with self._lock:
+			self.version += 1
+	def _found(self, device: dict):
+		with self._lock:
+			known = self._seen.get(device['address'])
+			self._seen[device['address']] = (device, time.monotonic())
+			if known is None or known[0] != device: self.version += 1
+	def _scan(self):
+		try:
+			try:
+				import bleak
+			except ImportError:
+				self._scanMeshcli()
+			else:
+				asyncio.run(self._scanBleak())
+		except Exception as e:
+			logging.error(f'Error scanning BLE devices: {e}')
+		finally:
+			self._proc = None
+			if not self._cancel.is_set(): self.finished = time.monotonic()
+			self._changed()
+	async def _scanBleak(self):
+		'''streams advertisements as they arrive'''
+		from bleak import BleakScanner
+		def onDetection(device, advertisement):
+			name = device.name or advertisement.local_name
+			if name and name.startswith(MESHCORE_NAME_PREFIX):
+				self._found({'name': name, 'address': device.address})
+		async with BleakScanner(detection_callback=onDetection):
+			end = time.monotonic() + self.SCAN_TIME
+			while time.monotonic() < end and not self._cancel.is_set():
+				await asyncio.sleep(.1)
+	def _scanMeshcli(self):
+		'''meshcli lists the devices once its scan is over, killed on cancel'''
+		self._proc = subprocess.Popen(MeshCorePrimitives.BLE_SCAN_COMMAND, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+		if self._cancel.is_set(): self._proc.kill()  # cancelled while starting
+		try:
+			output, _ = self._proc.communicate(timeout=self.SCAN_TIME + 5)
+		except subprocess.TimeoutExpired:
+			self._proc.kill()
+			return
+		if self._proc.returncode != 0 or self._cancel.is_set(): return
+		for device in MeshCorePrimitives.parse_ble_scan(output):
+			self._found(device)
+
+Candidate = tuple[str, list[str]]  # (label shown in the menu, connection args of MeshCorePrimitives.probe_connection)
+
+def lastRadio() -> Optional[list[str]]:
+	try:
+		with open(LAST_RADIO_FILE) as f:
+			args = json.load(f)
+	except (OSError, ValueError):
+		return None
+	return args if isinstance(args, list) and all(isinstance(a, str) for a in args) else None
+
+def saveLastRadio(args: list[str]):
+	try:
+		with open(LAST_RADIO_FILE, 'w') as f:
+			json.dump(args, f)
+	except OSError as e:
+		logging.warning(f'Could not remember the radio connection: {e}')
+
+def candidateLabel(args: list[str]) -> str:
+	kind, *params = args
+	return {'--ble': 'BLE {}', '--tcp': 'TCP {}:{}', '--serial': 'Serial {}'}[kind].format(*params)
+
+def autoCandidates() -> list[Candidate]:
+	'''links worth trying when the user didn't pick one: the last working radio, a local TCP radio and the serial ports present'''
+	argsList = [['--tcp', 'localhost', '5000']]
+	argsList += [['--serial', port, str(DEFAULT_BAUDRATE)] for pattern in SERIAL_PORT_PATTERNS for port in sorted(glob.glob(pattern))]
+	if (last := lastRadio()) is not None:
+		argsList = [last] + [args for args in argsList if args[:2] != last[:2]]
+	return [(candidateLabel(args), args) for args in argsList]
+
+class RadioConnector:
+	'''connects to the radio in the background, racing several candidate links, the first healthy one is kept
+
+	Every candidate is opened and pinged on its own thread. Links which answer
+	after the race was decided or cancelled are closed again.'''
+	IDLE, CONNECTING, CONNECTED, FAILED, CANCELLED = 'idle', 'connecting', 'connected', 'failed', 'cancelled'
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._attempt = 0  # bumped per start/cancel, results of older attempts are discarded
+		self._pending = 0  # candidates of the current attempt still being probed
+		self.state = self.IDLE
+		self.status = ''
+		self.winner: Optional[Candidate] = None
+		self.version = 0  # bumped on every change, so the menu knows when to redraw
+
+	# api ---------------------------------------
+	def start(self, candidates: list[Candidate]):
+		'''drops the current connection and probes the candidates in parallel'''
+		MeshCorePrimitives.close_worker()  # a link held open can't be probed again
+		with self._lock:
+			self._attempt += 1
+			self._pending = len(candidates)
+			self.winner = None
+			if not candidates:
+				self._set(self.FAILED, 'No radio to connect to')
+				return
+			self._set(self.CONNECTING, f'Connecting to {candidates[0][0]}...' if len(candidates) == 1 else f'Trying {len(candidates)} links...')
+			for candidate in candidates:
+				threading.Thread(target=self._probe, args=(self._attempt, candidate), name='Thread-RadioProbe', daemon=True).start()
+	def cancel(self):
+		with self._lock:
+			self._attempt += 1
+			if self.state == self.CONNECTING: self._set(self.CANCELLED, 'Connection cancelled')
+	def running(self) -> bool:
+		return self.state == self.CONNECTING
+
+	# probing -----------------------------------
+	def _set(self, state: str, status: str):
+		self.state, self.status = state, status
+		self.version += 1
+	def _probe(self, attempt: int, candidate: Candidate):
+		label, args = candidate
+		try:
+			healthy, worker = MeshCorePrimitives.probe_connection(args)
+		except Exception as e:
+			logging.error(f'Error probing {label}: {e}')
+			healthy, worker = False, None
+		with self._lock:
+			current = attempt == self._attempt
+			if current: self._pending -= 1
+			won = current and healthy and self.winner is None
+			if won:
+				self.winner = candidate
+				if worker is not None: MeshCorePrimitives.use_connection(worker)
+				self._set(self.CONNECTED, f'Connected to {label}')
+				logging.info(f'Radio connection successful: {label}')
+			else:
+				if worker is not None: worker.close()
+				if current and self.winner is None:
+					if self._pending: self._set(self.CONNECTING, f'{label} not responding, {self._pending} link(s) left...')
+					else: self._set(self.FAILED, 'Connection failed - check device and try again')
+		if won: saveLastRadio(args)
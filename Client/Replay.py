@@ -0,0 +1,262 @@
+'''
+Replaying a recorded match through `Session` and `Game`, without a radio.
+
+The journal (see `Shared.Journal`) of one player's node is the script: the
+frames the opponent sent are fed to the session, and the player's own
+actions are redone from the messages the node sent (the layout of its
+GAME_READINESS, the positions of its SHOOTs, its rematch wishes).
+Everything else, pairing, answers and state notifications, the game
+produces itself. Records are replayed in journal order, at the recorded
+pace scaled by `speed` or, with speed 0, as fast as possible.
+
+Everything runs on the calling thread, so a replay is deterministic and its
+timings are those of the game loop: routing received messages,
+`Session.loadResponses`, the request callbacks and drawing. At every match
+end noted in the journal the grids have to equal the recorded ones.
+
+The report also compares how many messages of each command the replay sent
+with the recording. Pairing, heartbeats, state repeats and quitting go by the
+clock, by discovery's own thread or by the player leaving, not by the match,
+so their counts may differ; they are listed apart, along with why.
+
+Run from the repository root:
+	python -m Client.Replay JOURNAL [--speed 1] [--no-draw]
+'''
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import typing
+from collections import Counter
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # draws into memory unless a display is asked for
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+
+from Shared import MeshCorePrimitives, Journal
+from Shared.Transport import Transport
+from Shared.Enums import COM, STAGES, SHOTS
+from .Session import Session, Request
+from .Game import Game, Ship
+from .Checkpoint import MatchCheckpoint
+
+# commands the game sends on its own schedule rather than the recorded match's, their counts may differ
+UNSCRIPTED = {
+	COM.PAIR: 'discovery probes and answers on its own thread, at its own pace',
+	COM.HEARTBEAT: 'liveness probes go by the wall clock, they are off in a replay',
+	COM.STATE: 'state notifications are repeated on a timer',
+	COM.DISCONNECT: 'sent when the player quits, a replay ends without quitting',
+}
+
+class ReplayTransport(Transport):
+	'''feeds recorded frames to the session, what the session sends goes nowhere but is counted'''
+	def __init__(self, ownName: str, peers: list[str]):
+		super().__init__()
+		self.journal = None  # a replay is not recorded again
+		self.ownName = ownName
+		self.peers = peers
+		self.session: typing.Optional[Session] = None
+		self.sent: Counter[str] = Counter()  # command -> messages sent
+		self.lastSeqs: dict[str, int] = {}  # command -> sequence number it was last sent with
+		self.seqs: dict[int, int] = {}  # sequence number of a message in the recording -> of the replay redoing it
+
+	def feed(self, sender: str, text: str):
+		'''delivers a recorded frame
+		a recorded answer ('re') names a message of the recording, it's made to name the one the replay redid, or dropped'''
+		for id_val, command, payload in self._decode_frame(sender, text):
+			re = self.seqs.get(payload.pop('re', None))
+			if re is not None: payload['re'] = re
+			self.session._routeMessage((id_val, command, payload))
+
+	def send_messages(self, node_name: str, player_id: int, messages: list[tuple[str, dict]]) -> bool:
+		self.sent.update(command for command, payload in messages)
+		self.lastSeqs.update((command, payload['seq']) for command, payload in messages if 'seq' in payload)
+		return super().send_messages(node_name, player_id, messages)
+	def send_frames(self, node_name: str, frames: list[str]) -> bool:
+		return True
+	def receive_frames(self) -> list[tuple[str, str]]:
+		return []
+	def get_contacts(self) -> list[str]:
+		return list(self.peers)
+	def get_own_node_name(self) -> typing.Optional[str]:
+		return self.ownName
+
+class ReplaySession(Session):
+	'''a session without networking threads: reqs are sent when submitted, messages routed when fed'''
+	def __init__(self, transport: ReplayTransport, timings: dict[str, list[float]]):
+		self.timings = timings
+		super().__init__(transport)
+		transport.session = self
+
+	# session hooks -----------------------------
+	def _startWorkers(self):
+		pass
+	def _stopWorkers(self):
+		pass
+	def checkThreads(self):
+		pass
+	def spawnConnectionCheck(self):
+		pass  # liveness goes by the wall clock, a replay by the journal
+	def _submit(self, req: Request):
+		self._sendReqs([req])
+	def _putReq(self, command: COM, payload: dict, callback: typing.Callable, *, blocking: bool):
+		super()._putReq(command, payload, _timed(self.timings, 'callbacks', callback), blocking=blocking)
+	def loadResponses(self, *, _drain=False) -> tuple[str, dict]:
+		return _timed(self.timings, 'loadResponses', super().loadResponses)(_drain=_drain)
+
+class _RecordedTurn:
+	'''stands in for Game.rng, the first turn goes to the player who had it in the recording'''
+	def __init__(self, playerId: typing.Callable[[], int]):
+		self.playerId = playerId
+	def choice(self, players: list[int]) -> int:
+		playerId = self.playerId()
+		return playerId if playerId in players else players[0]
+
+def _timed(timings: dict[str, list[float]], name: str, func: typing.Callable) -> typing.Callable:
+	def timedFunc(*args, **kwargs):
+		start = time.perf_counter()
+		try:
+			return func(*args, **kwargs)
+		finally:
+			timings.setdefault(name, []).append(time.perf_counter() - start)
+	return timedFunc
+
+class Replayer:
+	SETTLE_STEPS = 50  # game loop steps a match end gets to be reached after its last record
+
+	def __init__(self, path: str, speed: float = 0., draw: bool = True):
+		self.path = path
+		self.speed = speed
+		self.draw = draw
+		self.timings: dict[str, list[float]] = {}  # name -> durations in s
+		self.mismatches: list[str] = []
+		self.matches = 0
+		with Journal.JournalReader(path) as reader:
+			self.records = list(reader)
+		self._sentDecoder = MeshCorePrimitives.new_reassembly_buffer()
+		self._sentSeqs: set[int] = set()
+		self.recorded: Counter[str] = Counter()  # command -> messages sent in the recording
+
+	def run(self) -> bool:
+		'''replays the whole journal, @return: if every match ended as recorded'''
+		ownId, firstTurns, peers = self._scan()
+		self.transport = ReplayTransport('replay', peers)
+		self.session = ReplaySession(self.transport, self.timings)
+		self.game = Game(self.session)
+		self.game.checkpoint = MatchCheckpoint(None)  # neither resumes the player's match nor overwrites it
+		self.game.rng = _RecordedTurn(lambda: firstTurns[min(self.matches, len(firstTurns) - 1)] if firstTurns else 0)
+		self.game.newGameStage(STAGES.CONNECTING)
+		while self.game.gameStage == STAGES.CONNECTING or not self.game.discovery: self._step()  # ready to be probed
+		self.session.id = ownId or self.session.id
+		self._sentSeqs.clear()
+		start, replayStart = self.records[0].time if self.records else 0., time.monotonic()
+		for record in self.records:
+			if self.speed:
+				while (wait := replayStart + (record.time - start) / self.speed - time.monotonic()) > 0:
+					self._step()
+					time.sleep(min(wait, 0.01))
+			if record.direction == Journal.RECEIVED:
+				_timed(self.timings, 'route', self.transport.feed)(record.peer, record.frame)
+			elif record.direction == Journal.SENT:
+				self._redo(record)
+			elif record.direction == Journal.NOTE:
+				self._checkMatchEnd(json.loads(record.frame))
+			self._step()
+		self.close()
+		return not self.mismatches
+
+	def close(self):
+		if self.game.discovery: self.game.discovery.stop()
+		self.transport.close()
+
+	# replaying ---------------------------------
+	def _scan(self) -> tuple[int, list[int], list[str]]:
+		'''@return: the recorded player's id, the player on turn first in each match and the peers it talked to'''
+		ownId, firstTurns, peers, onTurn = 0, [], [], 0
+		decoder = MeshCorePrimitives.new_reassembly_buffer()
+		for record in self.records:
+			if record.direction == Journal.NOTE: continue
+			if record.peer not in peers: peers.append(record.peer)
+			if record.direction != Journal.SENT: continue
+			for id_val, command, payload in MeshCorePrimitives.decode_frame(record.frame, record.peer, decoder):
+				ownId = ownId or id_val
+				if command == COM.STATE:
+					if not onTurn and payload.get('on_turn', 0): firstTurns.append(payload['on_turn'])
+					onTurn = payload.get('on_turn', 0)
+		return ownId, firstTurns, peers
+	def _redo(self, record: Journal.Record):
+		'''the player's own actions, from the messages its node sent'''
+		for id_val, command, payload in MeshCorePrimitives.decode_frame(record.frame, record.peer, self._sentDecoder):
+			seq = payload.get('seq')
+			if seq is not None:
+				if seq in self._sentSeqs: continue  # retransmitted
+				self._sentSeqs.add(seq)
+			self.recorded[command] += 1
+			redone = self.transport.lastSeqs.get(command)
+			if command == COM.GAME_READINESS and payload.get('ready'):
+				self._place(payload.get('ships', []))
+			elif command == COM.SHOOT and 'pos' in payload:
+				self._shoot(payload['pos'])
+			elif command == COM.UPDATE_REMATCH and 'rematch_desired' in payload:  # not our answer to the opponent's
+				if self.game.gameStage == STAGES.GAME_END: self.game.sendUpdateRematch(payload['rematch_desired'])
+			if seq is not None and self.transport.lastSeqs.get(command) != redone: self.transport.seqs[seq] = self.transport.lastSeqs[command]
+	def _place(self, ships: list[dict]):
+		game = self.game
+		if game.gameStage != STAGES.PLACING:
+			self.mismatches.append(f'layout sent in {game.gameStage.name}, the replay was not placing')
+			return
+		game.grid.ships = [Ship.fromDict(ship) for ship in ships]
+		game.grid.shipSizes = {size: 0 for size in game.grid.shipSizes}
+		game.grid.removeShipInCursor()
+		game.toggleGameReady()
+	def _shoot(self, pos: list[int]):
+		game = self.game
+		if game.gameStage != STAGES.SHOOTING or game.player_on_turn != self.session.id:
+			self.mismatches.append(f'shot at {pos} in {game.gameStage.name}, the replay was not on turn')
+			return
+		game.opponentGrid.shots[pos[1]][pos[0]] = SHOTS.SHOTTED_UNKNOWN
+		game.shootReq(pos)
+	def _step(self):
+		'''one iteration of the game loop'''
+		game = self.game
+		_timed(self.timings, 'handleConnections', game.handleConnections)()
+		offset = game.updateTransition()
+		if self.draw: _timed(self.timings, 'draw', game.drawGame)(offset)
+	def _checkMatchEnd(self, recorded: dict):
+		self.matches += 1
+		for _ in range(self.SETTLE_STEPS):
+			if self.game.gameStage in [STAGES.GAME_END, STAGES.END_GRID_SHOW]: break
+			self._step()
+		replayed = json.loads(json.dumps(self.game.matchSnapshot()))
+		for gridName, state in recorded.items():
+			for field in ['ships', 'shots']:
+				if replayed.get(gridName, {}).get(field) != state.get(field):
+					self.mismatches.append(f'match {self.matches}: {gridName}.{field} differs from the recording')
+
+	# results -----------------------------------
+	def report(self) -> str:
+		lines = [f'{self.path}: {len(self.records)} records, {self.matches} match end(s) checked, {"OK" if not self.mismatches else "MISMATCH"}']
+		lines += [f'	{m}' for m in self.mismatches]
+		lines.append(f"	{'':18} {'calls':>7} {'total ms':>10} {'mean us':>9} {'max us':>9}")
+		for name, durations in self.timings.items():
+			lines.append(f'	{name:18} {len(durations):>7} {sum(durations) * 1e3:>10.2f} {sum(durations) / len(durations) * 1e6:>9.1f} {max(durations) * 1e6:>9.1f}')
+		diverged = {command: (self.recorded[command], self.transport.sent[command]) for command in COM if self.recorded[command] != self.transport.sent[command]}
+		if scripted := {command.name: counts for command, counts in diverged.items() if command not in UNSCRIPTED}:
+			lines.append(f'	messages sent (recorded, replayed) where they differ: {scripted}')
+		lines += [f'	{command.name}: {recorded} sent in the recording, {replayed} in the replay, as expected: {UNSCRIPTED[command]}' for command, (recorded, replayed) in diverged.items() if command in UNSCRIPTED]
+		return '\n'.join(lines)
+
+def main():
+	parser = argparse.ArgumentParser('Replay', description='replays a recorded match through the game and checks it ends the same')
+	parser.add_argument('journal')
+	parser.add_argument('--speed', type=float, default=0., help='1 replays at the recorded pace, 0 (default) as fast as possible')
+	parser.add_argument('--no-draw', action='store_true', help="don't draw, times only the session and the game logic")
+	args, unknown = parser.parse_known_args()
+	logging.basicConfig(level=logging.WARNING)
+	replayer = Replayer(args.journal, args.speed, not args.no_draw)
+	ok = replayer.run()
+	print(replayer.report())
+	sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+	main()
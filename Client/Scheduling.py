@@ -0,0 +1,170 @@
+'''
+Airtime-aware ordering of outgoing requests.
+
+LoRa radios are subject to duty-cycle limits, so the session spends a
+budget of airtime instead of sending as fast as the radio accepts frames.
+The budget is a token bucket holding milliseconds of airtime, which
+refills evenly over its window. Every frame put on the air (retransmissions
+and acknowledgements included) is charged with its estimated time on air;
+while the bucket is in debt requests queue up.
+
+Queued requests are released by priority class, FIFO within a class: shots
+and their replies first, then pairing, layouts, resuming and the other
+control messages, last the state notifications of `Subscriptions`, whose
+heartbeat repeats them anyway. A send takes only as many requests as the
+budget has airtime left for (`popBurst`), each charged with an estimate of
+its own frames, so a backlog goes out in bursts the budget allows, and a
+shot queued meanwhile overtakes what is left of it.
+
+The session logs the queue metrics (`SendScheduler.stats`) when it quits.
+'''
+import math
+import time
+import argparse
+import threading
+from collections import deque
+from typing import Optional, List, Dict, Deque, Tuple, Callable
+
+from Shared.Enums import COM
+from Shared import MeshCorePrimitives
+
+# LoRa modem settings of the MeshCore default preset
+SPREADING_FACTOR = 11
+BANDWIDTH_HZ = 250_000
+CODING_RATE = 5  # 4/5
+PREAMBLE_SYMBOLS = 8
+PACKET_OVERHEAD = 16  # bytes MeshCore adds around the text (header, hashes, MAC, timestamp)
+
+def lora_airtime_ms(payload_bytes: int, sf: int = SPREADING_FACTOR, bw: int = BANDWIDTH_HZ, cr: int = CODING_RATE, preamble: int = PREAMBLE_SYMBOLS) -> float:
+	'''time on air of one LoRa packet (explicit header, CRC on), Semtech AN1200.13'''
+	symbol = (1 << sf) / bw * 1000
+	lowRateOptimize = symbol > 16
+	payloadSymbols = 8 + max(math.ceil((8 * payload_bytes - 4 * sf + 28 + 16) / (4 * (sf - 2 * lowRateOptimize))) * cr, 0)
+	return (preamble + 4.25 + payloadSymbols) * symbol
+
+def frame_airtime_ms(frame: str) -> float:
+	return lora_airtime_ms(len(frame.encode('utf-8')) + PACKET_OVERHEAD)
+
+def message_airtime_ms(player_id: int, command: str, payload: dict) -> float:
+	'''time on air of a message sent on its own, sharing a frame makes it cheaper'''
+	return sum(map(frame_airtime_ms, MeshCorePrimitives.encode_message(player_id, command, payload)))
+
+class AirtimeBudget:
+	'''token bucket of `budget_ms` airtime, refilled evenly over `window_s`
+	the default is the 10 % duty cycle of the EU 869.4-869.65 MHz band'''
+	def __init__(self, budget_ms: float = 360_000, window_s: float = 3600):
+		self.budget_ms = budget_ms
+		self.window_s = window_s
+		self.rate = budget_ms / window_s / 1000  # ms of airtime per ms
+		self.tokens = budget_ms
+		self.updated = time.monotonic()
+		self._lock = threading.Lock()
+
+	@ classmethod
+	def fromArgs(cls) -> 'AirtimeBudget':
+		'''budget given by the '--airtime-budget MS' and '--airtime-window S' command line flags'''
+		parser = argparse.ArgumentParser(add_help=False)
+		parser.add_argument('--airtime-budget', type=float, default=360_000)
+		parser.add_argument('--airtime-window', type=float, default=3600)
+		args, unknown = parser.parse_known_args()
+		return cls(args.airtime_budget, args.airtime_window)
+
+	def _refill(self, now: float):
+		self.tokens = min(self.budget_ms, self.tokens + (now - self.updated) * 1000 * self.rate)
+		self.updated = now
+	def charge(self, airtime_ms: float):
+		'''spend airtime which was just used, the bucket may go into debt'''
+		with self._lock:
+			self._refill(time.monotonic())
+			self.tokens -= airtime_ms
+	def delay(self) -> float:
+		'''seconds until the bucket is out of debt, 0 if sending is allowed now'''
+		with self._lock:
+			self._refill(time.monotonic())
+			return 0. if self.tokens > 0 else -self.tokens / self.rate / 1000 + 1e-3
+	def available(self) -> float:
+		'''ms of airtime which can be spent now, negative while in debt'''
+		with self._lock:
+			self._refill(time.monotonic())
+			return self.tokens
+
+# priority classes, lower goes first, commands not listed are CONTROL
+URGENT, CONTROL, STATE = range(3)
+PRIORITIES: Dict[COM, int] = {
+	COM.SHOOT: URGENT,
+	COM.CONNECT: CONTROL, COM.PAIR: CONTROL, COM.GAME_READINESS: CONTROL, COM.UPDATE_REMATCH: CONTROL, COM.DISCONNECT: CONTROL, COM.ERROR: CONTROL, COM.RESUME: CONTROL, COM.HEARTBEAT: CONTROL,
+	COM.STATE: STATE,
+}
+CLASS_NAMES = ['urgent', 'control', 'state']
+
+class SendScheduler:
+	'''priority queues of requests waiting to be sent, plus airtime accounting
+	only Thread-Send pushes and pops, the metrics can be read from anywhere'''
+	def __init__(self, budget: Optional[AirtimeBudget] = None):
+		self.budget = budget
+		self._queues: List[Deque[Tuple[float, object]]] = [deque() for _ in CLASS_NAMES]
+		self._lock = threading.Lock()
+		self.maxDepth = [0] * len(CLASS_NAMES)
+		self.sent = [0] * len(CLASS_NAMES)
+		self.waited = [0.] * len(CLASS_NAMES)  # total seconds spent queued
+		self.maxWait = [0.] * len(CLASS_NAMES)
+		self.frames = 0
+		self.airtimeMs = 0.
+		self.throttled = 0  # times sending had to wait for the budget
+
+	def __len__(self):
+		with self._lock:
+			return sum(map(len, self._queues))
+
+	def push(self, req):
+		cls = PRIORITIES.get(req.command, CONTROL)
+		with self._lock:
+			queue = self._queues[cls]
+			queue.append((time.monotonic(), req))
+			self.maxDepth[cls] = max(self.maxDepth[cls], len(queue))
+	def popBurst(self, airtime: Optional[Callable[[object], float]] = None) -> list:
+		'''queued requests highest priority first, as many as the budget has airtime left for
+		each is charged its estimate `airtime(req)`, the first one goes even if the budget can't cover it
+		without a budget or an estimate all the queued requests are taken'''
+		now = time.monotonic()
+		left = self.budget.available() if self.budget and airtime else math.inf
+		reqs = []
+		with self._lock:
+			for cls, queue in enumerate(self._queues):
+				while queue and (left > 0 or not reqs):
+					queued, req = queue.popleft()
+					if left < math.inf: left -= airtime(req)
+					self.sent[cls] += 1
+					self.waited[cls] += now - queued
+					self.maxWait[cls] = max(self.maxWait[cls], now - queued)
+					reqs.append(req)
+		return reqs
+	def headClass(self) -> Optional[int]:
+		'''priority class of the most urgent queued request, None if nothing is queued'''
+		with self._lock:
+			return next((cls for cls, queue in enumerate(self._queues) if queue), None)
+	def delay(self) -> float:
+		'''seconds the queued requests have to wait for airtime'''
+		return self.budget.delay() if self.budget else 0.
+	def noteThrottled(self):
+		with self._lock:
+			self.throttled += 1
+	def chargeFrames(self, node_name: str, frames: List[str]):
+		'''Transport.on_frames_sent hook'''
+		airtime = sum(map(frame_airtime_ms, frames))
+		with self._lock:
+			self.frames += len(frames)
+			self.airtimeMs += airtime
+		if self.budget: self.budget.charge(airtime)
+
+	def stats(self) -> dict:
+		with self._lock:
+			return {
+				'depth': {name: len(q) for name, q in zip(CLASS_NAMES, self._queues)},
+				'max_depth': dict(zip(CLASS_NAMES, self.maxDepth)),
+				'sent': dict(zip(CLASS_NAMES, self.sent)),
+				'mean_wait': {name: self.waited[i] / self.sent[i] if self.sent[i] else 0. for i, name in enumerate(CLASS_NAMES)},
+				'max_wait': dict(zip(CLASS_NAMES, self.maxWait)),
+				'frames': self.frames, 'airtime_ms': self.airtimeMs, 'throttled': self.throttled,
+				'budget_ms': self.budget.tokens if self.budget else None,
+			}
@@ -1,12 +1,16 @@
 import time
+import itertools
 from queue import Queue, Empty
+from collections import deque
 import threading
 import logging
 
 from dataclasses import dataclass
 import enum, typing
 
-from Shared import MeshCorePrimitives
+from Shared.Transport import Transport, create_transport
+from .Scheduling import SendScheduler, AirtimeBudget, message_airtime_ms
+from .Liveness import Liveness, PROBE, GONE
 from Shared.Enums import COM
 from Shared.Helpers import runFuncLogged
 
@@ -23,29 +27,160 @@ class Request:
 	command: COM
 	payload: dict
 	callback: typing.Callable
-	blocking: bool
+	blocking: bool # NOTE only tells the scheduler's callers apart, every req is handed its response by the dispatcher
 	state: int=0 # 0 waiting, 1 sent, 2 received
+	seq: int=0 # sequence number it was sent with, responses name it in 're'
+	oneway: bool=False # a notification, no response is awaited
+	re: typing.Optional[int]=None # sequence number of the message a oneway req answers
+	sentAt: float=0. # time.monotonic() it went on the wire, 0 until then
+	retries: int=0 # times it was sent again for want of a response, it keeps its seq
+	resentAt: float=0. # time.monotonic() it was last sent again
+	resending: bool=False # queued to be sent again
+
+class ReplayWindow:
+	'''sequence numbers seen from one sender, the last SIZE of them
+	anything older than the window or already seen is a duplicate (a retransmission, or a copy which took another path)'''
+	SIZE = 64
+
+	def __init__(self):
+		self.highest = 0
+		self.seen = 0 # bit n set -> highest - n was seen
+
+	def accept(self, seq: int) -> bool:
+		if seq > self.highest:
+			self.seen = (self.seen << (seq - self.highest) | 1) & ((1 << self.SIZE) - 1)
+			self.highest = seq
+			return True
+		age = self.highest - seq
+		if age >= self.SIZE or self.seen >> age & 1: return False
+		self.seen |= 1 << age
+		return True
+
+class Dispatcher:
+	'''routes inbound messages to the requests awaiting them in O(1)
+	a response naming its request in 're' gets exactly that request, or is dropped as stale if it was already answered
+	a message without a sequence number, from a peer which doesn't number its messages, goes to the oldest request with the same command
+	messages nobody awaits go to the ordered `inbox` with their 'seq', which keeps the newest INBOX_SIZE
+	our replies are kept for the last REPLIES_KEPT requests answered, a request coming again from the same node gets the same reply'''
+	INBOX_SIZE = 256
+	REPLIES_KEPT = 16
 
-class Session:
 	def __init__(self):
+		self._bySeq: dict[int, Request] = {}
+		self._byCommand: dict[str, deque[Request]] = {} # may still hold reqs answered by seq, skipped on the way out
+		self._lock = threading.Lock()
+		self.inbox: deque[tuple[int, str, dict]] = deque(maxlen=self.INBOX_SIZE)
+		self.dropped = 0  # unsolicited messages pushed out of the full inbox
+		self.stale = 0  # responses to reqs which aren't pending (anymore)
+		self._replies: dict[tuple[str, int], Request] = {}  # (node, seq of its request answered) -> our reply, oldest first
+
+	def __len__(self):
+		with self._lock:
+			return len(self._bySeq)
+
+	def expect(self, req: Request):
+		'''registers req before it is sent, so even an immediate response finds it'''
+		with self._lock:
+			self._bySeq[req.seq] = req
+			queue = self._byCommand.setdefault(req.command, deque())
+			while queue and self._bySeq.get(queue[0].seq) is not queue[0]: queue.popleft()  # answered by seq meanwhile
+			queue.append(req)
+	def forget(self, req: Request):
+		'''unregisters a req whose sending failed'''
+		with self._lock:
+			self._bySeq.pop(req.seq, None)
+	def dispatch(self, msg: tuple[int, str, dict], re: typing.Optional[int] = None, seq: typing.Optional[int] = None) -> typing.Optional[Request]:
+		'''@return: the request msg answers, None if it was stale or unsolicited (and went to the inbox)'''
+		id_val, command, payload = msg
+		with self._lock:
+			if re is not None:
+				req = self._bySeq.get(re)
+				if req is None or req.command != command:
+					self.stale += 1
+					return None
+				del self._bySeq[re]
+				return req
+			queue = self._byCommand.get(command) if seq is None else None
+			while queue:
+				req = queue.popleft()
+				if self._bySeq.get(req.seq) is req:
+					del self._bySeq[req.seq]
+					return req
+			if len(self.inbox) == self.inbox.maxlen: self.dropped += 1
+			self.inbox.append(msg if seq is None else (id_val, command, {**payload, 'seq': seq}))
+		return None
+	def lastSent(self) -> typing.Optional[float]:
+		'''when the latest req awaiting its response was sent, None if none is'''
+		with self._lock:
+			return max((req.sentAt for req in self._bySeq.values()), default=None)
+	def pending(self) -> list[Request]:
+		'''the reqs awaiting their response'''
+		with self._lock:
+			return list(self._bySeq.values())
+	def remember(self, node: str, reply: Request):
+		'''keeps reply to the request of node it names in 're' '''
+		with self._lock:
+			self._replies[node, reply.re] = reply
+			if len(self._replies) > self.REPLIES_KEPT: del self._replies[next(iter(self._replies))]
+	def replyTo(self, node: str, seq: int) -> typing.Optional[Request]:
+		'''our reply to the request seq of node, None if we didn't answer it (lately)'''
+		with self._lock:
+			return self._replies.get((node, seq))
+	def forgetReplies(self, node: str):
+		'''node starts over, its sequence numbers too'''
+		with self._lock:
+			self._replies = {key: reply for key, reply in self._replies.items() if key[0] != node}
+	def abandon(self):
+		'''forgets all pending reqs, their responses won't come'''
+		with self._lock:
+			self._bySeq.clear()
+			self._byCommand.clear()
+	def popInbox(self) -> list[tuple[int, str, dict]]:
+		with self._lock:
+			msgs = list(self.inbox)
+			self.inbox.clear()
+		return msgs
+
+class Session:
+	COALESCE_WINDOW = 0.02  # s, reqs spawned together by the game loop arrive well within this
+	RETRIES = 6  # times a req is sent again, if its response is still overdue then the opponent is given up on
+
+	def __init__(self, transport: Transport=None):
+		self._attachTransport(transport)
 		self.repeatebleInit()
 
 		self.reqQueue: Queue[Request] = Queue()
-		self.requestsToRecv: Queue[Request] = Queue()
 		self.responseQueue: Queue[Request] = Queue()
 		self.quitNowEvent = threading.Event()
-
+		self.recvWakeup = threading.Event() # set on pushed messages and newly sent reqs, lets Thread-Recv sleep while idle
+		self.unsolicitedHandlers: dict[COM, typing.Callable[[int, dict, typing.Optional[int]], None]] = {COM.HEARTBEAT: self._onHeartbeat, COM.DISCONNECT: self._onDisconnect} # commands taken out of dispatching, called on Thread-Recv with (id, payload, seq), answers keep their 're'
+		self.seqCounter = itertools.count(1) # numbers every message sent, never restarts within the session
+		self.replayWindows: dict[int, ReplayWindow] = {} # player id -> sequence numbers seen from it
+		self.duplicates = 0
+		self.foreign = 0 # messages of other nodes than the opponent, dropped
+		self.onIncoming: typing.Optional[typing.Callable[[], None]] = None # called on the receiving thread once a message was routed, wakes the game loop
+		self._startWorkers()
+	def _attachTransport(self, transport: typing.Optional[Transport]):
+		self.transport: Transport = transport or create_transport()
+		# radio airtime is limited, the other transports only get the priorities
+		self.scheduler = SendScheduler(AirtimeBudget.fromArgs() if self.transport.needs_radio else None)
+		self.transport.on_frames_sent = self.scheduler.chargeFrames
+		self.transport.tag_senders = True  # tells the opponent's messages from those of other nodes
+	def _startWorkers(self):
 		self.sendThread = threading.Thread(target=lambda: runFuncLogged(self.sendLoop), name='Thread-Send', daemon=True)
 		self.sendThread.start()
 		self.recvThread = threading.Thread(target=lambda: runFuncLogged(self.recvLoop), name='Thread-Recv', daemon=True)
 		self.recvThread.start()
 	def repeatebleInit(self):
 		self.id: int = 0
-		assert len(COM) == 11  # CONNECTION_CHECK removed for P2P
+		assert len(COM) == 14  # CONNECTION_CHECK removed for P2P, STATE, RESUME and HEARTBEAT are never reqs
 		self.alreadySent: dict[COM, bool] = {COM.CONNECT: False, COM.PAIR: False, COM.OPPONENT_READY: False, COM.GAME_READINESS: False, COM.GAME_WAIT: False, COM.SHOOT: False, COM.OPPONENT_SHOT: False, COM.DISCONNECT: False, COM.AWAIT_REMATCH: False, COM.UPDATE_REMATCH: False}
 		self.connected = False # NOTE connected only if active communication w/ opponent is established and will be kept
 		self.opponent_node_name: str = None  # Mesh node name of opponent
 		self.incoming_messages: Queue[tuple[int, str, dict]] = Queue()  # Queue for incoming meshcore messages
+		self.dispatcher = Dispatcher()  # requests awaiting their response, unsolicited messages
+		self.liveness = Liveness()  # of the opponent, while connected to one
+		self.opponentTimedOut = False  # the game ended because the opponent stopped answering, not because it left
 
 	def setAlreadySent(self, comm: COM):
 		assert not self.alreadySent[comm]
@@ -75,38 +210,113 @@ class Session:
 		if self.quitNowEvent.is_set() or self.fullyDisconnected(): return '', {}
 		gameEndMsg, opponentState = '', None
 		for req in iterQueue(self.responseQueue):
-			if not req.payload['stay_connected']:
+			if not req.payload.get('stay_connected', True):
 				gameEndMsg = req.payload['game_end_msg']
 				self.connected = False
 				if 'opponent_grid' in req.payload: opponentState = req.payload['opponent_grid']
 			if not _drain: req.callback(req.payload)
 			self.resetAlreadySent(req.command)
-			self.reqQueue.task_done()
 		return gameEndMsg, opponentState
 	def _putReq(self, command: COM, payload: dict, callback: typing.Callable, *, blocking: bool):
 		assert isinstance(command, enum.Enum) and isinstance(command, str) and isinstance(payload, dict) and callable(callback), 'the request does not meet expected properties'
 		# For P2P: CONNECT is now local initialization, PAIR requires opponent_node_name
 		assert self.connected or command == COM.CONNECT or (command == COM.PAIR and self.opponent_node_name), 'the session is not connected or no opponent specified'
 		assert self.id != 0 or command == COM.CONNECT, 'self.id is invalid for sending this request'
-		self.reqQueue.put(Request(command, payload, callback, blocking))
+		self._submit(Request(command, payload, callback, blocking))
+	def _submit(self, req: Request):
+		'''hands req over to the sending side'''
+		self.reqQueue.put(req)
+	def notify(self, command: COM, payload: dict, re: typing.Optional[int] = None):
+		'''sends a message to the opponent without awaiting a response, scheduled like reqs
+		're' - sequence number of the message this one answers, the reply is sent again if that message comes again'''
+		assert self.connected and self.opponent_node_name and self.id != 0, 'the session is not connected or no opponent specified'
+		reply = Request(command, payload, None, False, oneway=True, re=re)
+		if re is not None: self.dispatcher.remember(self.opponent_node_name, reply)
+		self._submit(reply)
+	def unsolicited(self) -> list[tuple[int, str, dict]]:
+		'''messages which arrived without a request awaiting them (e.g. an opponent's SHOOT), oldest first
+		their 'seq' is kept, a reply names it in 're' (see `notify`)'''
+		return self.dispatcher.popInbox()
+	def sendTo(self, nodeName: str, command: COM, payload: dict, re: typing.Optional[int] = None) -> bool:
+		'''sends a message to any node right away, outside of the request/response flow
+		're' - sequence number of the message this one answers'''
+		assert self.id != 0, 'self.id is invalid for sending'
+		payload = {**payload, 'seq': next(self.seqCounter)}
+		if re is not None: payload['re'] = re
+		try:
+			return self.transport.send_messages(nodeName, self.id, [(command, payload)])
+		except Exception as e:
+			logging.error(f'Error sending {command} to {nodeName}: {e}')
+			return False
 	# checks and closing -----------------------
 	def spawnConnectionCheck(self):
-		# Connection check not needed for meshcore - messages are fire-and-forget
-		# We can detect disconnection by lack of responses
-		pass
+		'''sends reqs again whose response is overdue, probes a quiet opponent (see `Liveness`)
+		ends the game through loadResponses once the opponent stopped answering, or a req went unanswered RETRIES times'''
+		if not (self.connected and self.opponent_node_name and self.id):
+			self.liveness.stop()
+			return
+		if unanswered := self._retransmit():
+			logging.warning(f'{self.opponent_node_name} never answered {unanswered.command} #{unanswered.seq}, giving up on it')
+			self._giveUp()
+			return
+		action = self.liveness.check(self.dispatcher.lastSent())
+		if action == PROBE:
+			probe = Request(COM.HEARTBEAT, {}, None, False, oneway=True)
+			self.liveness.probing(probe)
+			self._submit(probe)
+		elif action == GONE:
+			logging.warning(f'{self.opponent_node_name} stopped answering, giving up on it')
+			self._giveUp()
+	def _giveUp(self):
+		'''ends the game with the opponent unreachable, its match may still be resumed'''
+		self.opponentTimedOut = True
+		self.dispatcher.abandon()
+		for comm in self.alreadySent: self.resetAlreadySent(comm)
+		self._endGame('Connection lost')
+	def _retransmit(self) -> typing.Optional[Request]:
+		'''sends a req again once its response didn't come within the retransmission timeout, doubled for each retry
+		the opponent drops the copy as a duplicate, and sends its reply again if it already answered (see `Dispatcher.remember`)
+		answered probes don't vouch for a req, an opponent which keeps losing it or its response is as good as gone
+		@return: a req overdue after RETRIES retransmissions, None if there is none'''
+		now = time.monotonic()
+		for req in self.dispatcher.pending():
+			if req.resending or not req.sentAt or now - (req.resentAt or req.sentAt) < self.liveness.backoff(req.retries + 1): continue
+			if req.retries >= self.RETRIES: return req
+			logging.debug(f'no response to {req.command} #{req.seq}, sending it again ({req.retries + 1})')
+			self._resubmit(req)
+		return None
+	def resend(self):
+		'''sends the reqs awaiting a response again right away, e.g. to an opponent which restarted and lost them
+		they keep their seq, so the response still finds them'''
+		for req in self.dispatcher.pending():
+			if not req.resending: self._resubmit(req)
+	def _resubmit(self, req: Request):
+		req.retries += 1
+		req.resending = True
+		self._submit(req)
 	def disconnect(self):
-		if self.connected and self.opponent_node_name:
-			self.tryToSend(COM.DISCONNECT, {}, lambda res: self.repeatebleInit(), blocking=False, mustSend=True)
+		'''leaves the opponent, which ends its game, no answer is awaited'''
+		if self.connected and self.opponent_node_name and self.id:
+			self.sendTo(self.opponent_node_name, COM.DISCONNECT, {})
 		self.connected = False
 		self.opponent_node_name = None
 	def quit(self):
-		'''gracefully closes session (recvs last reqs, joins threads), COM.DISCONNECT must have been sent in advance'''
-		while not self.noPendingReqs():
+		'''gracefully closes session (recvs last reqs, joins threads), COM.DISCONNECT must have been sent in advance
+		responses which didn't come within the retransmission timeout are given up on'''
+		deadline = time.monotonic() + self.liveness.rtt.rto
+		while not self.noPendingReqs() and time.monotonic() < deadline:
 			self.loadResponses(_drain=True)
 		assert not self.connected, 'the session is still connected'
 		self.quitNowEvent.set()
+		self._stopWorkers()
+		self._closeTransport()
+		logging.info(f'Send queues: {self.scheduler.stats()}')
+	def _stopWorkers(self):
+		self.recvWakeup.set()
 		self.sendThread.join()
 		self.recvThread.join()
+	def _closeTransport(self):
+		self.transport.close()
 	def checkThreads(self):
 		if not self.sendThread.is_alive():
 			raise RuntimeError('Thread-Send ended')
@@ -114,165 +324,148 @@ class Session:
 			raise RuntimeError('Thread-Recv ended')
 	# request handling running in threads -------------------------------------
 	def sendLoop(self):
-		'''waits for reqs from main_thread, sends them and then:
-		- for non-blocking: immediately try to fetch response from incoming messages
-		- for blocking: move to Thread-Recv for polling'''
+		'''waits for reqs from main_thread and sends them, Thread-Recv hands them their responses
+		reqs queued within COALESCE_WINDOW of each other are sent together, so they can share a radio frame
+		while the airtime budget is spent reqs keep queueing, and are released by priority in bursts it allows'''
+		throttled = False
 		while not self.quitNowEvent.is_set():
+			if not len(self.scheduler):
+				try:
+					self.scheduler.push(self.reqQueue.get(timeout=1.))
+				except Empty:
+					continue
+				self._collectReqs(time.monotonic() + self.COALESCE_WINDOW)
+			if delay := self.scheduler.delay():
+				if not throttled: self.scheduler.noteThrottled()
+				throttled = True
+				self._collectReqs(time.monotonic() + min(delay, 1.))
+				continue
+			throttled = False
+			self._sendReqs(self.scheduler.popBurst(self._airtime))
+	def _collectReqs(self, deadline: float):
+		'''moves reqs arriving until deadline into the scheduler'''
+		while (remaining := deadline - time.monotonic()) > 0 and not self.quitNowEvent.is_set():
 			try:
-				req = self.reqQueue.get(timeout=1.)
-				self._sendReq(req)
-				if req.blocking:
-					self.requestsToRecv.put(req)
-				else:
-					# For non-blocking, check if response already arrived
-					self._tryFetchNonBlockingResponse(req)
+				self.scheduler.push(self.reqQueue.get(timeout=remaining))
 			except Empty:
-				pass
+				break
 	def recvLoop(self):
-		'''Poll meshcore for incoming messages and match them to pending requests'''
-		pendingReqs: list[Request] = []
+		'''Dispatch incoming messages to the requests awaiting them
+		messages are pushed by the transport when it supports it, otherwise the transport is polled
+		only the opponent's are routed, and the PAIRs and RESUMEs of any node, which pairing and resuming answer'''
 		while not self.quitNowEvent.is_set():
-			# Get pending blocking requests
-			try:
-				req = self.requestsToRecv.get(timeout=0.1)
-				pendingReqs.append(req)
-			except Empty:
-				pass
-			
-			# Poll meshcore for messages
-			messages = MeshCorePrimitives.receive_from_meshcore()
-			for id_val, command, payload in messages:
-				self.incoming_messages.put((id_val, command, payload))
-			
-			# Process incoming messages
-			# First, try to match to pending requests
-			self.tryReceiving(pendingReqs)
-			
-			# Then, process any unmatched messages that might be responses to non-blocking requests
-			# or unsolicited messages (like pairing requests)
-			self._processUnmatchedMessages()
-	
-	def tryReceiving(self, pendingReqs: list[Request]):
-		'''loops through pendingReqs and tries to match them with incoming messages'''
-		doneReqs = []
-		# Process all incoming messages
-		while not self.incoming_messages.empty():
-			id_val, command, payload = self.incoming_messages.get()
-			
-			# Find matching request
-			for req in pendingReqs:
-				if req.command == command and req.state == 1:
-					req.payload = payload
-					self._recvReq(req, id_val, command)
-					doneReqs.append(req)
-					break
-		
-		# Remove done requests
-		for r in doneReqs:
-			pendingReqs.remove(r)
-	
-	def _tryFetchNonBlockingResponse(self, req: Request):
-		'''Try to find and process response for non-blocking request'''
-		if req.state != 1:
-			return  # Not sent or already received
-		
-		# Check incoming messages for matching response
-		temp_messages = []
-		found = False
-		while not self.incoming_messages.empty():
-			id_val, command, payload = self.incoming_messages.get()
-			if command == req.command:
-				req.payload = payload
-				self._recvReq(req, id_val, command)
-				self.responseQueue.put(req)
-				found = True
-				break
+			pushed = self.transport.subscribe_messages(self._pushMessage)
+			if pushed:
+				# Sleep until something arrives, the timeout only bounds the quit latency
+				self.recvWakeup.wait(timeout=1.)
 			else:
-				temp_messages.append((id_val, command, payload))
-		
-		# Put back unmatched messages
-		for msg in temp_messages:
-			self.incoming_messages.put(msg)
-		
-		# If not found, put request back in recv queue for later polling
-		if not found and req.state == 1:
-			self.requestsToRecv.put(req)
-	
-	def _processUnmatchedMessages(self):
-		'''Process incoming messages that don't match pending blocking requests'''
-		# Check for non-blocking requests waiting in requestsToRecv
-		temp_reqs = []
-		while not self.requestsToRecv.empty():
-			try:
-				req = self.requestsToRecv.get_nowait()
-				temp_reqs.append(req)
-			except Empty:
-				break
-		
-		# Process messages against these requests
-		for req in temp_reqs:
-			if req.state == 1:  # Already sent
-				found = False
-				temp_messages = []
-				while not self.incoming_messages.empty():
-					id_val, command, payload = self.incoming_messages.get()
-					if command == req.command:
-						req.payload = payload
-						self._recvReq(req, id_val, command)
-						self.responseQueue.put(req)
-						found = True
-						break
-					else:
-						temp_messages.append((id_val, command, payload))
-				
-				# Put back unmatched messages
-				for msg in temp_messages:
+				# Poll the transport for messages
+				for msg in self.transport.receive():
 					self.incoming_messages.put(msg)
-				
-				# If not found, put request back
-				if not found:
-					self.requestsToRecv.put(req)
-			else:
-				# Not sent yet, put back
-				self.requestsToRecv.put(req)
+				self.recvWakeup.wait(timeout=0.1)
+			self.recvWakeup.clear()
+			for msg in iterQueue(self.incoming_messages):
+				self._routeMessage(msg)
+	
+	def _pushMessage(self, msg: tuple[int, str, dict]):
+		'''called by the transport as soon as a message arrives'''
+		self.incoming_messages.put(msg)
+		self.recvWakeup.set()
+	def _routeMessage(self, msg: tuple[int, str, dict]):
+		id_val, command, payload = msg
+		node = payload.get('node') if command in (COM.PAIR, COM.RESUME) else payload.pop('node', None)  # pairing and resuming answer it
+		fromOpponent = node is None or self.opponent_node_name in (None, node)  # None from a transport which doesn't tell
+		if not fromOpponent and command not in (COM.PAIR, COM.RESUME):
+			self.foreign += 1  # e.g. a late message of a former opponent, it mustn't end or drive our match
+			logging.debug(f'dropped {command} from {node}, not the opponent')
+			return
+		if fromOpponent: self.liveness.heard()  # even a duplicate shows the opponent is there
+		seq, re = payload.pop('seq', None), payload.pop('re', None)
+		if seq is not None:
+			if command in (COM.PAIR, COM.RESUME): # pairing or resuming starts over, the sender may have restarted
+				self.replayWindows.pop(id_val, None)
+				if fromOpponent: self.dispatcher.forgetReplies(self.opponent_node_name)
+			window = self.replayWindows.setdefault(id_val, ReplayWindow())
+			if not window.accept(seq):
+				self.duplicates += 1
+				logging.debug(f'dropped duplicate {command} #{seq} from {id_val}')
+				if fromOpponent and (reply := self.dispatcher.replyTo(self.opponent_node_name, seq)) and self.connected and self.opponent_node_name:
+					self._submit(Request(reply.command, reply.payload, None, False, oneway=True, re=seq))  # our reply got lost
+				return
+		if handler := self.unsolicitedHandlers.get(command):
+			handler(id_val, payload if re is None else {**payload, 're': re}, seq)
+		elif req := self.dispatcher.dispatch(msg, re, seq):
+			req.payload = payload
+			self._fetchResponse(req, id_val, command)
+		if self.onIncoming: self.onIncoming()
 	
+	def _onHeartbeat(self, id_val: int, payload: dict, seq: typing.Optional[int] = None):
+		'''answers a probe right away, an answer is a round trip sample'''
+		if 're' in payload: self.liveness.answered(payload['re'])
+		elif seq is not None and self.connected and self.opponent_node_name: self._submit(Request(COM.HEARTBEAT, {}, None, False, oneway=True, re=seq))
+	def _onDisconnect(self, id_val: int, payload: dict, seq: typing.Optional[int] = None):
+		'''the opponent left, other nodes' DISCONNECTs don't get here'''
+		if self.connected and self.opponent_node_name: self._endGame('Opponent left')
+	def _endGame(self, gameEndMsg: str):
+		'''hands loadResponses the end of the game as a response'''
+		self.responseQueue.put(Request(COM.DISCONNECT, {'stay_connected': False, 'opponent_disconnected': True, 'game_end_msg': gameEndMsg}, lambda res: None, False, state=2))
 	def _fetchResponse(self, req: Request, id_val: int, command: str):
 		'''Process received response'''
 		self._recvReq(req, id_val, command)
 		self.responseQueue.put(req)
 
 	# internals -------------------------------------
-	def _sendReq(self, req: Request) -> None:
-		assert req.state == 0
-		
-		# Determine recipient node name
-		if req.command == COM.CONNECT:
-			# CONNECT is now local initialization, no message sent
-			req.state = 1
-			return
-		
-		if not self.opponent_node_name:
-			logging.error(f'Cannot send {req.command}: no opponent node name set')
-			req.state = 2  # Mark as failed
+	def _sendReqs(self, reqs: list[Request]) -> None:
+		if not (toSend := self._prepareReqs(reqs)):
 			return
-		
 		try:
-			# Send via meshcore
-			success = MeshCorePrimitives.send_to_node(
-				self.opponent_node_name,
-				self.id,
-				req.command,
-				req.payload
-			)
+			# Send via the transport, small reqs share a frame
+			success = self.transport.send_messages(self.opponent_node_name, self.id, self._wireMessages(toSend))
+		except Exception as e:
+			logging.error(f'Error sending {[req.command for req in toSend]}: {e}')
+			success = False
+		self._finishReqs(toSend, success)
+	def _prepareReqs(self, reqs: list[Request]) -> list[Request]:
+		'''numbers the reqs which go on the wire and registers them for their responses
+		a req sent again keeps its number and registration, it's dropped if its response came meanwhile
+		@return: the reqs to send'''
+		toSend, resent = [], []
+		for req in reqs:
+			if req.retries:
+				req.resending = False
+				if req.state == 1 and self.opponent_node_name: resent.append(req)
+				continue
+			assert req.state == 0
 			
-			if success:
+			# Determine recipient node name
+			if req.command == COM.CONNECT:
+				# CONNECT is now local initialization, no message sent
 				req.state = 1
-			else:
-				logging.error(f'Failed to send {req.command} to {self.opponent_node_name}')
+			elif not self.opponent_node_name:
+				if req.oneway: logging.debug(f'dropped {req.command}, the opponent was left meanwhile')  # e.g. a state notification queued before disconnecting
+				else: logging.error(f'Cannot send {req.command}: no opponent node name set')
 				req.state = 2  # Mark as failed
-		except Exception as e:
-			logging.error(f'Error sending {req.command}: {e}')
-			req.state = 2  # Mark as failed
+			else:
+				toSend.append(req)
+		for req in toSend:
+			req.seq = next(self.seqCounter)
+			req.sentAt = time.monotonic()
+			req.state = 1  # before sending, the response may be dispatched before send_messages returns
+			if not req.oneway: self.dispatcher.expect(req)
+		for req in resent: req.resentAt = time.monotonic()
+		return resent + toSend
+	def _airtime(self, req: Request) -> float:
+		'''estimated airtime of req, the scheduler fits a burst into the budget with it'''
+		return message_airtime_ms(self.id or 0, req.command, req.payload)
+	def _wireMessages(self, reqs: list[Request]) -> list[tuple[str, dict]]:
+		return [(req.command, {**req.payload, 'seq': req.seq, **({'re': req.re} if req.re is not None else {})}) for req in reqs]
+	def _finishReqs(self, toSend: list[Request], success: bool):
+		if not success:
+			logging.error(f'Failed to send {[req.command for req in toSend]} to {self.opponent_node_name}')
+		for req in toSend:
+			if req.retries: continue  # still pending, it's retried again later
+			if not success: self.dispatcher.forget(req)
+			if not success or req.oneway: req.state = 2  # Mark as failed, or done
 	
 	def _recvReq(self, req: Request, id_val: int, command: str):
 		assert req.state == 1
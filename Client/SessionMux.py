@@ -0,0 +1,184 @@
+'''
+Many sessions sharing one radio, so a single gateway node can host many matches at once.
+
+Every opponent gets its own `MuxedSession`, which the game (or a headless
+player) uses like a `Session`: its own requests, `alreadySent` map,
+dispatcher and sequence numbers. The multiplexer owns the transport and the
+two networking threads for all of them:
+	Thread-MuxSend  sends the sessions' reqs, one session's batch per turn
+	Thread-MuxRecv  routes inbound messages to the session of their sender node
+
+Turns go round robin among the sessions with queued reqs, except that a
+session holding a more urgent priority class (see `Scheduling`) goes
+first, so a shot of one match overtakes the readiness polls of the others.
+All sessions spend the same airtime budget.
+'''
+import time
+import logging
+import threading
+import typing
+from queue import Queue, Empty
+from collections import deque
+
+from Shared.Transport import Transport, create_transport
+from Shared.Enums import COM
+from Shared.Helpers import runFuncLogged
+from .Scheduling import SendScheduler, AirtimeBudget, frame_airtime_ms
+from .Session import Session, Request, iterQueue
+
+class MuxedSession(Session):
+	'''a session whose networking is done by its SessionMux, talks to one opponent'''
+	def __init__(self, mux: 'SessionMux'):
+		self.mux = mux
+		super().__init__(mux.transport)
+
+	# session hooks -----------------------------
+	def _attachTransport(self, transport: Transport):
+		self.transport = transport
+		self.scheduler = SendScheduler(self.mux.budget)  # per session priorities and metrics, shared budget
+	def _startWorkers(self):
+		self.mux._attach(self)
+	def _stopWorkers(self):
+		self.mux._detach(self)
+	def _closeTransport(self):
+		pass  # the mux's, other sessions still use it
+	def checkThreads(self):
+		self.mux.checkThreads()
+	def _submit(self, req: Request):
+		self.mux.reqQueue.put((self, req))
+
+class SessionMux:
+	COALESCE_WINDOW = Session.COALESCE_WINDOW
+
+	def __init__(self, transport: Transport=None):
+		self.transport: Transport = transport or create_transport()
+		self.transport.tag_senders = True
+		self.transport.on_frames_sent = self._chargeFrames
+		self.budget = AirtimeBudget.fromArgs() if self.transport.needs_radio else None
+		self.sessions: list[MuxedSession] = []
+		self._byNode: dict[str, MuxedSession] = {}  # opponent node -> session, rebuilt when it misses
+		self._lock = threading.Lock()
+		self.reqQueue: Queue[tuple[MuxedSession, Request]] = Queue()
+		self._ready: deque[MuxedSession] = deque()  # sessions with queued reqs, in turn order, only Thread-MuxSend touches it
+		self.incoming_messages: Queue[tuple[int, str, dict]] = Queue()
+		self.recvWakeup = threading.Event()
+		self.quitNowEvent = threading.Event()
+		self.lobby: typing.Optional[typing.Callable[[tuple[int, str, dict]], None]] = None # gets messages of nodes no session plays with, called on Thread-MuxRecv
+		self.unrouted = 0  # messages nobody took
+		self.throttled = 0  # times sending had to wait for the budget
+		self.sendThread = threading.Thread(target=lambda: runFuncLogged(self.sendLoop), name='Thread-MuxSend', daemon=True)
+		self.sendThread.start()
+		self.recvThread = threading.Thread(target=lambda: runFuncLogged(self.recvLoop), name='Thread-MuxRecv', daemon=True)
+		self.recvThread.start()
+
+	# api ---------------------------------------
+	def open(self) -> MuxedSession:
+		'''a new session, set its id and opponent_node_name to play'''
+		return MuxedSession(self)
+	def quit(self):
+		'''stops the networking, the sessions should have quit before'''
+		self.quitNowEvent.set()
+		self.recvWakeup.set()
+		self.sendThread.join()
+		self.recvThread.join()
+		self.transport.close()
+		logging.info(f'Session multiplexer: {self.stats()}')
+	def checkThreads(self):
+		if not self.sendThread.is_alive():
+			raise RuntimeError('Thread-MuxSend ended')
+		if not self.recvThread.is_alive():
+			raise RuntimeError('Thread-MuxRecv ended')
+	def stats(self) -> dict:
+		with self._lock:
+			sessions = list(self.sessions)
+		return {
+			'sessions': len(sessions), 'unrouted': self.unrouted, 'throttled': self.throttled,
+			'frames': sum(s.scheduler.frames for s in sessions), 'airtime_ms': sum(s.scheduler.airtimeMs for s in sessions),
+			'budget_ms': self.budget.tokens if self.budget else None,
+		}
+
+	def _attach(self, session: MuxedSession):
+		with self._lock:
+			self.sessions.append(session)
+	def _detach(self, session: MuxedSession):
+		with self._lock:
+			if session in self.sessions: self.sessions.remove(session)
+			self._byNode = {}
+	def _sessionFor(self, node: typing.Optional[str], command: str) -> typing.Optional[MuxedSession]:
+		with self._lock:
+			session = self._byNode.get(node)
+			if session is None or session.opponent_node_name != node:
+				self._byNode = {s.opponent_node_name: s for s in self.sessions if s.opponent_node_name}
+				session = self._byNode.get(node)
+			if session is None and command == COM.PAIR:
+				# someone new, the first session looking for an opponent may take it
+				session = next((s for s in self.sessions if not s.opponent_node_name and COM.PAIR in s.unsolicitedHandlers), None)
+			return session
+	def _chargeFrames(self, node_name: str, frames: list[str]):
+		'''Transport.on_frames_sent hook, the frames count for the session playing with node_name'''
+		session = self._sessionFor(node_name, '')
+		if session is not None: session.scheduler.chargeFrames(node_name, frames)
+		elif self.budget: self.budget.charge(sum(map(frame_airtime_ms, frames)))  # e.g. probes of pairing
+
+	# threads -----------------------------------
+	def sendLoop(self):
+		'''Session.sendLoop for all the sessions, a session sends a burst of its queued reqs in its turn'''
+		throttled = False
+		while not self.quitNowEvent.is_set():
+			if not self._ready:
+				try:
+					self._queueReq(*self.reqQueue.get(timeout=1.))
+				except Empty:
+					continue
+				self._collectReqs(time.monotonic() + self.COALESCE_WINDOW)
+			if delay := self.budget.delay() if self.budget else 0.:
+				if not throttled: self.throttled += 1
+				throttled = True
+				self._collectReqs(time.monotonic() + min(delay, 1.))
+				continue
+			throttled = False
+			for session, req in iterQueue(self.reqQueue): self._queueReq(session, req)
+			session = self._nextTurn()
+			session._sendReqs(session.scheduler.popBurst(session._airtime))
+			if len(session.scheduler): self._ready.append(session)  # the rest waits for airtime
+	def _queueReq(self, session: MuxedSession, req: Request):
+		if not len(session.scheduler): self._ready.append(session)
+		session.scheduler.push(req)
+	def _collectReqs(self, deadline: float):
+		while (remaining := deadline - time.monotonic()) > 0 and not self.quitNowEvent.is_set():
+			try:
+				self._queueReq(*self.reqQueue.get(timeout=remaining))
+			except Empty:
+				break
+	def _nextTurn(self) -> MuxedSession:
+		'''the longest waiting session among those with the most urgent reqs'''
+		turn = min(range(len(self._ready)), key=lambda i: (self._ready[i].scheduler.headClass(), i))
+		session = self._ready[turn]
+		del self._ready[turn]
+		return session
+
+	def recvLoop(self):
+		'''Session.recvLoop for all the sessions'''
+		while not self.quitNowEvent.is_set():
+			if self.transport.subscribe_messages(self._pushMessage):
+				self.recvWakeup.wait(timeout=1.)
+			else:
+				for msg in self.transport.receive():
+					self.incoming_messages.put(msg)
+				self.recvWakeup.wait(timeout=0.1)
+			self.recvWakeup.clear()
+			for msg in iterQueue(self.incoming_messages):
+				self._routeMessage(msg)
+	def _pushMessage(self, msg: tuple[int, str, dict]):
+		self.incoming_messages.put(msg)
+		self.recvWakeup.set()
+	def _routeMessage(self, msg: tuple[int, str, dict]):
+		id_val, command, payload = msg
+		node = payload.get('node')  # the session strips it, except from PAIR and RESUME
+		if session := self._sessionFor(node, command):
+			session._routeMessage(msg)
+		elif self.lobby:
+			self.lobby(msg)
+		else:
+			self.unrouted += 1
+			logging.debug(f'no session plays with {node}, dropped {command}')
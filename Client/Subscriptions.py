@@ -0,0 +1,85 @@
+'''
+Peers telling each other about changes of their game state instead of being polled for it.
+
+Each side publishes its readiness, the player it sees on turn and whether
+it wants a rematch. A STATE message goes out only when one of them changes,
+plus a heartbeat repeating the current state every HEARTBEAT_INTERVAL,
+which also repairs a lost notification. The state is versioned, anything
+not newer than what is known is ignored, and so is the STATE of any
+other player than the opponent.
+
+STATE payload:
+	{'version', 'ready', 'on_turn', 'rematch_desired'}
+'''
+import time
+import threading
+from typing import Optional
+
+from Shared.Enums import COM
+from .Session import Session
+
+class StateSubscription:
+	'''one match's state exchange, own state is published from the main thread, the peer's arrives on Thread-Recv'''
+	HEARTBEAT_INTERVAL = 30.  # s
+	DEFAULTS = {'ready': False, 'on_turn': 0, 'rematch_desired': False}
+
+	def __init__(self, session: Session, peerId: int):
+		self.session = session
+		self.peerId = peerId  # the opponent's player id
+		self.own = dict(self.DEFAULTS)
+		self.version = 0
+		self.lastSent: Optional[float] = None
+		self.peer = dict(self.DEFAULTS)
+		self.peerVersion = 0
+		self._handedOut = 0  # peerVersion last returned by changes()
+		self._lock = threading.Lock()
+		self.notifications = 0
+		self.heartbeats = 0
+
+	# api ---------------------------------------
+	def start(self):
+		'''subscribes to the peer's state and announces ours'''
+		self.session.unsolicitedHandlers[COM.STATE] = self.onState
+		self.version += 1
+		self._send()
+	def stop(self):
+		if self.session.unsolicitedHandlers.get(COM.STATE) == self.onState:
+			del self.session.unsolicitedHandlers[COM.STATE]
+	def publish(self, **fields):
+		'''sets own state fields, the peer is notified if any of them changed'''
+		if all(self.own[key] == value for key, value in fields.items()): return
+		self.own.update(fields)
+		self.version += 1
+		self.notifications += 1
+		self._send()
+	def tick(self):
+		'''sends the heartbeat when it's due, call it regularly'''
+		if self.lastSent is not None and time.monotonic() - self.lastSent >= self.HEARTBEAT_INTERVAL:
+			self.heartbeats += 1
+			self._send()
+	def peerRestarted(self):
+		'''the peer resumed the match after a restart, its versions start over, ours is announced again'''
+		with self._lock:
+			self.peerVersion = self._handedOut = 0
+		self.version += 1
+		self._send()
+	def changes(self) -> Optional[dict]:
+		'''the peer's state if it changed since the last call'''
+		with self._lock:
+			if self.peerVersion == self._handedOut: return None
+			self._handedOut = self.peerVersion
+			return dict(self.peer)
+
+	def onState(self, id_val: int, payload: dict, seq: Optional[int] = None):
+		'''session unsolicited handler'''
+		if id_val != self.peerId: return
+		with self._lock:
+			if payload.get('version', 0) <= self.peerVersion: return
+			self.peerVersion = payload['version']
+			self.peer = {key: payload.get(key, default) for key, default in self.DEFAULTS.items()}
+
+	# internals ---------------------------------
+	def _send(self):
+		self.lastSent = time.monotonic()
+		if self.session.connected and self.session.opponent_node_name:
+			self.session.notify(COM.STATE, {'version': self.version, **self.own})
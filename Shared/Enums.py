@@ -36,3 +36,6 @@ class COM(str, Enum):
 
 	DISCONNECT = '!DISCONNECT'
 	ERROR = '!ERROR'
+	STATE = '!STATE'
+	RESUME = '!RESUME'
+	HEARTBEAT = '!HEARTBEAT'
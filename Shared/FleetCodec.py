@@ -0,0 +1,151 @@
+"""
+Bitboard representation and encoding of a fleet layout.
+
+Ships never touch each other, not even diagonally, so the 10x10 occupancy
+bitboard already implies the ships: every run of occupied cells is one
+ship. The only thing it doesn't tell is the orientation of one-cell ships.
+
+Encoded fleet:
+	13 bytes   occupancy bitboard, bit y*10+x, little endian
+	n bytes    orientation bits of the one-cell ships (1 = horizontal)
+	m bytes    hit bits of the occupied cells, omitted when nothing is hit
+
+Both bit strings follow the scan order (row by row), which is also the
+canonical order of the ships. A whole layout takes 14 bytes, 17 with hits.
+"""
+from typing import Optional, Tuple, List, Dict
+
+GRID_SIZE = 10
+CELLS = GRID_SIZE * GRID_SIZE
+BOARD_BYTES = -(-CELLS // 8)
+FULL = (1 << CELLS) - 1
+FIRST_COLUMN = sum(1 << (y * GRID_SIZE) for y in range(GRID_SIZE))
+LAST_COLUMN = FIRST_COLUMN << (GRID_SIZE - 1)
+
+class FleetError(ValueError):
+	pass
+
+def _cells(pos, size: int, horizontal: bool) -> List[int]:
+	x, y = pos
+	return [(y + i * (not horizontal)) * GRID_SIZE + x + i * horizontal for i in range(size)]
+
+def _surroundings(board: int) -> int:
+	'''board grown by one cell in all 8 directions'''
+	board = (board | (board << 1 & ~FIRST_COLUMN) | (board >> 1 & ~LAST_COLUMN)) & FULL  # cell 99 grown right must not wrap to row 9 below
+	return (board | board << GRID_SIZE | board >> GRID_SIZE) & FULL
+
+class Fleet:
+	"""Ship dicts as used by `Ship.asDict` over an occupancy bitboard
+
+	Ships are kept in canonical (scan) order. Each occupied cell maps to its
+	ship, so resolving a shot doesn't look at the other ships."""
+	def __init__(self):
+		self.ships: List[dict] = []
+		self.occupied = 0  # bitboard of ship cells
+		self.hits = 0  # bitboard of hit ship cells
+		self._owner: Dict[int, int] = {}  # cell -> index into ships
+
+	@ classmethod
+	def from_dicts(cls, dicts: List[dict]) -> 'Fleet':
+		"""Fleet of ship dicts, raises FleetError if ships overlap, touch or leave the grid"""
+		fleet = cls()
+		placed = []
+		for d in dicts:
+			size, horizontal = d['size'], d['horizontal']
+			if size < 1 or len(d['hitted']) != size:
+				raise FleetError(f'ship at {d["pos"]} has {len(d["hitted"])} hit flags for size {size}')
+			cells = _cells(d['pos'], size, horizontal)
+			x, y = d['pos']
+			if not (0 <= x and 0 <= y and x + (size - 1) * horizontal < GRID_SIZE and y + (size - 1) * (not horizontal) < GRID_SIZE):
+				raise FleetError(f'ship at {d["pos"]} leaves the grid')
+			placed.append((cells[0], d, cells))
+		for first, d, cells in sorted(placed, key=lambda p: p[0]):
+			mask = sum(1 << cell for cell in cells)
+			if _surroundings(mask) & fleet.occupied:
+				raise FleetError(f'ship at {d["pos"]} touches another one')
+			index = len(fleet.ships)
+			for cell in cells: fleet._owner[cell] = index
+			fleet.occupied |= mask
+			fleet.hits |= sum(1 << cell for cell, hit in zip(cells, d['hitted']) if hit)
+			fleet.ships.append({'pos': list(d['pos']), 'size': d['size'], 'horizontal': d['horizontal'], 'hitted': list(d['hitted'])})
+		return fleet
+
+	def to_dicts(self) -> List[dict]:
+		return [{**d, 'pos': list(d['pos']), 'hitted': list(d['hitted'])} for d in self.ships]
+
+	def mask(self, index: int) -> int:
+		'''bitboard of the cells of ship index'''
+		d = self.ships[index]
+		return sum(1 << cell for cell in _cells(d['pos'], d['size'], d['horizontal']))
+
+	def shoot(self, pos) -> Tuple[bool, Optional[dict], bool]:
+		"""Mark a shot, returns (hit, the ship if this sunk it, whole fleet sunk)"""
+		cell = pos[1] * GRID_SIZE + pos[0]
+		index = self._owner.get(cell)
+		if index is None:
+			return False, None, False
+		ship = self.ships[index]
+		self.hits |= 1 << cell
+		x, y = ship['pos']
+		ship['hitted'][pos[0] - x if ship['horizontal'] else pos[1] - y] = True
+		return True, ship if all(ship['hitted']) else None, self.all_sunk()
+
+	def all_sunk(self) -> bool:
+		return self.hits == self.occupied
+
+	# wire format -------------------------------------------
+	def encode(self) -> bytes:
+		singles = [d['horizontal'] for d in self.ships if d['size'] == 1]
+		out = self.occupied.to_bytes(BOARD_BYTES, 'little') + _pack_bits(singles)
+		if self.hits:
+			out += _pack_bits([bool(self.hits >> cell & 1) for cell in _bits(self.occupied)])
+		return out
+
+	@ classmethod
+	def decode(cls, data: bytes) -> 'Fleet':
+		"""Inverse of `encode`, raises FleetError on malformed input"""
+		if len(data) < BOARD_BYTES: raise FleetError('truncated bitboard')
+		occupied = int.from_bytes(data[:BOARD_BYTES], 'little')
+		if occupied >> CELLS: raise FleetError('bits outside the grid')
+		runs, seen, cells = [], 0, _bits(occupied)
+		for cell in cells:
+			if seen >> cell & 1: continue
+			x = cell % GRID_SIZE
+			horizontal = x + 1 < GRID_SIZE and bool(occupied >> (cell + 1) & 1)
+			step = 1 if horizontal else GRID_SIZE
+			size = 1
+			while cell + size * step < CELLS and (horizontal and x + size < GRID_SIZE or not horizontal) and occupied >> (cell + size * step) & 1:
+				size += 1
+			for i in range(size): seen |= 1 << (cell + i * step)
+			runs.append((cell, size, horizontal))
+		singleCount = sum(size == 1 for _, size, _ in runs)
+		i = BOARD_BYTES + -(-singleCount // 8)
+		if len(data) < i: raise FleetError('truncated orientation bits')
+		singles = iter(_unpack_bits(data[BOARD_BYTES:i], singleCount))
+		cellCount = len(cells)
+		if len(data) == i: hitBits = [False] * cellCount
+		elif len(data) == i + -(-cellCount // 8): hitBits = _unpack_bits(data[i:], cellCount)
+		else: raise FleetError('unexpected fleet length')
+		hitOf = dict(zip(cells, hitBits))
+		dicts = []
+		for cell, size, horizontal in runs:
+			if size == 1: horizontal = next(singles)
+			pos = [cell % GRID_SIZE, cell // GRID_SIZE]
+			dicts.append({'pos': pos, 'size': size, 'horizontal': horizontal, 'hitted': [hitOf[c] for c in _cells(pos, size, horizontal)]})
+		return cls.from_dicts(dicts)
+
+def _bits(board: int) -> List[int]:
+	'''indices of the set bits, ascending'''
+	cells = []
+	while board:
+		low = board & -board
+		cells.append(low.bit_length() - 1)
+		board ^= low
+	return cells
+
+def _pack_bits(bits: List[bool]) -> bytes:
+	return sum(1 << i for i, bit in enumerate(bits) if bit).to_bytes(-(-len(bits) // 8), 'little')
+
+def _unpack_bits(data: bytes, count: int) -> List[bool]:
+	n = int.from_bytes(data, 'little')
+	return [bool(n >> i & 1) for i in range(count)]
@@ -0,0 +1,199 @@
+"""
+Splitting of encoded messages which don't fit into one mesh frame.
+
+The message bytes are base85-armoured once, and the armoured text is cut
+into slices whose size is derived once from the frame size. A fragment
+frame is `FRAGMENT_MARKER`, a 5-char armoured header (message id, fragment
+index, fragment count) and one slice, so every fragment except the last is
+exactly full and nothing is re-encoded or resized.
+
+On the receiving side `ReassemblyBuffer` puts the fragments back together.
+"""
+import base64
+import random
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple, List, Callable
+
+FRAGMENT_MARKER = '%'
+HEADER = struct.Struct('>HBB')  # message id, fragment index, fragment count
+HEADER_CHARS = 5  # base85 of the 4 header bytes
+MAX_FRAGMENTS = 255
+
+Fragment = Tuple[int, int, int, bytes]  # message id, index, count, armoured slice
+# (sender, message id, count, bitmap of received indices, index which just arrived)
+FragmentListener = Callable[[str, int, int, int, int], None]
+
+class Fragmenter:
+	def __init__(self, frame_size: int):
+		self.frame_size = frame_size
+		self.data_chars = frame_size - len(FRAGMENT_MARKER) - HEADER_CHARS
+		assert self.data_chars > 0, f'frame size {frame_size} too small for fragment header'
+		self._lock = threading.Lock()
+		self._next_id = random.getrandbits(16)
+
+	def new_message_id(self) -> int:
+		with self._lock:
+			msg_id = self._next_id
+			self._next_id = (self._next_id + 1) & 0xFFFF
+		return msg_id
+
+	def fragment(self, data: bytes, msg_id: Optional[int] = None) -> List[str]:
+		"""Split message bytes into the minimal number of fragment frames"""
+		text = base64.b85encode(data).decode('ascii')
+		size = self.data_chars
+		total = -(-len(text) // size)
+		if total > MAX_FRAGMENTS:
+			raise ValueError(f'message of {len(data)} bytes needs more than {MAX_FRAGMENTS} fragments')
+		if msg_id is None:
+			msg_id = self.new_message_id()
+		return [FRAGMENT_MARKER + base64.b85encode(HEADER.pack(msg_id, i, total)).decode('ascii') + text[i*size:(i+1)*size] for i in range(total)]
+
+def parse_fragment(text: str) -> Optional[Fragment]:
+	"""Parse a fragment frame, None if text isn't one"""
+	if not text.startswith(FRAGMENT_MARKER) or len(text) < len(FRAGMENT_MARKER) + HEADER_CHARS: return None
+	start = len(FRAGMENT_MARKER)
+	try:
+		msg_id, index, total = HEADER.unpack(base64.b85decode(text[start:start + HEADER_CHARS]))
+		data = text[start + HEADER_CHARS:].encode('ascii')
+	except (ValueError, struct.error):
+		return None
+	if index >= total: return None
+	return msg_id, index, total, data
+
+def join_fragments(slices: List[bytes]) -> Optional[bytes]:
+	"""Message bytes from the armoured slices of all fragments in order, None if they are corrupted"""
+	try:
+		return base64.b85decode(b''.join(slices))
+	except ValueError:
+		return None
+
+class _Partial:
+	__slots__ = ('created', 'total', 'received', 'count', 'buf', 'last_len')
+	def __init__(self, created: float, total: int, data_chars: int):
+		self.created = created
+		self.total = total
+		self.received = 0  # bitmap of received fragment indices
+		self.count = 0
+		self.buf = bytearray(total * data_chars)
+		self.last_len = data_chars
+
+class ReassemblyBuffer:
+	"""Collects fragments until their message is complete
+
+	Partial messages are kept in arrival order, so expiry only ever looks at
+	the oldest entries. Each message gets one preallocated buffer which the
+	fragments are copied into. The store is capped in messages and bytes, the
+	oldest partial message is evicted to make room.
+
+	`listener`, if set, is told the reception state after every accepted or
+	duplicate fragment (outside the lock), that's what acknowledgements are
+	built from."""
+	def __init__(self, data_chars: int, timeout: float = 300, max_messages: int = 32, max_bytes: int = 64 * 1024):
+		self.data_chars = data_chars
+		self.timeout = timeout
+		self.max_messages = max_messages
+		self.max_bytes = max_bytes
+		self._partials: OrderedDict[Tuple[str, int], _Partial] = OrderedDict()
+		self._done: OrderedDict[Tuple[str, int], Tuple[float, int]] = OrderedDict()  # recently completed -> (time, count), to drop late duplicates
+		self.listener: Optional[FragmentListener] = None
+		self._bytes = 0
+		self._lock = threading.Lock()
+		self.completed = 0
+		self.expired = 0
+		self.dropped = 0  # evicted by the caps or malformed
+		self.duplicates = 0
+
+	def add(self, sender: str, fragment: Fragment, now: Optional[float] = None) -> Optional[bytes]:
+		"""Store a fragment, returns the message bytes once all its fragments arrived"""
+		msg_id, index, total, data = fragment
+		state = self._add((sender, msg_id), fragment, time.monotonic() if now is None else now)
+		if state is None:
+			return None
+		received, partial = state
+		if self.listener: self.listener(sender, msg_id, total, received, index)
+		if partial is None:
+			return None
+		del partial.buf[(total - 1) * self.data_chars + partial.last_len:]
+		return join_fragments([partial.buf])
+
+	def _add(self, key: Tuple[str, int], fragment: Fragment, now: float) -> Optional[Tuple[int, Optional[_Partial]]]:
+		'''@return: (received bitmap, the partial if this fragment completed it), None if the fragment was dropped
+		completion is decided under the lock, fragments of one message may arrive on several threads'''
+		msg_id, index, total, data = fragment
+		size = self.data_chars
+		with self._lock:
+			self._expire(now)
+			partial = self._partials.get(key)
+			if partial is None:
+				if key in self._done:
+					self.duplicates += 1
+					return (1 << self._done[key][1]) - 1, None
+				need = total * size
+				if need > self.max_bytes:
+					self.dropped += 1
+					return None
+				while self._partials and (len(self._partials) >= self.max_messages or self._bytes + need > self.max_bytes):
+					self._pop_oldest()
+					self.dropped += 1
+				partial = self._partials[key] = _Partial(now, total, size)
+				self._bytes += need
+			elif partial.total != total:
+				self._remove(key)
+				self.dropped += 1
+				return None
+
+			bit = 1 << index
+			if partial.received & bit:
+				self.duplicates += 1
+				return partial.received, None
+			if len(data) > size or (index < total - 1 and len(data) != size):
+				self._remove(key)  # sender uses a different frame size, can't be placed
+				self.dropped += 1
+				return None
+			partial.buf[index*size:index*size + len(data)] = data
+			if index == total - 1: partial.last_len = len(data)
+			partial.received |= bit
+			partial.count += 1
+			if partial.count == total:
+				self._remove(key)
+				self.completed += 1
+				self._done[key] = (now, total)
+				if len(self._done) > 4 * self.max_messages: self._done.popitem(last=False)
+				return partial.received, partial
+			return partial.received, None
+
+	def missing(self, sender: str, msg_id: int) -> Optional[List[int]]:
+		"""indices of fragments not yet received, None if the message isn't pending"""
+		with self._lock:
+			partial = self._partials.get((sender, msg_id))
+			if partial is None: return None
+			return [i for i in range(partial.total) if not partial.received >> i & 1]
+
+	def expire(self, now: Optional[float] = None):
+		with self._lock:
+			self._expire(time.monotonic() if now is None else now)
+
+	def stats(self) -> dict:
+		with self._lock:
+			return {'pending': len(self._partials), 'pending_bytes': self._bytes, 'completed': self.completed,
+				'expired': self.expired, 'dropped': self.dropped, 'duplicates': self.duplicates}
+
+	def _expire(self, now: float):
+		while self._done and now - next(iter(self._done.values()))[0] > self.timeout:
+			self._done.popitem(last=False)
+		while self._partials:
+			partial = next(iter(self._partials.values()))
+			if now - partial.created <= self.timeout: return
+			self._pop_oldest()
+			self.expired += 1
+
+	def _pop_oldest(self):
+		key, partial = self._partials.popitem(last=False)
+		self._bytes -= len(partial.buf)
+
+	def _remove(self, key):
+		partial = self._partials.pop(key)
+		self._bytes -= len(partial.buf)
@@ -0,0 +1,185 @@
+"""
+Append-only binary journal of the frames a node sends and receives.
+
+Turned on by the '--journal PATH' command line flag. Writing a record only
+packs a fixed header and copies the bytes, nothing is formatted, so it can
+stay on for long soak runs. The reader maps the file and walks the headers,
+filters on them, and decodes peer names and frames only for the records it
+returns.
+
+File layout: MAGIC, then records of
+	header  RECORD: time.time(), direction, opcode, peer length, frame length
+	peer    utf-8 node name
+	frame   the text frame as it went over the air, utf-8
+
+The opcode is the index in `COM` (as on the wire, `WireCodec.OPCODES`) of
+the first message of the frame, NO_COMMAND for ARQ control frames,
+retransmissions and fragments which didn't complete a message yet.
+A record cut short by a crash ends the journal.
+
+NOTE records carry no frame but a JSON note of the node itself, the game
+journals the state of both grids at the end of every match, which is what
+`Client.Replay` checks a replay against.
+"""
+import os
+import mmap
+import time
+import atexit
+import struct
+import argparse
+import threading
+from typing import Optional, Iterator, NamedTuple, Iterable, Dict
+
+from Shared.Enums import COM
+from Shared.WireCodec import OPCODES
+
+MAGIC = b'BSJ1'
+RECORD = struct.Struct('<dBBBH')
+SENT, RECEIVED, NOTE = 0, 1, 2
+NO_COMMAND = 0xFF
+FLUSH_EVERY = 64  # records buffered before they are written out
+
+OPCODE_OF: Dict[str, int] = {com: i for i, com in enumerate(OPCODES)}
+
+class JournalError(ValueError):
+	pass
+
+class Record(NamedTuple):
+	time: float
+	direction: int
+	command: Optional[COM]
+	peer: str
+	frame: str
+
+class JournalWriter:
+	"""Appends records, safe to use from multiple threads"""
+	def __init__(self, path: str):
+		self.path = path
+		with open(path, 'ab+') as f:
+			f.seek(0)
+			head = f.read(len(MAGIC))
+			if not head: f.write(MAGIC)
+			elif head != MAGIC: raise JournalError(f'{path} is not a journal')
+		self._file = open(path, 'ab')
+		self._lock = threading.Lock()
+		self._peers: Dict[str, bytes] = {}  # node name -> its encoded form, names repeat on every record
+		self._unflushed = 0
+		self.records = 0
+
+	def record(self, direction: int, peer: str, frame: str, opcode: int = NO_COMMAND):
+		peer_bytes = self._peers.get(peer)
+		if peer_bytes is None: peer_bytes = self._peers[peer] = peer.encode('utf-8')[:255]
+		data = frame.encode('utf-8')
+		with self._lock:
+			if self._file.closed: return
+			self._file.write(RECORD.pack(time.time(), direction, opcode, len(peer_bytes), len(data)) + peer_bytes + data)
+			self.records += 1
+			self._unflushed += 1
+			if self._unflushed >= FLUSH_EVERY:
+				self._file.flush()
+				self._unflushed = 0
+
+	def flush(self):
+		with self._lock:
+			if not self._file.closed: self._file.flush()
+			self._unflushed = 0
+
+	def close(self):
+		with self._lock:
+			self._file.close()
+
+_writers: Dict[str, JournalWriter] = {}
+_writers_lock = threading.Lock()
+
+def open_journal(path: str) -> JournalWriter:
+	"""The writer of path, transports of one process journal into the same one"""
+	path = os.path.abspath(path)
+	with _writers_lock:
+		if path not in _writers:
+			_writers[path] = JournalWriter(path)
+			atexit.register(_writers[path].close)
+		return _writers[path]
+
+def journal_from_args() -> Optional[JournalWriter]:
+	"""The journal given by the '--journal PATH' command line flag, None without it"""
+	parser = argparse.ArgumentParser(add_help=False)
+	parser.add_argument('--journal')
+	args, unknown = parser.parse_known_args()
+	return open_journal(args.journal) if args.journal else None
+
+class JournalReader:
+	"""Memory mapped journal, iterate it or use `records` to filter"""
+	def __init__(self, path: str):
+		self.path = path
+		self._file = open(path, 'rb')
+		size = os.fstat(self._file.fileno()).st_size
+		self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+		if self._map[:len(MAGIC)] != MAGIC:
+			self.close()
+			raise JournalError(f'{path} is not a journal')
+
+	def __enter__(self) -> 'JournalReader':
+		return self
+	def __exit__(self, *exc):
+		self.close()
+	def close(self):
+		if isinstance(self._map, mmap.mmap): self._map.close()
+		self._file.close()
+
+	def __iter__(self) -> Iterator[Record]:
+		return self.records()
+
+	def records(self, direction: Optional[int] = None, peer: Optional[str] = None, commands: Optional[Iterable[COM]] = None,
+			since: Optional[float] = None, until: Optional[float] = None) -> Iterator[Record]:
+		"""Records in file order, matching all the given filters"""
+		data = self._map
+		for stamp, dir_, opcode, start, peer_end, end in self._matches(direction, peer, commands, since, until):
+			yield Record(stamp, dir_, OPCODES[opcode] if opcode < len(OPCODES) else None,
+				data[start:peer_end].decode('utf-8', 'replace'), data[peer_end:end].decode('utf-8', 'replace'))
+
+	def count(self, direction: Optional[int] = None, peer: Optional[str] = None, commands: Optional[Iterable[COM]] = None,
+			since: Optional[float] = None, until: Optional[float] = None) -> int:
+		"""Number of records `records` would return, without decoding them"""
+		return sum(1 for _ in self._matches(direction, peer, commands, since, until))
+
+	def _matches(self, direction, peer, commands, since, until) -> Iterator[tuple]:
+		"""(time, direction, opcode, peer offset, frame offset, end offset) of the matching records"""
+		data = self._map
+		size = len(data)
+		peer_bytes = peer.encode('utf-8')[:255] if peer is not None else None
+		opcodes = {OPCODE_OF[command] for command in commands} if commands is not None else None
+		unpack, header = RECORD.unpack_from, RECORD.size
+		offset = len(MAGIC)
+		while offset + header <= size:
+			stamp, dir_, opcode, peer_len, frame_len = unpack(data, offset)
+			start = offset + header
+			peer_end = start + peer_len
+			offset = peer_end + frame_len
+			if offset > size: break  # cut short
+			if direction is not None and dir_ != direction: continue
+			if opcodes is not None and opcode not in opcodes: continue
+			if since is not None and stamp < since: continue
+			if until is not None and stamp > until: continue
+			if peer_bytes is not None and data[start:peer_end] != peer_bytes: continue
+			yield stamp, dir_, opcode, start, peer_end, offset
+
+def main():
+	parser = argparse.ArgumentParser('Journal', description='list or count the records of a journal')
+	parser.add_argument('path')
+	parser.add_argument('--peer')
+	parser.add_argument('--command', action='append', choices=[com.name for com in COM], help='may be repeated')
+	parser.add_argument('--direction', choices=['sent', 'received', 'note'])
+	parser.add_argument('--count', action='store_true', help='only count the matching records')
+	args = parser.parse_args()
+	filters = {'peer': args.peer, 'commands': [COM[name] for name in args.command] if args.command else None,
+		'direction': {'sent': SENT, 'received': RECEIVED, 'note': NOTE}.get(args.direction)}
+	with JournalReader(args.path) as reader:
+		if args.count:
+			print(reader.count(**filters))
+			return
+		for record in reader.records(**filters):
+			command = record.command.name if record.command else '-'
+			print(f"{time.strftime('%H:%M:%S', time.localtime(record.time))}.{int(record.time % 1 * 1000):03} {'><#'[record.direction]} {record.peer:12} {command:16} {record.frame}")
+
+if __name__ == '__main__':
+	main()
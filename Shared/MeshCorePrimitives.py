@@ -1,130 +1,202 @@
 import subprocess
+import asyncio
+import sys
 import json
 import logging
-import base64
-import uuid
-from typing import Optional, Tuple, List, Dict
+from typing import Optional, Tuple, List, Dict, Callable
 
-DEBUG_REQS = True
+from Shared.MeshCoreWorker import WorkerClient
+from Shared import WireCodec
+from Shared.Fragmentation import Fragmenter, ReassemblyBuffer, parse_fragment
+from Shared.NodeDirectory import NodeDirectory
+
+DEBUG_REQS = '--debug-reqs' in sys.argv  # log every message, formatting them is slow, see Shared.Journal for a cheap record
+JSON_WIRE = '--json-wire' in sys.argv  # human readable JSON frames for debugging instead of the binary codec
 MAX_MESSAGE_SIZE = 100  # Conservative limit for reliability
 
-# In-memory storage for chunk reassembly
-_chunk_storage: Dict[str, Dict[int, str]] = {}  # chunk_id -> {chunk_num: data}
-_chunk_metadata: Dict[str, Dict] = {}  # chunk_id -> {total_chunks, timestamp}
-
-def _cleanup_old_chunks():
-	"""Remove chunks older than 5 minutes"""
-	import time
-	current_time = time.time()
-	to_remove = []
-	for chunk_id, metadata in _chunk_metadata.items():
-		if current_time - metadata.get('timestamp', 0) > 300:  # 5 minutes
-			to_remove.append(chunk_id)
-	for chunk_id in to_remove:
-		_chunk_storage.pop(chunk_id, None)
-		_chunk_metadata.pop(chunk_id, None)
-
-def _chunk_message(message_str: str) -> List[str]:
-	"""Split a message into chunks of MAX_MESSAGE_SIZE bytes or smaller"""
-	if len(message_str.encode('utf-8')) <= MAX_MESSAGE_SIZE:
-		return [message_str]
-	
-	chunks = []
-	message_bytes = message_str.encode('utf-8')
-	chunk_id = str(uuid.uuid4())[:8]  # Short ID for chunk metadata
-	
-	total_chunks = (len(message_bytes) + MAX_MESSAGE_SIZE - 1) // MAX_MESSAGE_SIZE
-	
-	# Reserve space for chunk metadata in each chunk
-	# Format: {"c":chunk_id,"n":num,"t":total,"d":base64_data}
-	# Estimate: ~30 bytes for metadata, so ~70 bytes for data
-	DATA_CHUNK_SIZE = MAX_MESSAGE_SIZE - 50  # Conservative estimate
-	
-	for i in range(total_chunks):
-		start = i * DATA_CHUNK_SIZE
-		end = min(start + DATA_CHUNK_SIZE, len(message_bytes))
-		chunk_data = base64.b64encode(message_bytes[start:end]).decode('utf-8')
-		
-		chunk_msg = {
-			'c': chunk_id,
-			'n': i,
-			't': total_chunks,
-			'd': chunk_data
-		}
-		chunk_str = json.dumps(chunk_msg)
-		
-		# If still too large, use smaller data chunks
-		while len(chunk_str.encode('utf-8')) > MAX_MESSAGE_SIZE:
-			DATA_CHUNK_SIZE = max(20, DATA_CHUNK_SIZE - 10)
-			start = i * DATA_CHUNK_SIZE
-			end = min(start + DATA_CHUNK_SIZE, len(message_bytes))
-			chunk_data = base64.b64encode(message_bytes[start:end]).decode('utf-8')
-			chunk_msg['d'] = chunk_data
-			chunk_str = json.dumps(chunk_msg)
-		
-		chunks.append(chunk_str)
-	
-	return chunks
-
-def _reassemble_chunk(chunk_data: Dict) -> Optional[str]:
-	"""Reassemble a chunked message. Returns complete message if all chunks received, None otherwise"""
-	chunk_id = chunk_data['c']
-	chunk_num = chunk_data['n']
-	total_chunks = chunk_data['t']
-	data = chunk_data['d']
+_fragmenter = Fragmenter(MAX_MESSAGE_SIZE)
+_reassembly = ReassemblyBuffer(_fragmenter.data_chars)  # fragments received over the radio
+
+# Persistent worker holding the device connection, None -> one-shot meshcli calls
+_worker: Optional[WorkerClient] = None
+# Receiver of pushed (sender, text) frames, see subscribe_frames()
+_frame_callback: Optional[Callable[[str, str], None]] = None
+# Contacts and own name of the connected radio, see get_contacts()
+_directory = NodeDirectory(lambda: _fetch_contacts(), lambda: _fetch_own_node_name())
+
+def _open_worker(connection_args: List[str]) -> Optional[WorkerClient]:
+	"""A ready worker for the given connection, not made the active one"""
+	try:
+		worker = WorkerClient(connection_args)
+	except OSError as e:
+		logging.warning(f'Could not start meshcore worker: {e}')
+		return None
+	if not worker.wait_ready():
+		worker.close()
+		logging.warning('meshcore worker unavailable, falling back to one meshcli process per call')
+		return None
+	return worker
+
+def use_connection(worker: WorkerClient):
+	"""Make an opened worker the active connection, replacing the current one"""
+	global _worker
+	if worker is _worker:
+		return
+	close_worker()
+	worker.on_message = _on_pushed_message
+	worker.on_advert = _directory.add_contact
+	_worker = worker
+	_directory.set_own_name(worker.own_name)
+	_directory.refresh()  # warm up, pairing finds the contacts in memory
+	if _frame_callback is not None: worker.subscribe()  # frames were pushed by the replaced connection, keep them coming
+	logging.info(f'meshcore worker connected as {worker.own_name}')
+
+def probe_connection(connection_args: List[str]) -> Tuple[bool, Optional[WorkerClient]]:
+	"""
+	Open and test a connection without touching the active one, safe to run for several connections at once.
+	connection_args - as taken by the worker: ['--ble', ADDRESS], ['--tcp', HOST, PORT] or ['--serial', PORT, BAUDRATE]
+	Returns (healthy, worker), pass the worker to use_connection() to start using it.
+	The worker is None if only one-shot meshcli calls work for this connection.
+	"""
+	if worker := _open_worker(connection_args):
+		if worker.call('ping', timeout=3) is True:
+			return True, worker
+		worker.close()
+		return False, None
+	kind, *params = connection_args
+	cli_args = {'--ble': ['-a'], '--tcp': ['-t', '-p'], '--serial': ['-s', '-b']}[kind]
+	try:
+		result = subprocess.run(
+			['meshcli', *[a for pair in zip(cli_args, params) for a in pair], '-j', 'infos'],
+			capture_output=True,
+			text=True,
+			timeout=5
+		)
+		return result.returncode == 0, None
+	except Exception as e:
+		logging.error(f'Error connecting with {connection_args}: {e}')
+		return False, None
+
+def _get_worker() -> Optional[WorkerClient]:
+	return _worker if _worker is not None and _worker.alive() else None
+
+def _on_pushed_message(raw: dict):
+	if _frame_callback is not None:
+		_frame_callback(raw.get('sender', ''), raw.get('text', ''))
+
+def subscribe_frames(callback: Callable[[str, str], None]) -> bool:
+	"""
+	Deliver every inbound (sender, text frame) to callback as soon as it arrives.
+	Returns False if push delivery is unavailable and receive_frames() must be polled.
+	"""
+	global _frame_callback
+	worker = _get_worker()
+	if worker is None:
+		return False
+	_frame_callback = callback
+	return worker.subscribe()
+
+async def subscribe_frames_async(callback: Callable[[str, str], None]) -> bool:
+	"""`subscribe_frames` for asyncio code"""
+	global _frame_callback
+	worker = _get_worker()
+	if worker is None:
+		return False
+	_frame_callback = callback
+	return await worker.subscribe_async()
+
+def subscribe_messages(callback: Callable[[Tuple[int, str, dict]], None]) -> bool:
+	"""
+	Deliver every inbound (id, command, payload) to callback as soon as it arrives.
+	Returns False if push delivery is unavailable and receive_from_meshcore() must be polled.
+	"""
+	def on_frame(sender: str, text: str):
+		for msg in decode_frame(text, sender):
+			callback(msg)
+	return subscribe_frames(on_frame)
+
+def close_worker():
+	"""Shut down the transport worker and release the device connection"""
+	global _worker
+	if _worker is not None:
+		_worker.close()
+		_worker = None
+	_directory.invalidate()
+
+def encode_message(player_id: int, command: str, payload: dict) -> List[str]:
+	"""Serialise a game message into the text frames sent over the mesh"""
+	return _frames_of(_encode(player_id, command, payload))
+
+def encode_messages(player_id: int, messages: List[Tuple[str, dict]], compress: bool = False) -> List[List[str]]:
+	"""
+	Serialise several game messages, consecutive ones are packed into a shared frame as long as it fits.
+	compress - deflate where it helps, only for peers which announced WireCodec.CAP_DEFLATE
+	Returns the frame groups, each a single frame or the fragments of one message.
+	"""
+	return [frames for command, frames in encode_message_groups(player_id, messages, compress)]
+
+def encode_message_groups(player_id: int, messages: List[Tuple[str, dict]], compress: bool = False) -> List[Tuple[str, List[str]]]:
+	"""`encode_messages`, each frame group along with the command of its first message"""
+	compress = compress and not JSON_WIRE
+	groups, batch, packed, command_of_batch = [], [], b'', ''
+	for command, payload in messages:
+		msg_bytes = _encode(player_id, command, payload)
+		if batch and not JSON_WIRE:
+			candidate = _pack(WireCodec.encode_batch(batch + [msg_bytes]), compress)
+			if len(WireCodec.to_text(candidate)) <= MAX_MESSAGE_SIZE:
+				batch.append(msg_bytes)
+				packed = candidate
+				continue
+		if batch: groups.append((command_of_batch, _frames_of(packed)))
+		batch, packed, command_of_batch = [msg_bytes], _pack(msg_bytes, compress), command
+	if batch: groups.append((command_of_batch, _frames_of(packed)))
+	return groups
+
+def _pack(msg_bytes: bytes, compress: bool) -> bytes:
+	return (compress and WireCodec.compress(msg_bytes)) or msg_bytes
+
+def _encode(player_id: int, command: str, payload: dict) -> bytes:
+	assert isinstance(payload, dict)
 	
-	import time
-	if chunk_id not in _chunk_storage:
-		_chunk_storage[chunk_id] = {}
-		_chunk_metadata[chunk_id] = {
-			'total_chunks': total_chunks,
-			'timestamp': time.time()
+	if JSON_WIRE:
+		msg = {
+			'id': player_id,
+			'command': command,
+			'payload': payload
 		}
-	
-	_chunk_storage[chunk_id][chunk_num] = data
-	_cleanup_old_chunks()
-	
-	# Check if we have all chunks
-	if len(_chunk_storage[chunk_id]) == total_chunks:
-		# Reassemble
-		chunks = []
-		for i in range(total_chunks):
-			if i not in _chunk_storage[chunk_id]:
-				return None  # Missing chunk
-			chunks.append(_chunk_storage[chunk_id][i])
-		
-		# Decode and combine
-		combined_bytes = b''
-		for chunk_b64 in chunks:
-			combined_bytes += base64.b64decode(chunk_b64)
-		
-		# Clean up
-		_chunk_storage.pop(chunk_id, None)
-		_chunk_metadata.pop(chunk_id, None)
-		
-		return combined_bytes.decode('utf-8')
-	
-	return None
+		return json.dumps(msg, separators=(',', ':')).encode('utf-8')  # Compact JSON
+	return WireCodec.encode(player_id, command, payload)
+
+def _frames_of(msg_bytes: bytes) -> List[str]:
+	msg_str = msg_bytes.decode('utf-8') if msg_bytes[:1] == b'{' else WireCodec.to_text(msg_bytes)
+	if len(msg_str.encode('utf-8')) <= MAX_MESSAGE_SIZE:
+		return [msg_str]
+	# Fragments carry the raw message bytes, not the armoured text
+	return _fragmenter.fragment(msg_bytes)
 
 def send_to_node(node_name: str, player_id: int, command: str, payload: dict = {}) -> bool:
 	"""
 	Send a message to a meshcore node.
 	Returns True if successful, False otherwise.
 	"""
-	assert isinstance(payload, dict)
-	
-	msg = {
-		'id': player_id,
-		'command': command,
-		'payload': payload
-	}
-	msg_str = json.dumps(msg, separators=(',', ':'))  # Compact JSON
-	
 	if DEBUG_REQS:
 		logging.debug(f'sending req to {node_name}: id {player_id}, command {command} payload {payload}')
 	
 	# Chunk if necessary
-	chunks = _chunk_message(msg_str)
+	chunks = encode_message(player_id, command, payload)
+	return send_frames(node_name, chunks)
+
+def send_frames(node_name: str, chunks: List[str]) -> bool:
+	"""
+	Send already encoded text frames to a meshcore node.
+	Returns True if successful, False otherwise.
+	"""
+	if worker := _get_worker():
+		# All chunks go out in one worker call over the already open connection
+		if worker.call('send', timeout=5 * len(chunks), dest=node_name, texts=chunks) is None:
+			logging.error(f'Failed to send message to {node_name}')
+			return False
+		return True
 	
 	for chunk in chunks:
 		try:
@@ -149,12 +221,99 @@ def send_to_node(node_name: str, player_id: int, command: str, payload: dict = {
 	
 	return True
 
+async def send_frames_async(node_name: str, chunks: List[str]) -> bool:
+	"""`send_frames` for asyncio code, the worker and meshcli are awaited without blocking a thread"""
+	if worker := _get_worker():
+		if await worker.call_async('send', timeout=5 * len(chunks), dest=node_name, texts=chunks) is None:
+			logging.error(f'Failed to send message to {node_name}')
+			return False
+		return True
+	
+	for chunk in chunks:
+		try:
+			returncode, stdout, stderr = await _run_meshcli_async(['meshcli', 'msg', node_name, chunk], timeout=5)
+			if returncode != 0:
+				logging.error(f'Failed to send message to {node_name}: {stderr}')
+				return False
+		except asyncio.TimeoutError:
+			logging.error(f'Timeout sending message to {node_name}')
+			return False
+		except Exception as e:
+			logging.error(f'Error sending message to {node_name}: {e}')
+			return False
+	
+	return True
+
+async def _run_meshcli_async(args: List[str], timeout: float) -> Tuple[int, str, str]:
+	"""@return: (returncode, stdout, stderr), the process is killed on timeout"""
+	proc = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+	try:
+		stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+	except asyncio.TimeoutError:
+		proc.kill()
+		await proc.wait()
+		raise
+	return proc.returncode, stdout.decode('utf-8', 'replace'), stderr.decode('utf-8', 'replace')
+
+def get_reassembly_buffer() -> ReassemblyBuffer:
+	"""The buffer collecting fragments received over the radio, see ReassemblyBuffer.stats() for its counters"""
+	return _reassembly
+
+def new_reassembly_buffer() -> ReassemblyBuffer:
+	"""Reassembly buffer matching the fragment size used by encode_message()"""
+	return ReassemblyBuffer(_fragmenter.data_chars)
+
+def decode_frame(msg_text: str, sender: str = '', reassembly: Optional[ReassemblyBuffer] = None) -> List[Tuple[int, str, dict]]:
+	"""Parse one received text frame, returns the (id, command, payload) messages it completed"""
+	if fragment := parse_fragment(msg_text):
+		msg_bytes = (reassembly or _reassembly).add(sender, fragment)
+		if msg_bytes is None:
+			return []  # Still waiting for more chunks
+	elif (msg_bytes := WireCodec.from_text(msg_text)) is None:
+		msg_bytes = msg_text.encode('utf-8')
+	try:
+		if WireCodec.is_compressed(msg_bytes):
+			msg_bytes = WireCodec.decompress(msg_bytes)
+		parts = WireCodec.decode_batch(msg_bytes) if WireCodec.is_batch(msg_bytes) else [msg_bytes]
+	except WireCodec.CodecError as e:
+		logging.debug(f'Failed to unpack frame: {msg_bytes!r}, error: {e}')
+		return []
+	return [msg for part in parts if (msg := _decode_message(part))]
+
+def _decode_message(msg_bytes: bytes) -> Optional[Tuple[int, str, dict]]:
+	"""Decode a whole message, JSON messages start with '{', anything else is binary"""
+	try:
+		if msg_bytes[:1] == b'{':
+			msg = json.loads(msg_bytes)
+			id_val, command, payload = msg['id'], msg['command'], msg['payload']
+			assert isinstance(id_val, int) and isinstance(command, str) and isinstance(payload, dict)
+		else:
+			id_val, command, payload = WireCodec.decode(msg_bytes)
+	except (json.JSONDecodeError, UnicodeDecodeError, KeyError, TypeError, AssertionError, WireCodec.CodecError) as e:
+		logging.debug(f'Failed to parse message: {msg_bytes!r}, error: {e}')
+		return None
+	
+	if DEBUG_REQS:
+		logging.debug(f'received req: id {id_val}, command {command} payload {payload}')
+	return id_val, command, payload
+
 def receive_from_meshcore() -> List[Tuple[int, str, dict]]:
 	"""
 	Receive messages from meshcore.
 	Returns a list of (id, command, payload) tuples.
 	"""
 	messages = []
+	for sender, msg_text in receive_frames():
+		messages += decode_frame(msg_text, sender)
+	return messages
+
+def receive_frames() -> List[Tuple[str, str]]:
+	"""
+	Receive raw text frames from meshcore.
+	Returns a list of (sender, text) tuples.
+	"""
+	if worker := _get_worker():
+		return [(raw.get('sender', ''), raw.get('text', '')) for raw in worker.call('sync', timeout=2) or []]
 	
 	try:
 		# Use sync_msgs to get all unread messages
@@ -167,72 +326,72 @@ def receive_from_meshcore() -> List[Tuple[int, str, dict]]:
 		
 		if result.returncode != 0:
 			# No messages or error - that's okay
-			return messages
-		
-		# Parse JSON output
-		try:
-			output_lines = result.stdout.strip().split('\n')
-			for line in output_lines:
-				if not line.strip():
-					continue
-				
-				try:
-					msg_data = json.loads(line)
-					# Extract message text
-					msg_text = msg_data.get('text', '') or msg_data.get('message', '')
-					
-					if not msg_text:
-						continue
-					
-					# Check if it's a chunk
-					try:
-						chunk_data = json.loads(msg_text)
-						if 'c' in chunk_data and 'n' in chunk_data and 't' in chunk_data and 'd' in chunk_data:
-							# It's a chunk, try to reassemble
-							complete_msg = _reassemble_chunk(chunk_data)
-							if complete_msg:
-								msg_text = complete_msg
-							else:
-								continue  # Still waiting for more chunks
-					except (json.JSONDecodeError, KeyError):
-						# Not a chunk, use as-is
-						pass
-					
-					# Parse the actual game message
-					try:
-						msg = json.loads(msg_text)
-						if 'id' in msg and 'command' in msg and 'payload' in msg:
-							id_val = msg['id']
-							command = msg['command']
-							payload = msg['payload']
-							
-							assert isinstance(id_val, int) and isinstance(command, str) and isinstance(payload, dict)
-							
-							if DEBUG_REQS:
-								logging.debug(f'received req: id {id_val}, command {command} payload {payload}')
-							
-							messages.append((id_val, command, payload))
-					except (json.JSONDecodeError, KeyError, AssertionError) as e:
-						logging.debug(f'Failed to parse message: {msg_text}, error: {e}')
-						continue
-				except json.JSONDecodeError:
-					continue
-		except Exception as e:
-			logging.debug(f'Error parsing meshcore messages: {e}')
-	
+			return []
+		return _parse_sync_msgs(result.stdout)
 	except subprocess.TimeoutExpired:
 		# Timeout is okay, just return empty list
 		pass
 	except Exception as e:
 		logging.error(f'Error receiving messages from meshcore: {e}')
 	
-	return messages
+	return []
+
+async def receive_frames_async() -> List[Tuple[str, str]]:
+	"""`receive_frames` for asyncio code"""
+	if worker := _get_worker():
+		return [(raw.get('sender', ''), raw.get('text', '')) for raw in await worker.call_async('sync', timeout=2) or []]
+	try:
+		returncode, stdout, stderr = await _run_meshcli_async(['meshcli', '-j', 'sync_msgs'], timeout=2)
+		return _parse_sync_msgs(stdout) if returncode == 0 else []
+	except asyncio.TimeoutError:
+		pass
+	except Exception as e:
+		logging.error(f'Error receiving messages from meshcore: {e}')
+	return []
+
+def _parse_sync_msgs(output: str) -> List[Tuple[str, str]]:
+	"""(sender, text) frames of the JSON lines printed by meshcli sync_msgs"""
+	frames = []
+	try:
+		output_lines = output.strip().split('\n')
+		for line in output_lines:
+			if not line.strip():
+				continue
+			
+			try:
+				msg_data = json.loads(line)
+				# Extract message text
+				msg_text = msg_data.get('text', '') or msg_data.get('message', '')
+				
+				if not msg_text:
+					continue
+				
+				sender = msg_data.get('name', '') or msg_data.get('pubkey_prefix', '')
+				frames.append((sender, msg_text))
+			except json.JSONDecodeError:
+				continue
+	except Exception as e:
+		logging.debug(f'Error parsing meshcore messages: {e}')
+	return frames
 
 def get_contacts() -> List[str]:
 	"""
 	Get list of available meshcore contacts (node names).
-	Returns a list of contact names.
+	Returns a list of contact names, from the node directory cache.
 	"""
+	return _directory.contacts()
+
+def get_own_node_name() -> Optional[str]:
+	"""
+	Get the name of this node.
+	Returns node name or None if unavailable.
+	"""
+	return _directory.own_name()
+
+def _fetch_contacts() -> Optional[List[str]]:
+	"""contacts as listed by the radio, None on failure"""
+	if worker := _get_worker():
+		return worker.call('contacts')
 	try:
 		result = subprocess.run(
 			['meshcli', '-j', 'contacts'],
@@ -243,7 +402,7 @@ def get_contacts() -> List[str]:
 		
 		if result.returncode != 0:
 			logging.error(f'Failed to get contacts: {result.stderr}')
-			return []
+			return None
 		
 		# Parse JSON output
 		try:
@@ -264,13 +423,11 @@ def get_contacts() -> List[str]:
 			return contacts
 	except Exception as e:
 		logging.error(f'Error getting contacts: {e}')
-		return []
+		return None
 
-def get_own_node_name() -> Optional[str]:
-	"""
-	Get the name of this node.
-	Returns node name or None if unavailable.
-	"""
+def _fetch_own_node_name() -> Optional[str]:
+	if worker := _get_worker():
+		return worker.own_name
 	try:
 		result = subprocess.run(
 			['meshcli', '-j', 'infos'],
@@ -298,7 +455,7 @@ def scan_ble_devices(timeout: int = 2) -> List[Dict[str, str]]:
 	"""
 	try:
 		result = subprocess.run(
-			['meshcli', '-j', '-l'],
+			BLE_SCAN_COMMAND,
 			capture_output=True,
 			text=True,
 			timeout=timeout + 1
@@ -306,42 +463,48 @@ def scan_ble_devices(timeout: int = 2) -> List[Dict[str, str]]:
 		
 		if result.returncode != 0:
 			return []
-		
-		devices = []
-		try:
-			# Parse JSON output - could be list or dict
-			data = json.loads(result.stdout)
-			if isinstance(data, list):
-				for item in data:
-					if isinstance(item, dict):
-						devices.append({
-							'name': item.get('name', 'Unknown'),
-							'address': item.get('address', '')
-						})
-					elif isinstance(item, str):
-						devices.append({'name': item, 'address': item})
-			elif isinstance(data, dict):
-				for key, value in data.items():
-					devices.append({
-						'name': str(value) if isinstance(value, (str, int)) else key,
-						'address': key
-					})
-		except json.JSONDecodeError:
-			# Try parsing line by line
-			for line in result.stdout.strip().split('\n'):
-				if line.strip():
-					devices.append({'name': line.strip(), 'address': line.strip()})
-		
-		return devices
+		return parse_ble_scan(result.stdout)
 	except Exception as e:
 		logging.error(f'Error scanning BLE devices: {e}')
 		return []
 
+BLE_SCAN_COMMAND = ['meshcli', '-j', '-l']
+
+def parse_ble_scan(output: str) -> List[Dict[str, str]]:
+	"""Devices listed in the output of BLE_SCAN_COMMAND, as dicts with 'name' and 'address' keys"""
+	devices = []
+	try:
+		# Parse JSON output - could be list or dict
+		data = json.loads(output)
+		if isinstance(data, list):
+			for item in data:
+				if isinstance(item, dict):
+					devices.append({
+						'name': item.get('name', 'Unknown'),
+						'address': item.get('address', '')
+					})
+				elif isinstance(item, str):
+					devices.append({'name': item, 'address': item})
+		elif isinstance(data, dict):
+			for key, value in data.items():
+				devices.append({
+					'name': str(value) if isinstance(value, (str, int)) else key,
+					'address': key
+				})
+	except json.JSONDecodeError:
+		# Try parsing line by line
+		for line in output.strip().split('\n'):
+			if line.strip():
+				devices.append({'name': line.strip(), 'address': line.strip()})
+	return devices
+
 def test_connection() -> bool:
 	"""
 	Test if meshcore connection is working.
 	Returns True if connection is active, False otherwise.
 	"""
+	if worker := _get_worker():
+		return worker.call('ping', timeout=3) is True
 	try:
 		result = subprocess.run(
 			['meshcli', '-j', 'infos'],
@@ -356,50 +519,27 @@ def test_connection() -> bool:
 def connect_ble_device(address: str) -> bool:
 	"""
 	Connect to a BLE device by address.
-	Uses meshcli -S to select device, then stores it in config.
+	Keeps the connection open in the transport worker when possible.
 	"""
-	try:
-		# Use -a to specify address
-		result = subprocess.run(
-			['meshcli', '-a', address, '-j', 'infos'],
-			capture_output=True,
-			text=True,
-			timeout=5
-		)
-		return result.returncode == 0
-	except Exception as e:
-		logging.error(f'Error connecting to BLE device {address}: {e}')
-		return False
+	return _connect(['--ble', address])
 
 def connect_tcp(hostname: str, port: int = 5000) -> bool:
 	"""
 	Connect via TCP/IP.
+	Keeps the connection open in the transport worker when possible.
 	"""
-	try:
-		result = subprocess.run(
-			['meshcli', '-t', hostname, '-p', str(port), '-j', 'infos'],
-			capture_output=True,
-			text=True,
-			timeout=5
-		)
-		return result.returncode == 0
-	except Exception as e:
-		logging.error(f'Error connecting via TCP {hostname}:{port}: {e}')
-		return False
+	return _connect(['--tcp', hostname, str(port)])
 
 def connect_serial(port: str, baudrate: int = 9600) -> bool:
 	"""
 	Connect via Serial port.
+	Keeps the connection open in the transport worker when possible.
 	"""
-	try:
-		result = subprocess.run(
-			['meshcli', '-s', port, '-b', str(baudrate), '-j', 'infos'],
-			capture_output=True,
-			text=True,
-			timeout=5
-		)
-		return result.returncode == 0
-	except Exception as e:
-		logging.error(f'Error connecting via Serial {port}: {e}')
-		return False
+	return _connect(['--serial', port, str(baudrate)])
 
+def _connect(connection_args: List[str]) -> bool:
+	close_worker()
+	healthy, worker = probe_connection(connection_args)
+	if worker is not None:
+		use_connection(worker)
+	return healthy
@@ -0,0 +1,293 @@
+"""
+Long-lived meshcore transport worker.
+
+The worker keeps a single connection to the radio open and takes commands
+over a line protocol on stdin/stdout, so the game does not pay interpreter
+startup and a fresh BLE/serial/TCP handshake for every message.
+
+Protocol (one JSON object per line):
+	request:  {"seq": 1, "op": "send", "dest": "node", "texts": ["..."]}
+	reply:    {"seq": 1, "ok": true, "result": ...}
+	startup:  {"event": "ready", "ok": true, "name": "own node name"}
+	push:     {"event": "msg", "sender": "node", "text": "..."}  (after a "subscribe" op)
+	advert:   {"event": "advert", "name": "node"}  (a contact advertised itself)
+
+The worker is started as `python -m Shared.MeshCoreWorker --ble ADDRESS`
+(or `--tcp HOST PORT` / `--serial PORT BAUDRATE`) by `WorkerClient`.
+"""
+import os, sys
+import json
+import asyncio
+import logging
+import subprocess
+import threading
+import argparse
+from typing import Optional, Any, Dict, List, Callable
+
+READY_TIMEOUT = 15  # BLE connections can take a while to come up
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# client side ------------------------------------------------
+class _FutureSignal:
+	"""Completes an asyncio future from the reader thread, stands in for the Event of a blocking call"""
+	def __init__(self, loop, future):
+		self.loop = loop
+		self.future = future
+
+	def set(self):
+		try:
+			self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(None))
+		except RuntimeError:
+			pass  # the loop is closed, nobody is waiting anymore
+
+class WorkerClient:
+	"""Handle to a running worker process, safe to use from multiple threads"""
+	def __init__(self, connection_args: List[str]):
+		self.connection_args = connection_args
+		self.own_name: Optional[str] = None
+		self.on_message: Optional[Callable[[dict], None]] = None  # called from the reader thread for pushed messages
+		self.on_advert: Optional[Callable[[str], None]] = None  # called from the reader thread with names of advertising contacts
+		self.streaming = False
+		self._seq = 0
+		self._lock = threading.Lock()  # guards _seq, _pending and writes to stdin
+		self._pending: Dict[int, list] = {}  # seq -> [threading.Event or _FutureSignal, reply]
+		self._ready = threading.Event()
+		self._ready_ok = False
+		self.proc = subprocess.Popen(
+			[sys.executable, '-m', 'Shared.MeshCoreWorker', *connection_args],
+			stdin=subprocess.PIPE,
+			stdout=subprocess.PIPE,
+			text=True,
+			bufsize=1,
+			cwd=ROOT_DIR
+		)
+		self._reader = threading.Thread(target=self._read_loop, name='Thread-MeshWorker', daemon=True)
+		self._reader.start()
+
+	def wait_ready(self, timeout: float = READY_TIMEOUT) -> bool:
+		"""Wait until the worker reports an open device connection"""
+		self._ready.wait(timeout)
+		return self._ready_ok
+
+	def alive(self) -> bool:
+		return self._ready_ok and self.proc.poll() is None
+
+	def call(self, op: str, timeout: float = 5, **params) -> Optional[Any]:
+		"""
+		Run a command in the worker.
+		Returns the result, or None on error/timeout.
+		"""
+		done = threading.Event()
+		slot = [done, None]
+		if (seq := self._submit(op, params, slot)) is None:
+			return None
+		if not done.wait(timeout):
+			return self._timed_out(op, seq)
+		return self._result(op, slot[1])
+
+	async def call_async(self, op: str, timeout: float = 5, **params) -> Optional[Any]:
+		"""`call` for asyncio code, waits without blocking the event loop or a thread"""
+		loop = asyncio.get_running_loop()
+		future = loop.create_future()
+		slot = [_FutureSignal(loop, future), None]
+		if (seq := self._submit(op, params, slot)) is None:
+			return None
+		try:
+			await asyncio.wait_for(future, timeout)
+		except asyncio.TimeoutError:
+			return self._timed_out(op, seq)
+		return self._result(op, slot[1])
+
+	def _submit(self, op: str, params: dict, slot: list) -> Optional[int]:
+		"""writes the request, slot[0].set() is called once slot[1] holds the reply"""
+		if not self.alive():
+			return None
+		with self._lock:
+			self._seq += 1
+			seq = self._seq
+			self._pending[seq] = slot
+			try:
+				self.proc.stdin.write(json.dumps({'seq': seq, 'op': op, **params}, separators=(',', ':')) + '\n')
+				self.proc.stdin.flush()
+			except (OSError, ValueError) as e:
+				self._pending.pop(seq, None)
+				logging.error(f'meshcore worker pipe closed: {e}')
+				return None
+		return seq
+
+	def _timed_out(self, op: str, seq: int) -> None:
+		with self._lock:
+			self._pending.pop(seq, None)
+		logging.error(f'meshcore worker timed out on {op}')
+		return None
+
+	def _result(self, op: str, reply: dict) -> Optional[Any]:
+		if not reply.get('ok', False):
+			logging.error(f"meshcore worker {op} failed: {reply.get('error')}")
+			return None
+		return reply.get('result')
+
+	def subscribe(self) -> bool:
+		"""Switch the worker to pushing inbound messages as they arrive"""
+		if not self.streaming:
+			self.streaming = self.call('subscribe') is True
+		return self.streaming
+
+	async def subscribe_async(self) -> bool:
+		"""`subscribe` for asyncio code"""
+		if not self.streaming:
+			self.streaming = await self.call_async('subscribe') is True
+		return self.streaming
+
+	def close(self):
+		if self.proc.poll() is None:
+			self.call('quit', timeout=2)
+			try:
+				self.proc.wait(timeout=2)
+			except subprocess.TimeoutExpired:
+				self.proc.kill()
+
+	def _read_loop(self):
+		for line in self.proc.stdout:
+			try:
+				reply = json.loads(line)
+			except json.JSONDecodeError:
+				logging.debug(f'meshcore worker: unparsable line {line!r}')
+				continue
+			if 'seq' in reply:
+				with self._lock:
+					slot = self._pending.pop(reply['seq'], None)
+				if slot:
+					slot[1] = reply
+					slot[0].set()
+			elif reply.get('event') == 'msg':
+				if self.on_message: self.on_message(reply)
+			elif reply.get('event') == 'advert':
+				if self.on_advert: self.on_advert(reply.get('name', ''))
+			elif reply.get('event') == 'ready':
+				self._ready_ok = bool(reply.get('ok'))
+				self.own_name = reply.get('name')
+				if not self._ready_ok:
+					logging.error(f"meshcore worker could not connect: {reply.get('error')}")
+				self._ready.set()
+		# worker exited, fail everyone still waiting
+		self._ready_ok = False
+		self.streaming = False
+		self._ready.set()
+		with self._lock:
+			pending, self._pending = self._pending, {}
+		for slot in pending.values():
+			slot[1] = {'ok': False, 'error': 'worker exited'}
+			slot[0].set()
+
+# worker side ------------------------------------------------
+def _write(obj: dict):
+	sys.stdout.write(json.dumps(obj, separators=(',', ':')) + '\n')
+	sys.stdout.flush()
+
+def _sender_name(mc, payload: dict) -> str:
+	contact = mc.get_contact_by_key_prefix(payload.get('pubkey_prefix', ''))
+	return contact.get('adv_name', '') if contact else payload.get('pubkey_prefix', '')
+
+async def _handle(mc, op: str, params: dict, state: dict) -> Any:
+	from meshcore import EventType
+	if op == 'ping':
+		return True
+	elif op == 'infos':
+		return mc.self_info
+	elif op == 'contacts':
+		await mc.ensure_contacts()
+		return [c.get('adv_name', '') for c in mc.contacts.values()]
+	elif op == 'send':
+		contact = mc.get_contact_by_name(params['dest'])
+		if contact is None:
+			await mc.ensure_contacts(follow=True)
+			contact = mc.get_contact_by_name(params['dest'])
+		if contact is None:
+			raise ValueError(f"unknown contact {params['dest']}")
+		for text in params['texts']:
+			res = await mc.commands.send_msg(contact, text)
+			if res.type == EventType.ERROR:
+				raise RuntimeError(f'send failed: {res.payload}')
+		return len(params['texts'])
+	elif op == 'sync':
+		messages = []
+		while True:
+			res = await mc.commands.get_msg()
+			if res.type != EventType.CONTACT_MSG_RECV:
+				break
+			messages.append({'sender': _sender_name(mc, res.payload), 'text': res.payload.get('text', '')})
+		return messages
+	elif op == 'subscribe':
+		if not state.get('streaming'):
+			async def on_msg(event):
+				_write({'event': 'msg', 'sender': _sender_name(mc, event.payload), 'text': event.payload.get('text', '')})
+			mc.subscribe(EventType.CONTACT_MSG_RECV, on_msg)
+			await mc.start_auto_message_fetching()
+			state['streaming'] = True
+		return True
+	raise ValueError(f'unknown op {op}')
+
+async def _watch_adverts(mc):
+	from meshcore import EventType
+	async def on_advert(event):
+		contact = mc.get_contact_by_key_prefix(event.payload.get('public_key', '')[:12])
+		if contact is None:
+			await mc.ensure_contacts(follow=True)
+			contact = mc.get_contact_by_key_prefix(event.payload.get('public_key', '')[:12])
+		if contact is not None:
+			_write({'event': 'advert', 'name': contact.get('adv_name', '')})
+	async def on_new_contact(event):
+		_write({'event': 'advert', 'name': event.payload.get('adv_name', '')})
+	mc.subscribe(EventType.ADVERTISEMENT, on_advert)
+	mc.subscribe(EventType.NEW_CONTACT, on_new_contact)
+
+async def _serve(args):
+	from meshcore import MeshCore
+	if args.ble:
+		mc = await MeshCore.create_ble(args.ble)
+	elif args.tcp:
+		mc = await MeshCore.create_tcp(args.tcp[0], int(args.tcp[1]))
+	else:
+		mc = await MeshCore.create_serial(args.serial[0], int(args.serial[1]))
+	if mc is None:
+		_write({'event': 'ready', 'ok': False, 'error': 'no response from device'})
+		return
+	await mc.ensure_contacts()
+	await _watch_adverts(mc)
+	_write({'event': 'ready', 'ok': True, 'name': mc.self_info.get('name')})
+
+	state = {}
+	while True:
+		line = await asyncio.to_thread(sys.stdin.readline)
+		if not line:
+			break  # parent closed the pipe
+		try:
+			req = json.loads(line)
+		except json.JSONDecodeError:
+			continue
+		op = req.get('op')
+		if op == 'quit':
+			_write({'seq': req.get('seq'), 'ok': True, 'result': True})
+			break
+		try:
+			_write({'seq': req.get('seq'), 'ok': True, 'result': await _handle(mc, op, req, state)})
+		except Exception as e:
+			_write({'seq': req.get('seq'), 'ok': False, 'error': str(e)})
+	await mc.disconnect()
+
+def main():
+	parser = argparse.ArgumentParser('MeshCoreWorker')
+	group = parser.add_mutually_exclusive_group(required=True)
+	group.add_argument('--ble', metavar='ADDRESS')
+	group.add_argument('--tcp', nargs=2, metavar=('HOST', 'PORT'))
+	group.add_argument('--serial', nargs=2, metavar=('PORT', 'BAUDRATE'))
+	args = parser.parse_args()
+	logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+	try:
+		asyncio.run(_serve(args))
+	except Exception as e:
+		_write({'event': 'ready', 'ok': False, 'error': str(e)})
+
+if __name__ == '__main__':
+	main()
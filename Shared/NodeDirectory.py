@@ -0,0 +1,93 @@
+"""
+Cached view of the radio's contacts and own node name.
+
+Listing contacts is a radio round trip (or a whole meshcli process), far
+too slow for the menu thread. The directory answers from memory and
+refreshes in the background once the data is older than its TTL; contact
+adverts heard in between are added as they arrive. Only the very first
+lookup, with nothing cached yet, waits for the radio.
+"""
+import time
+import logging
+import threading
+from typing import Optional, List, Callable
+
+CONTACTS_TTL = 60.0
+
+class NodeDirectory:
+	"""Contacts and own name of one radio connection, safe to use from multiple threads"""
+	def __init__(self, fetch_contacts: Callable[[], Optional[List[str]]], fetch_own_name: Callable[[], Optional[str]], ttl: float = CONTACTS_TTL):
+		self.fetch_contacts = fetch_contacts  # None on failure, keeps the cached contacts
+		self.fetch_own_name = fetch_own_name
+		self.ttl = ttl
+		self._lock = threading.Lock()
+		self._contacts: List[str] = []
+		self._own_name: Optional[str] = None
+		self._fetched: Optional[float] = None  # time of the last successful refresh
+		self._refreshing: Optional[threading.Thread] = None
+		self._generation = 0  # bumped by invalidate, refreshes of older generations are dropped
+		self.refreshes = 0
+		self.adverts = 0
+
+	def contacts(self) -> List[str]:
+		"""Known contact names, in the order they became known"""
+		self._ensure_fresh()
+		with self._lock:
+			return list(self._contacts)
+
+	def own_name(self) -> Optional[str]:
+		self._ensure_fresh()
+		with self._lock:
+			return self._own_name
+
+	def set_own_name(self, name: Optional[str]):
+		"""Name known without asking, e.g. reported by the worker on startup"""
+		with self._lock:
+			self._own_name = name
+
+	def add_contact(self, name: str):
+		"""A contact advert was heard"""
+		if not name: return
+		with self._lock:
+			self.adverts += 1
+			if name not in self._contacts: self._contacts.append(name)
+
+	def invalidate(self):
+		"""Forget everything, the radio connection changed"""
+		with self._lock:
+			self._generation += 1
+			self._contacts, self._own_name, self._fetched = [], None, None
+
+	def refresh(self, wait: bool = False):
+		"""Refresh in the background unless a refresh is already running, `wait` blocks until it's done"""
+		with self._lock:
+			thread = self._refreshing
+			if thread is None or not thread.is_alive():
+				thread = self._refreshing = threading.Thread(target=self._refresh, args=(self._generation,), name='Thread-NodeDirectory', daemon=True)
+				thread.start()
+		if wait: thread.join()
+
+	def _ensure_fresh(self):
+		with self._lock:
+			fetched = self._fetched
+		if fetched is None:
+			self.refresh(wait=True)
+		elif time.monotonic() - fetched > self.ttl:
+			self.refresh()
+
+	def _refresh(self, generation: int):
+		try:
+			contacts = self.fetch_contacts()
+			own_name = self._own_name or self.fetch_own_name()
+		except Exception as e:
+			logging.error(f'Error refreshing node directory: {e}')
+			return
+		with self._lock:
+			if generation != self._generation:
+				return
+			self.refreshes += 1
+			self._fetched = time.monotonic()
+			if contacts is not None:
+				# keep the known order
+				self._contacts = [c for c in self._contacts if c in contacts] + [c for c in contacts if c not in self._contacts]
+			if own_name is not None: self._own_name = own_name
@@ -0,0 +1,232 @@
+"""
+Selective-repeat ARQ for fragmented messages.
+
+The receiver answers fragments with a control frame carrying the bitmap of
+the fragments it holds: once the message is complete, for a duplicate
+(its earlier answer got lost) and when a fragment arrives with nothing
+missing above it, i.e. the tail of a burst made it but something before it
+didn't. The sender resends exactly the fragments missing from the bitmap,
+at most once per retransmission timeout: a burst arriving out of order
+makes the receiver answer with gaps the rest of the burst is about to fill.
+
+If no answer comes within the retransmission timeout the sender resends
+the highest fragment not known to be received, which makes the receiver
+report its bitmap again. The timeout is derived per peer from measured
+round trip times as in RFC 6298 (Karn's rule, exponential backoff).
+
+Control frame: `CONTROL_MARKER` + base85(message id, fragment count, bitmap).
+Single frame messages aren't tracked here: the session sends a request
+again while its response is overdue and answers a repeated request with
+the reply it already sent (`Client.Session`). Notifications are repeated,
+if at all, by whoever sends them.
+"""
+import base64
+import logging
+import math
+import struct
+import threading
+import time
+from typing import Optional, Tuple, List, Dict, Callable
+
+from Shared.Fragmentation import parse_fragment
+
+CONTROL_MARKER = '^'
+CONTROL_HEADER = struct.Struct('>HB')  # message id, fragment count
+
+class RttEstimator:
+	"""Smoothed round trip time and retransmission timeout of one peer"""
+	INITIAL_RTO = 3.0  # multi-hop mesh, be patient until the first sample
+	MIN_RTO = 0.3
+	MAX_RTO = 30.0
+	ALPHA = 1/8
+	BETA = 1/4
+
+	def __init__(self):
+		self.srtt: Optional[float] = None
+		self.rttvar = 0.0
+		self.rto = self.INITIAL_RTO
+
+	def sample(self, rtt: float):
+		if self.srtt is None:
+			self.srtt, self.rttvar = rtt, rtt / 2
+		else:
+			self.rttvar += self.BETA * (abs(self.srtt - rtt) - self.rttvar)
+			self.srtt += self.ALPHA * (rtt - self.srtt)
+		self.rto = min(self.MAX_RTO, max(self.MIN_RTO, self.srtt + 4 * self.rttvar))
+
+	def backoff(self):
+		self.rto = min(self.MAX_RTO, self.rto * 2)
+
+def encode_control(msg_id: int, total: int, received: int) -> str:
+	bitmap = received.to_bytes(-(-total // 8), 'little')
+	return CONTROL_MARKER + base64.b85encode(CONTROL_HEADER.pack(msg_id, total) + bitmap).decode('ascii')
+
+def parse_control(text: str) -> Optional[Tuple[int, int, int]]:
+	"""@return: (message id, fragment count, received bitmap), None if text isn't a control frame"""
+	if not text.startswith(CONTROL_MARKER): return None
+	try:
+		data = base64.b85decode(text[len(CONTROL_MARKER):])
+		msg_id, total = CONTROL_HEADER.unpack_from(data)
+	except (ValueError, struct.error):
+		return None
+	if total == 0: return None
+	return msg_id, total, int.from_bytes(data[CONTROL_HEADER.size:], 'little') & ((1 << total) - 1)
+
+class _Outgoing:
+	__slots__ = ('dest', 'msg_id', 'frames', 'acked', 'sent_at', 'retransmitted', 'retries', 'deadline', 'resent_at')
+	def __init__(self, dest: str, msg_id: int, frames: List[str], now: float):
+		self.dest = dest
+		self.msg_id = msg_id
+		self.frames = frames
+		self.acked = 0  # bitmap of fragments the receiver reported
+		self.sent_at = now
+		self.retransmitted = False
+		self.retries = 0
+		self.deadline = math.inf  # armed once the frames are out, a slow send of the first burst isn't a loss
+		self.resent_at = 0.  # last resend of the fragments an answer reported missing
+
+class ArqEndpoint:
+	"""Both ARQ roles of one transport
+
+	All frames, retransmissions and control frames alike, are sent from the
+	endpoint's own thread: the callbacks run on transport reader threads,
+	which must not block on sending. The thread sleeps until the next
+	retransmission deadline or until there is something to send."""
+	MAX_RETRIES = 6
+
+	def __init__(self, send_frames: Callable[[str, List[str]], bool]):
+		self.send_frames = send_frames
+		self._peers: Dict[str, RttEstimator] = {}
+		self._outgoing: Dict[Tuple[str, int], _Outgoing] = {}
+		self._outbox: List[Tuple[str, List[str]]] = []
+		self._cond = threading.Condition()
+		self._thread: Optional[threading.Thread] = None
+		self._closed = False
+		self.retransmissions = 0
+		self.acked = 0
+		self.gave_up = 0
+		self.controls_sent = 0
+
+	def rtt(self, peer: str) -> RttEstimator:
+		with self._cond:
+			return self._peer(peer)
+
+	def stats(self) -> dict:
+		with self._cond:
+			return {'in_flight': len(self._outgoing), 'retransmissions': self.retransmissions, 'acked': self.acked,
+				'gave_up': self.gave_up, 'controls_sent': self.controls_sent}
+
+	# sender --------------------------------------------------
+	def track(self, dest: str, frames: List[str]):
+		"""Watch delivery of fragment frames about to be sent to dest, call `sent` once they are out
+		(registered before sending, the answer can come back before the send call returns,
+		but its retransmission timer only starts in `sent`: the send itself may take long on the radio)"""
+		if len(frames) < 2 or (fragment := parse_fragment(frames[0])) is None:
+			return
+		with self._cond:
+			out = _Outgoing(dest, fragment[0], frames, time.monotonic())
+			self._outgoing[(dest, out.msg_id)] = out
+
+	def sent(self, dest: str, frames: List[str], ok: bool):
+		"""Start the retransmission timer of tracked frames, or forget them if sending failed"""
+		if len(frames) < 2 or (fragment := parse_fragment(frames[0])) is None:
+			return
+		with self._cond:
+			out = self._outgoing.get((dest, fragment[0]))
+			if out is None or out.frames is not frames:
+				return
+			if not ok:
+				del self._outgoing[(dest, out.msg_id)]
+				return
+			out.sent_at = time.monotonic()
+			out.deadline = out.sent_at + self._peer(dest).rto
+			self._wake()
+
+	def handle_control(self, sender: str, text: str):
+		"""Process an acknowledgement frame received from sender"""
+		if (control := parse_control(text)) is None:
+			return
+		msg_id, total, received = control
+		now = time.monotonic()
+		with self._cond:
+			out = self._outgoing.get((sender, msg_id))
+			if out is None or len(out.frames) != total:
+				return  # already done, or not ours
+			if not out.retransmitted:
+				self._peer(sender).sample(now - out.sent_at)
+			out.acked = received
+			if received == (1 << total) - 1:
+				del self._outgoing[(sender, msg_id)]
+				self.acked += 1
+				return
+			if now - out.resent_at < self._peer(sender).rto:
+				return  # their answer is yet to come
+			if not self._retry(out, now):
+				return
+			out.resent_at = now
+			self._queue(sender, [frame for i, frame in enumerate(out.frames) if not received >> i & 1])
+
+	# receiver ------------------------------------------------
+	def on_fragment(self, sender: str, msg_id: int, total: int, received: int, index: int):
+		"""ReassemblyBuffer listener, answers with the bitmap when the sender needs to know it"""
+		if received >> index == ((1 << total) - 1) >> index:  # nothing missing from index on
+			with self._cond:
+				self.controls_sent += 1
+				self._queue(sender, [encode_control(msg_id, total, received)])
+
+	def close(self):
+		with self._cond:
+			self._closed = True
+			self._cond.notify()
+
+	# internals -----------------------------------------------
+	def _peer(self, peer: str) -> RttEstimator:
+		if (rtt := self._peers.get(peer)) is None:
+			rtt = self._peers[peer] = RttEstimator()
+		return rtt
+
+	def _retry(self, out: _Outgoing, now: float) -> bool:
+		'''count a retransmission of out, False if it has been given up on'''
+		if out.retries >= self.MAX_RETRIES:
+			del self._outgoing[(out.dest, out.msg_id)]
+			self.gave_up += 1
+			logging.warning(f'giving up on message {out.msg_id} to {out.dest} after {out.retries} retransmissions')
+			return False
+		out.retries += 1
+		out.retransmitted = True
+		out.deadline = now + self._peer(out.dest).rto
+		self.retransmissions += 1
+		return True
+
+	def _queue(self, dest: str, frames: List[str]):
+		self._outbox.append((dest, frames))
+		self._wake()
+
+	def _wake(self):
+		if self._thread is None:
+			self._thread = threading.Thread(target=self._loop, name='Thread-Arq', daemon=True)
+			self._thread.start()
+		self._cond.notify()
+
+	def _loop(self):
+		while 1:
+			with self._cond:
+				while not self._outbox and not self._closed:
+					now = time.monotonic()
+					timeout = None
+					for out in list(self._outgoing.values()):
+						if out.deadline <= now:
+							self._peer(out.dest).backoff()
+							if self._retry(out, now):
+								last = max(i for i in range(len(out.frames)) if not out.acked >> i & 1)
+								self._outbox.append((out.dest, [out.frames[last]]))
+						elif out.deadline < math.inf:  # not still being sent
+							timeout = out.deadline - now if timeout is None else min(timeout, out.deadline - now)
+					if self._outbox: break
+					self._cond.wait(timeout)
+				if self._closed:
+					return
+				outbox, self._outbox = self._outbox, []
+			for dest, frames in outbox:
+				if not self.send_frames(dest, frames):
+					logging.debug(f'ARQ send to {dest} failed')
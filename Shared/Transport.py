@@ -0,0 +1,350 @@
+"""
+Pluggable transports carrying game messages between nodes.
+
+`Session` talks to a `Transport` instead of calling `MeshCorePrimitives`
+directly, so the session layer can run over the radio, in-process
+(two clients in one interpreter, benchmarks) or over localhost UDP
+(several clients on one machine, no radio needed).
+
+All backends move the same text frames produced by
+`MeshCorePrimitives.encode_message`, so chunking and decoding behave the
+same as on the mesh. Fragmented messages are acknowledged and repaired by
+the ARQ layer in `Shared.Reliability` on every backend.
+
+With the '--journal PATH' flag every frame sent or received is recorded
+in a `Shared.Journal`.
+
+Capabilities are negotiated per peer on pairing: outgoing PAIR messages
+carry a 'caps' field, which is stripped from received ones before the
+session sees them. Messages to peers announcing `WireCodec.CAP_DEFLATE`
+are compressed. Received PAIR and RESUME payloads get the sender's node
+name as 'node', since pairing and resuming have to answer nodes other
+than the opponent; with `tag_senders` set every received payload gets
+it, so a session can tell its opponent from other nodes and a session
+multiplexer the opponents apart.
+"""
+import socket
+import asyncio
+import threading
+import logging
+import argparse
+from queue import Queue, Empty
+from typing import Optional, Tuple, List, Dict, Callable
+
+from Shared import MeshCorePrimitives, WireCodec, Journal
+from Shared.Enums import COM
+from Shared.Reliability import ArqEndpoint, CONTROL_MARKER
+
+Message = Tuple[int, str, dict]
+MessageCallback = Callable[[Message], None]
+
+class Transport:
+	"""Base class, backends implement the frame level `send_frames`/`receive_frames`"""
+	needs_radio = False  # whether the radio connection menu has to be gone through first
+	CAPS = WireCodec.CAP_DEFLATE
+
+	def __init__(self):
+		self.tag_senders = False  # add 'node' to every received payload, not just PAIR ones
+		self._message_callback: Optional[MessageCallback] = None
+		self.on_frames_sent: Optional[Callable[[str, List[str]], None]] = None  # sees every frame put on the air, for airtime accounting
+		self.journal: Optional[Journal.JournalWriter] = Journal.journal_from_args()
+		self.arq = ArqEndpoint(self._send_frames)
+		self.peer_caps: Dict[str, int] = {}  # node name -> capabilities announced in its PAIR
+		self._set_reassembly(MeshCorePrimitives.new_reassembly_buffer())
+
+	def _set_reassembly(self, reassembly):
+		self.reassembly = reassembly
+		self.reassembly.listener = self.arq.on_fragment
+
+	def send_to_node(self, node_name: str, player_id: int, command: str, payload: dict = {}) -> bool:
+		"""
+		Send a message to a node.
+		Returns True if successful, False otherwise.
+		"""
+		return self.send_messages(node_name, player_id, [(command, payload)])
+
+	def send_messages(self, node_name: str, player_id: int, messages: List[Tuple[str, dict]]) -> bool:
+		"""
+		Send several (command, payload) messages to a node, small ones share a frame.
+		Returns True if all were sent successfully, False otherwise.
+		"""
+		ok = True
+		for command, frames in self._frame_groups(node_name, player_id, messages):
+			self.arq.track(node_name, frames)
+			sent = self._send_frames(node_name, frames, command)
+			self.arq.sent(node_name, frames, sent)
+			ok = ok and sent
+		return ok
+
+	async def send_messages_async(self, node_name: str, player_id: int, messages: List[Tuple[str, dict]]) -> bool:
+		"""`send_messages` for asyncio code"""
+		ok = True
+		for command, frames in self._frame_groups(node_name, player_id, messages):
+			self.arq.track(node_name, frames)
+			sent = await self.send_frames_async(node_name, frames)
+			if sent: self._frames_sent(node_name, frames, command)
+			self.arq.sent(node_name, frames, sent)
+			ok = ok and sent
+		return ok
+
+	def _frame_groups(self, node_name: str, player_id: int, messages: List[Tuple[str, dict]]) -> List[Tuple[str, List[str]]]:
+		'''(command of the first message, frames) of the frame groups the messages are sent in'''
+		if MeshCorePrimitives.DEBUG_REQS:
+			for command, payload in messages:
+				logging.debug(f'sending req to {node_name}: id {player_id}, command {command} payload {payload}')
+		messages = [(command, {**payload, 'caps': self.CAPS} if command == COM.PAIR else payload) for command, payload in messages]
+		compress = bool(self.peer_caps.get(node_name, 0) & WireCodec.CAP_DEFLATE)
+		return MeshCorePrimitives.encode_message_groups(player_id, messages, compress)
+
+	def receive(self) -> List[Message]:
+		"""
+		Receive messages which arrived since the last call.
+		Returns a list of (id, command, payload) tuples.
+		"""
+		messages = []
+		for sender, text in self.receive_frames():
+			messages += self._decode_frame(sender, text)
+		return messages
+
+	async def receive_async(self) -> List[Message]:
+		"""`receive` for asyncio code"""
+		messages = []
+		for sender, text in await self.receive_frames_async():
+			messages += self._decode_frame(sender, text)
+		return messages
+
+	def subscribe_messages(self, callback: MessageCallback) -> bool:
+		"""
+		Deliver every inbound message to callback as soon as it arrives.
+		Returns False if push delivery is unavailable and receive() must be polled.
+		"""
+		return False
+
+	async def subscribe_messages_async(self, callback: MessageCallback) -> bool:
+		"""`subscribe_messages` for asyncio code"""
+		return await asyncio.to_thread(self.subscribe_messages, callback)
+
+	def _deliver_frame(self, sender: str, text: str) -> bool:
+		"""push path for backends with their own reader, returns if the frame was consumed"""
+		if self._message_callback is None:
+			return False
+		for msg in self._decode_frame(sender, text):
+			self._message_callback(msg)
+		return True
+
+	def _send_frames(self, node_name: str, frames: List[str], command: Optional[str] = None) -> bool:
+		'''command - of the first message in the frames, None for ARQ control frames and retransmissions'''
+		sent = self.send_frames(node_name, frames)
+		if sent: self._frames_sent(node_name, frames, command)
+		return sent
+	def _frames_sent(self, node_name: str, frames: List[str], command: Optional[str]):
+		if self.on_frames_sent: self.on_frames_sent(node_name, frames)
+		if self.journal:
+			opcode = Journal.OPCODE_OF.get(command, Journal.NO_COMMAND)
+			for frame in frames:
+				self.journal.record(Journal.SENT, node_name, frame, opcode)
+				opcode = Journal.NO_COMMAND  # the rest are fragments of the same message
+
+	def _decode_frame(self, sender: str, text: str) -> List[Message]:
+		if text.startswith(CONTROL_MARKER):
+			self.arq.handle_control(sender, text)
+			if self.journal: self.journal.record(Journal.RECEIVED, sender, text)
+			return []
+		messages = MeshCorePrimitives.decode_frame(text, sender, self.reassembly)
+		if self.journal: self.journal.record(Journal.RECEIVED, sender, text, Journal.OPCODE_OF.get(messages[0][1], Journal.NO_COMMAND) if messages else Journal.NO_COMMAND)
+		for id_val, command, payload in messages:
+			if command == COM.PAIR and 'caps' in payload:
+				caps = payload.pop('caps')
+				self.peer_caps[sender] = caps & self.CAPS if isinstance(caps, int) and not isinstance(caps, bool) else 0
+			if command in (COM.PAIR, COM.RESUME) or self.tag_senders:
+				payload['node'] = sender
+		return messages
+
+	# backend interface
+	def send_frames(self, node_name: str, frames: List[str]) -> bool:
+		raise NotImplementedError()
+	def receive_frames(self) -> List[Tuple[str, str]]:
+		'''@return: list of (sender node name, text frame)'''
+		raise NotImplementedError()
+	async def send_frames_async(self, node_name: str, frames: List[str]) -> bool:
+		'''backends which block on sending run it in a thread, override to await it natively'''
+		return await asyncio.to_thread(self.send_frames, node_name, frames)
+	async def receive_frames_async(self) -> List[Tuple[str, str]]:
+		return await asyncio.to_thread(self.receive_frames)
+	def get_contacts(self) -> List[str]:
+		raise NotImplementedError()
+	def get_own_node_name(self) -> Optional[str]:
+		raise NotImplementedError()
+	def close(self):
+		self.arq.close()
+
+class MeshCliTransport(Transport):
+	"""The MeshCore radio, through the persistent worker or one-shot meshcli calls"""
+	needs_radio = True
+
+	def __init__(self):
+		super().__init__()
+		self._set_reassembly(MeshCorePrimitives.get_reassembly_buffer())
+
+	def subscribe_messages(self, callback: MessageCallback) -> bool:
+		self._message_callback = callback
+		return MeshCorePrimitives.subscribe_frames(self._deliver_frame)
+	async def subscribe_messages_async(self, callback: MessageCallback) -> bool:
+		self._message_callback = callback
+		return await MeshCorePrimitives.subscribe_frames_async(self._deliver_frame)
+
+	def send_frames(self, node_name: str, frames: List[str]) -> bool:
+		return MeshCorePrimitives.send_frames(node_name, frames)
+	def receive_frames(self) -> List[Tuple[str, str]]:
+		return MeshCorePrimitives.receive_frames()
+	async def send_frames_async(self, node_name: str, frames: List[str]) -> bool:
+		return await MeshCorePrimitives.send_frames_async(node_name, frames)
+	async def receive_frames_async(self) -> List[Tuple[str, str]]:
+		return await MeshCorePrimitives.receive_frames_async()
+	def get_contacts(self) -> List[str]:
+		return MeshCorePrimitives.get_contacts()
+	def get_own_node_name(self) -> Optional[str]:
+		return MeshCorePrimitives.get_own_node_name()
+	def close(self):
+		super().close()
+		MeshCorePrimitives.close_worker()
+
+class LoopbackTransport(Transport):
+	"""In-memory transport, every instance in the process is a node which can reach all the others"""
+	_nodes: Dict[str, 'LoopbackTransport'] = {}
+	_nodesLock = threading.Lock()
+	_counter = 0
+
+	def __init__(self, name: Optional[str] = None):
+		super().__init__()
+		with LoopbackTransport._nodesLock:
+			LoopbackTransport._counter += 1
+			self.name = name or f'loop{LoopbackTransport._counter}'
+			assert self.name not in LoopbackTransport._nodes, f'loopback node {self.name} already exists'
+			LoopbackTransport._nodes[self.name] = self
+		self.inbox: Queue[Tuple[str, str]] = Queue()
+
+	def subscribe_messages(self, callback: MessageCallback) -> bool:
+		self._message_callback = callback
+		for sender, text in self.receive_frames():  # hand over what arrived before subscribing
+			self._deliver_frame(sender, text)
+		return True
+
+	def send_frames(self, node_name: str, frames: List[str]) -> bool:
+		target = LoopbackTransport._nodes.get(node_name)
+		if target is None:
+			logging.error(f'Failed to send message to {node_name}: no such loopback node')
+			return False
+		for frame in frames:
+			if not target._deliver_frame(self.name, frame):
+				target.inbox.put((self.name, frame))
+		return True
+	def receive_frames(self) -> List[Tuple[str, str]]:
+		frames = []
+		try:
+			while 1:
+				frames.append(self.inbox.get_nowait())
+		except Empty:
+			return frames
+	async def send_frames_async(self, node_name: str, frames: List[str]) -> bool:
+		return self.send_frames(node_name, frames)  # in memory, never blocks
+	async def receive_frames_async(self) -> List[Tuple[str, str]]:
+		return self.receive_frames()
+	def get_contacts(self) -> List[str]:
+		return [name for name in LoopbackTransport._nodes if name != self.name]
+	def get_own_node_name(self) -> Optional[str]:
+		return self.name
+	def close(self):
+		super().close()
+		with LoopbackTransport._nodesLock:
+			LoopbackTransport._nodes.pop(self.name, None)
+
+class UdpTransport(Transport):
+	"""Localhost UDP transport, nodes are processes bound to ports in a fixed range
+	node names are 'udp<port>', contacts are the other bound ports of the range"""
+	BASE_PORT = 47470
+	PORT_COUNT = 16
+	MAX_DATAGRAM = 4096
+
+	def __init__(self):
+		super().__init__()
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		for port in range(self.BASE_PORT, self.BASE_PORT + self.PORT_COUNT):
+			try:
+				self.sock.bind(('127.0.0.1', port))
+				break
+			except OSError:
+				continue
+		else:
+			raise RuntimeError(f'No free UDP port in {self.BASE_PORT}-{self.BASE_PORT + self.PORT_COUNT - 1}')
+		self.port = port
+		self.inbox: Queue[Tuple[str, str]] = Queue()
+		self.readThread = threading.Thread(target=self._readLoop, name='Thread-Udp', daemon=True)
+		self.readThread.start()
+
+	def _readLoop(self):
+		while 1:
+			try:
+				data, addr = self.sock.recvfrom(self.MAX_DATAGRAM)
+			except OSError:
+				return  # socket closed
+			sender, text = f'udp{addr[1]}', data.decode('utf-8', 'ignore')
+			if not self._deliver_frame(sender, text):
+				self.inbox.put((sender, text))
+
+	def subscribe_messages(self, callback: MessageCallback) -> bool:
+		self._message_callback = callback
+		for sender, text in self.receive_frames():
+			self._deliver_frame(sender, text)
+		return True
+
+	def send_frames(self, node_name: str, frames: List[str]) -> bool:
+		try:
+			port = int(node_name.removeprefix('udp'))
+			for frame in frames:
+				self.sock.sendto(frame.encode('utf-8'), ('127.0.0.1', port))
+		except (ValueError, OSError) as e:
+			logging.error(f'Failed to send message to {node_name}: {e}')
+			return False
+		return True
+	def receive_frames(self) -> List[Tuple[str, str]]:
+		frames = []
+		try:
+			while 1:
+				frames.append(self.inbox.get_nowait())
+		except Empty:
+			return frames
+	async def send_frames_async(self, node_name: str, frames: List[str]) -> bool:
+		return self.send_frames(node_name, frames)  # datagrams to localhost don't block
+	async def receive_frames_async(self) -> List[Tuple[str, str]]:
+		return self.receive_frames()
+	def get_contacts(self) -> List[str]:
+		contacts = []
+		for port in range(self.BASE_PORT, self.BASE_PORT + self.PORT_COUNT):
+			if port == self.port: continue
+			probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+			try:
+				probe.bind(('127.0.0.1', port))
+			except OSError:
+				contacts.append(f'udp{port}')  # port taken -> another node lives there
+			finally:
+				probe.close()
+		return contacts
+	def get_own_node_name(self) -> Optional[str]:
+		return f'udp{self.port}'
+	def close(self):
+		super().close()
+		self.sock.close()
+
+TRANSPORTS = {'meshcli': MeshCliTransport, 'loopback': LoopbackTransport, 'udp': UdpTransport}
+DEFAULT_TRANSPORT = 'meshcli'
+
+def create_transport(name: Optional[str] = None) -> Transport:
+	"""Create the transport given by name, or by the '--transport' command line flag"""
+	if name is None:
+		parser = argparse.ArgumentParser(add_help=False)
+		parser.add_argument('--transport', choices=list(TRANSPORTS), default=DEFAULT_TRANSPORT)
+		args, unknown = parser.parse_known_args()
+		name = args.transport
+	logging.debug(f'using {name} transport')
+	return TRANSPORTS[name]()
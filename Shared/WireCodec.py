@@ -0,0 +1,396 @@
+"""
+Compact binary encoding of game messages.
+
+Layout of an encoded message:
+	byte 0     version (high nibble) | schema index (low nibble, 0 = generic)
+	byte 1     opcode, the index of the command in `COM`
+	varint     player id
+	varint     sequence number                     (version 2 only)
+	varint     sequence number answered, 0 = none  (version 2 only)
+	...        payload
+
+The sequence numbers travel as the 'seq' and 're' payload fields: messages
+carrying a 'seq' are encoded as version 2, others as version 1.
+
+Payloads of the common requests are packed by a per-command schema (field
+order and types are implied, so e.g. a SHOOT position is a single byte).
+Anything else uses a generic tagged encoding with one-byte ids for the
+known payload keys. Ships and grid positions have their own value types
+(2 bytes and 1 byte), and a complete fleet in canonical order is sent as
+a bitboard (`Shared.FleetCodec`, 14 bytes), so a whole fleet layout fits
+into one radio frame.
+
+Several encoded messages can travel together as a batch: a zero header
+byte followed by the messages, each prefixed by its varint length.
+Between peers which announced `CAP_DEFLATE` an encoded message or batch
+may be deflated against a preset dictionary of typical game messages,
+behind a `COMPRESSED` header byte.
+
+Over the text-only mesh the bytes travel base85-armoured behind
+`BINARY_MARKER`; JSON frames start with '{' so both can coexist.
+"""
+import base64
+import struct
+import zlib
+from typing import Optional, Tuple, List, Any
+
+from Shared.Enums import COM
+from Shared.FleetCodec import Fleet, FleetError
+
+VERSION = 1
+SEQUENCED = 2  # version of messages with sequence numbers
+BATCH = 0x00  # header byte of a batch, version 0 is never a message
+COMPRESSED = 0x01  # header byte of deflated bytes
+CAP_DEFLATE = 0x01  # capability bit, announced in the 'caps' field of PAIR
+BINARY_MARKER = '~'
+GRID_SIZE = 10
+
+OPCODES: List[COM] = list(COM)
+_OPCODE_OF = {com: i for i, com in enumerate(OPCODES)}
+
+# Payload keys with a one-byte id, append only - the index is on the wire
+KEYS = ['pos', 'size', 'horizontal', 'hitted', 'ships', 'ready', 'id', 'name', 'expected', 'opponent', 'paired', 'rematched',
+	'opponent_ready', 'opponent_state', 'approved', 'started', 'on_turn', 'shotted', 'sunken_ship', 'game_won', 'opponent_grid',
+	'game_end_msg', 'stay_connected', 'expected_opponent_rematch', 'rematch_desired', 'changed', 'opponent_disconnected', 'opponent_rematching', 'caps',
+	'version', 'turn', 'hash', 'moves']
+_KEY_ID = {key: i for i, key in enumerate(KEYS)}
+KEY_INLINE = 0xFF
+
+# value tags
+T_NONE, T_FALSE, T_TRUE, T_INT, T_STR, T_LIST, T_DICT, T_POS, T_SHIP, T_FLOAT, T_SHIPS, T_FLEET = range(12)
+T_BOOL = 0x100  # schema-only field type, the tag is implied by the field
+
+# per-command schemas, (key, type) fields in wire order; the schema index is stored in the header
+SCHEMAS: dict[COM, List[Tuple[Tuple[str, int], ...]]] = {
+	COM.PAIR: [(('name', T_STR), ('id', T_INT)), (('name', T_STR), ('id', T_INT), ('caps', T_INT))],
+	COM.OPPONENT_READY: [(('expected', T_BOOL),)],
+	COM.GAME_READINESS: [(('ships', T_SHIPS), ('ready', T_BOOL), ('id', T_INT)), (('ships', T_FLEET), ('ready', T_BOOL), ('id', T_INT))],
+	COM.SHOOT: [(('pos', T_POS),)],
+	COM.AWAIT_REMATCH: [(('expected_opponent_rematch', T_BOOL),)],
+	COM.UPDATE_REMATCH: [(('rematch_desired', T_BOOL),)],
+	COM.STATE: [(('version', T_INT), ('ready', T_BOOL), ('on_turn', T_INT), ('rematch_desired', T_BOOL))],
+	COM.RESUME: [(('turn', T_INT), ('hash', T_INT), ('moves', T_LIST))],
+	COM.HEARTBEAT: [()],
+}
+
+class CodecError(ValueError):
+	pass
+
+# primitives ----------------------------------------------
+def _write_varint(buf: bytearray, n: int):
+	assert n >= 0
+	while n >= 0x80:
+		buf.append((n & 0x7F) | 0x80)
+		n >>= 7
+	buf.append(n)
+
+def _read_varint(data: bytes, i: int) -> Tuple[int, int]:
+	n = shift = 0
+	while True:
+		if i >= len(data): raise CodecError('truncated varint')
+		b = data[i]
+		i += 1
+		n |= (b & 0x7F) << shift
+		if not b & 0x80: return n, i
+		shift += 7
+
+def _write_str(buf: bytearray, s: str):
+	raw = s.encode('utf-8')
+	_write_varint(buf, len(raw))
+	buf += raw
+
+def _read_str(data: bytes, i: int) -> Tuple[str, int]:
+	n, i = _read_varint(data, i)
+	if i + n > len(data): raise CodecError('truncated string')
+	try:
+		return data[i:i+n].decode('utf-8'), i + n
+	except UnicodeDecodeError as e:
+		raise CodecError(f'bad string: {e}')
+
+def _is_int(v) -> bool:
+	return isinstance(v, int) and not isinstance(v, bool)
+
+def _is_pos(v) -> bool:
+	return isinstance(v, (list, tuple)) and len(v) == 2 and all(_is_int(c) and 0 <= c < GRID_SIZE for c in v)
+
+def _is_ship(v) -> bool:
+	if not isinstance(v, dict) or v.keys() != {'pos', 'size', 'horizontal', 'hitted'}: return False
+	size, hitted = v['size'], v['hitted']
+	return _is_pos(v['pos']) and _is_int(size) and 1 <= size <= 4 and isinstance(v['horizontal'], bool) \
+		and isinstance(hitted, list) and len(hitted) == size and all(isinstance(h, bool) for h in hitted)
+
+def _fits(tag: int, v) -> bool:
+	if tag == T_BOOL: return isinstance(v, bool)
+	if tag == T_INT: return _is_int(v)
+	if tag == T_STR: return isinstance(v, str)
+	if tag == T_POS: return _is_pos(v)
+	if tag == T_SHIPS: return isinstance(v, list) and all(_is_ship(s) for s in v)
+	if tag == T_FLEET: return _is_fleet(v)
+	if tag == T_LIST: return isinstance(v, list)
+	return False
+
+def _is_fleet(v) -> bool:
+	'''ships which the bitboard reproduces exactly, same ships in the same order'''
+	if not isinstance(v, list) or not v or not all(_is_ship(s) for s in v): return False
+	try:
+		return Fleet.from_dicts(v).ships == v
+	except FleetError:
+		return False
+
+# typed values -------------------------------------------
+def _write_pos(buf: bytearray, pos):
+	buf.append(pos[1] * GRID_SIZE + pos[0])
+
+def _read_pos(data: bytes, i: int) -> Tuple[list, int]:
+	if i >= len(data): raise CodecError('truncated position')
+	y, x = divmod(data[i], GRID_SIZE)
+	return [x, y], i + 1
+
+def _write_ship(buf: bytearray, ship: dict):
+	_write_pos(buf, ship['pos'])
+	hittedBits = sum(1 << n for n, h in enumerate(ship['hitted']) if h)
+	buf.append(ship['size'] | ship['horizontal'] << 3 | hittedBits << 4)
+
+def _read_ship(data: bytes, i: int) -> Tuple[dict, int]:
+	pos, i = _read_pos(data, i)
+	if i >= len(data): raise CodecError('truncated ship')
+	b = data[i]
+	size = b & 0x07
+	return {'pos': pos, 'size': size, 'horizontal': bool(b & 0x08), 'hitted': [bool(b >> (4 + n) & 1) for n in range(size)]}, i + 1
+
+def _write_typed(buf: bytearray, tag: int, v):
+	if tag == T_BOOL: buf.append(v)
+	elif tag == T_INT: _write_varint(buf, v << 1 if v >= 0 else (-v << 1) - 1)  # zigzag
+	elif tag == T_STR: _write_str(buf, v)
+	elif tag == T_POS: _write_pos(buf, v)
+	elif tag == T_SHIP: _write_ship(buf, v)
+	elif tag == T_SHIPS:
+		_write_varint(buf, len(v))
+		for ship in v: _write_ship(buf, ship)
+	elif tag == T_FLEET:
+		packed = Fleet.from_dicts(v).encode()
+		_write_varint(buf, len(packed))
+		buf += packed
+	elif tag == T_FLOAT: buf += struct.pack('<d', v)
+	elif tag == T_LIST:
+		_write_varint(buf, len(v))
+		for item in v: _write_value(buf, item)
+	elif tag == T_DICT: _write_dict(buf, v)
+	else: raise CodecError(f'unknown tag {tag}')
+
+def _read_typed(data: bytes, i: int, tag: int) -> Tuple[Any, int]:
+	if tag == T_BOOL:
+		if i >= len(data): raise CodecError('truncated bool')
+		return bool(data[i]), i + 1
+	elif tag == T_INT:
+		n, i = _read_varint(data, i)
+		return (n >> 1) if not n & 1 else -((n + 1) >> 1), i
+	elif tag == T_STR: return _read_str(data, i)
+	elif tag == T_POS: return _read_pos(data, i)
+	elif tag == T_SHIP: return _read_ship(data, i)
+	elif tag == T_SHIPS:
+		n, i = _read_varint(data, i)
+		ships = []
+		for _ in range(n):
+			ship, i = _read_ship(data, i)
+			ships.append(ship)
+		return ships, i
+	elif tag == T_FLEET:
+		n, i = _read_varint(data, i)
+		if i + n > len(data): raise CodecError('truncated fleet')
+		try:
+			return Fleet.decode(data[i:i+n]).to_dicts(), i + n
+		except FleetError as e:
+			raise CodecError(f'bad fleet: {e}')
+	elif tag == T_FLOAT:
+		if i + 8 > len(data): raise CodecError('truncated float')
+		return struct.unpack_from('<d', data, i)[0], i + 8
+	elif tag == T_LIST:
+		n, i = _read_varint(data, i)
+		items = []
+		for _ in range(n):
+			item, i = _read_value(data, i)
+			items.append(item)
+		return items, i
+	elif tag == T_DICT: return _read_dict(data, i)
+	raise CodecError(f'unknown tag {tag}')
+
+# generic tagged values -------------------------------------
+def _tag_of(v) -> int:
+	if v is None: return T_NONE
+	if v is False: return T_FALSE
+	if v is True: return T_TRUE
+	if _is_int(v): return T_INT
+	if isinstance(v, float): return T_FLOAT
+	if isinstance(v, str): return T_STR
+	if _is_pos(v): return T_POS
+	if _is_ship(v): return T_SHIP
+	if _is_fleet(v): return T_FLEET
+	if isinstance(v, (list, tuple)): return T_SHIPS if v and all(_is_ship(s) for s in v) else T_LIST
+	if isinstance(v, dict): return T_DICT
+	raise CodecError(f'cannot encode value of type {type(v).__name__}')
+
+def _write_value(buf: bytearray, v):
+	tag = _tag_of(v)
+	buf.append(tag)
+	if tag not in (T_NONE, T_FALSE, T_TRUE): _write_typed(buf, tag, v)
+
+def _read_value(data: bytes, i: int) -> Tuple[Any, int]:
+	if i >= len(data): raise CodecError('truncated value')
+	tag = data[i]
+	if tag == T_NONE: return None, i + 1
+	if tag == T_FALSE: return False, i + 1
+	if tag == T_TRUE: return True, i + 1
+	return _read_typed(data, i + 1, tag)
+
+def _write_dict(buf: bytearray, d: dict):
+	_write_varint(buf, len(d))
+	for key, v in d.items():
+		if not isinstance(key, str): raise CodecError('payload keys must be strings')
+		if key in _KEY_ID: buf.append(_KEY_ID[key])
+		else:
+			buf.append(KEY_INLINE)
+			_write_str(buf, key)
+		_write_value(buf, v)
+
+def _read_dict(data: bytes, i: int) -> Tuple[dict, int]:
+	n, i = _read_varint(data, i)
+	d = {}
+	for _ in range(n):
+		if i >= len(data): raise CodecError('truncated key')
+		keyId = data[i]
+		i += 1
+		if keyId == KEY_INLINE: key, i = _read_str(data, i)
+		elif keyId < len(KEYS): key = KEYS[keyId]
+		else: raise CodecError(f'unknown key id {keyId}')
+		d[key], i = _read_value(data, i)
+	return d, i
+
+# api ---------------------------------------------------
+def _match_schema(command: COM, payload: dict) -> int:
+	'''@return: 1-based index of the schema matching the payload, 0 if none does
+	later schemas are the more compact variants, so they are tried first'''
+	for n, schema in reversed(list(enumerate(SCHEMAS.get(command, []), 1))):
+		if len(schema) == len(payload) and all(key in payload and _fits(tag, payload[key]) for key, tag in schema):
+			return n
+	return 0
+
+def encode(player_id: int, command: str, payload: dict) -> bytes:
+	"""Encode a game message to bytes"""
+	command = COM(command)
+	buf = bytearray()
+	seq, re = payload.get('seq'), payload.get('re')
+	if seq is not None:
+		if not _is_int(seq) or seq < 1 or not (re is None or _is_int(re) and re >= 1): raise CodecError('bad sequence numbers')
+		payload = {key: v for key, v in payload.items() if key not in ('seq', 're')}
+	schemaIdx = _match_schema(command, payload)
+	buf.append((VERSION if seq is None else SEQUENCED) << 4 | schemaIdx)
+	buf.append(_OPCODE_OF[command])
+	_write_varint(buf, player_id)
+	if seq is not None:
+		_write_varint(buf, seq)
+		_write_varint(buf, re or 0)
+	if schemaIdx:
+		for key, tag in SCHEMAS[command][schemaIdx - 1]:
+			_write_typed(buf, tag, payload[key])
+	else:
+		_write_dict(buf, payload)
+	return bytes(buf)
+
+def decode(data: bytes) -> Tuple[int, str, dict]:
+	"""Decode bytes produced by `encode`, raises CodecError on malformed input"""
+	if len(data) < 3: raise CodecError('message too short')
+	version, schemaIdx = data[0] >> 4, data[0] & 0x0F
+	if version not in (VERSION, SEQUENCED): raise CodecError(f'unsupported codec version {version}')
+	if data[1] >= len(OPCODES): raise CodecError(f'unknown opcode {data[1]}')
+	command = OPCODES[data[1]]
+	player_id, i = _read_varint(data, 2)
+	if version == SEQUENCED:
+		seq, i = _read_varint(data, i)
+		re, i = _read_varint(data, i)
+	if schemaIdx:
+		schemas = SCHEMAS.get(command, [])
+		if schemaIdx > len(schemas): raise CodecError(f'unknown schema {schemaIdx} for {command}')
+		payload = {}
+		for key, tag in schemas[schemaIdx - 1]:
+			payload[key], i = _read_typed(data, i, tag)
+	else:
+		payload, i = _read_dict(data, i)
+	if i != len(data): raise CodecError('trailing bytes after message')
+	if version == SEQUENCED:
+		payload['seq'] = seq
+		if re: payload['re'] = re
+	return player_id, command, payload
+
+def encode_batch(messages: List[bytes]) -> bytes:
+	"""Pack several encoded messages into one"""
+	buf = bytearray([BATCH])
+	for msg in messages:
+		_write_varint(buf, len(msg))
+		buf += msg
+	return bytes(buf)
+
+def is_batch(data: bytes) -> bool:
+	return data[:1] == bytes([BATCH])
+
+def decode_batch(data: bytes) -> List[bytes]:
+	"""Split bytes produced by `encode_batch`, raises CodecError on malformed input"""
+	if not is_batch(data): raise CodecError('not a batch')
+	messages, i = [], 1
+	while i < len(data):
+		n, i = _read_varint(data, i)
+		if i + n > len(data): raise CodecError('truncated batch')
+		messages.append(data[i:i+n])
+		i += n
+	return messages
+
+def _sample_fleet(hitted: bool) -> List[dict]:
+	return [{'pos': [0, 0], 'size': size, 'horizontal': True, 'hitted': [hitted] * size} for size in (4, 3, 3, 2, 2, 2, 1, 1, 1)]
+
+_preset_dict: Optional[bytes] = None
+def preset_dictionary() -> bytes:
+	'''typical encoded messages, the most repetitive (game end) last where deflate finds them cheapest
+	changing it breaks decompression with older peers, add a new header byte instead'''
+	global _preset_dict
+	if _preset_dict is None:
+		_preset_dict = b''.join([
+			encode(0, COM.SHOOT, {'hitted': False, 'sunken_ship': None, 'game_won': False}),
+			encode(0, COM.SHOOT, {'hitted': True, 'sunken_ship': None, 'game_won': False}),
+			encode(0, COM.SHOOT, {'hitted': True, 'sunken_ship': _sample_fleet(True)[0], 'game_won': False}),
+			encode(0, COM.SHOOT, {'hitted': True, 'sunken_ship': _sample_fleet(True)[8], 'game_won': True,
+				'opponent_grid': {'ships': _sample_fleet(True)}, 'game_end_msg': 'You lost!   :(', 'stay_connected': False}),
+			encode(0, COM.GAME_READINESS, {'ships': _sample_fleet(False), 'ready': True, 'id': 0}),
+		])
+	return _preset_dict
+
+def compress(data: bytes) -> Optional[bytes]:
+	"""Deflate encoded bytes, None if that doesn't make them shorter"""
+	deflater = zlib.compressobj(9, zlib.DEFLATED, -15, zdict=preset_dictionary())
+	packed = bytes([COMPRESSED]) + deflater.compress(data) + deflater.flush()
+	return packed if len(packed) < len(data) else None
+
+def is_compressed(data: bytes) -> bool:
+	return data[:1] == bytes([COMPRESSED])
+
+def decompress(data: bytes) -> bytes:
+	"""Inverse of `compress`, raises CodecError on malformed input"""
+	if not is_compressed(data): raise CodecError('not compressed')
+	try:
+		inflater = zlib.decompressobj(-15, zdict=preset_dictionary())
+		out = inflater.decompress(data[1:], 64 * 1024)
+	except zlib.error as e:
+		raise CodecError(f'bad deflate stream: {e}')
+	if not inflater.eof: raise CodecError('truncated or oversized deflate stream')
+	return out
+
+def to_text(data: bytes) -> str:
+	"""Armour bytes for the text-only mesh"""
+	return BINARY_MARKER + base64.b85encode(data).decode('ascii')
+
+def from_text(text: str) -> Optional[bytes]:
+	"""Inverse of `to_text`, None if the text isn't an armoured binary frame"""
+	if not text.startswith(BINARY_MARKER): return None
+	try:
+		return base64.b85decode(text[1:])
+	except ValueError:
+		return None
@@ -0,0 +1,63 @@
+import time
+import pytest
+
+from Shared.Transport import LoopbackTransport
+from Shared.Enums import COM
+from Client.AsyncSession import AsyncSession
+
+def waitFor(condition, timeout=5.):
+	deadline = time.monotonic() + timeout
+	while not condition():
+		assert time.monotonic() < deadline, 'timed out'
+		time.sleep(.005)
+
+class SlowSubscription(LoopbackTransport):
+	'''subscribing takes a while, like the radio worker's first subscribe'''
+	DELAY = .5
+
+	def __init__(self, name):
+		super().__init__(name)
+		self.subscriptions = 0
+	def subscribe_messages(self, callback):
+		self.subscriptions += 1
+		time.sleep(self.DELAY)
+		return super().subscribe_messages(callback)
+
+def newSession(transport, id_val, opponent):
+	session = AsyncSession(transport)
+	session.id, session.connected, session.opponent_node_name = id_val, True, opponent
+	return session
+
+@pytest.fixture
+def sessions():
+	alice = newSession(SlowSubscription('alice-async'), 3001, 'bob-async')
+	bob = newSession(LoopbackTransport('bob-async'), 3002, 'alice-async')
+	yield alice, bob
+	for session in [alice, bob]:
+		session.connected = False
+		session.quit()
+
+def testRequestAndReply(sessions):
+	alice, bob = sessions
+	answers = []
+	alice.tryToSend(COM.SHOOT, {'pos': [1, 2]}, answers.append, blocking=False)
+	waitFor(lambda: bob.dispatcher.inbox)
+	[(id_val, command, payload)] = bob.unsolicited()
+	assert (id_val, command, payload['pos']) == (alice.id, COM.SHOOT, [1, 2])
+	bob.notify(COM.SHOOT, {'hitted': False}, re=payload['seq'])
+	waitFor(lambda: alice.responseQueue.qsize())
+	alice.loadResponses()
+	assert answers == [{'hitted': False}]
+
+def testSubscribingDoesntBlockTheLoop(sessions):
+	'''the loop keeps sending while the transport subscribes, and subscribes once'''
+	alice, bob = sessions
+	start = time.monotonic()
+	alice.notify(COM.STATE, {'version': 1})
+	waitFor(lambda: bob.dispatcher.inbox)
+	assert time.monotonic() - start < SlowSubscription.DELAY
+	waitFor(lambda: alice.transport._message_callback is not None)
+	time.sleep(2 * SlowSubscription.DELAY)
+	assert alice.transport.subscriptions == 1
+	bob.notify(COM.STATE, {'version': 1})
+	waitFor(lambda: alice.dispatcher.inbox)
@@ -0,0 +1,98 @@
+import time
+import pytest
+
+from Shared.Transport import LoopbackTransport
+from Shared.Enums import COM
+from Client.Session import Session
+from Client.Discovery import OpponentDiscovery
+
+def waitFor(condition, timeout=5.):
+	deadline = time.monotonic() + timeout
+	while not condition():
+		assert time.monotonic() < deadline, 'timed out'
+		time.sleep(.005)
+
+class Node(LoopbackTransport):
+	'''a loopback node which knows only the given contacts'''
+	def __init__(self, name, contacts):
+		super().__init__(name)
+		self.contacts = contacts
+	def get_contacts(self):
+		return list(self.contacts)
+
+@pytest.fixture(autouse=True)
+def quickRounds(monkeypatch):
+	monkeypatch.setattr(OpponentDiscovery, 'ROUND_PAUSE', .1)
+	monkeypatch.setattr(OpponentDiscovery, 'PROBE_TIMEOUT', .3)
+
+@pytest.fixture
+def mesh():
+	'''@return: a function making a session of a node, and its discovery if the player looks for a game'''
+	sessions, discoveries = [], []
+	def node(name, contacts=(), looking=True):
+		session = Session(Node(f'{name}-disc', [f'{contact}-disc' for contact in contacts]))
+		session.id = 4001 + len(sessions)
+		sessions.append(session)
+		if not looking: return session
+		discovery = OpponentDiscovery(session, name)
+		discoveries.append(discovery)
+		discovery.start()
+		return discovery
+	yield node
+	for discovery in discoveries: discovery.stop()
+	for session in sessions: session.quitNowEvent.set()
+	for session in sessions: session.quit()
+
+def testTwoPlayersPair(mesh):
+	alice, bob = mesh('alice', ['bob']), mesh('bob', ['alice'])
+	waitFor(lambda: alice.match and bob.match)
+	assert alice.match == ('bob-disc', {'id': bob.session.id, 'name': 'bob'})
+	assert bob.match == ('alice-disc', {'id': alice.session.id, 'name': 'alice'})
+
+def testCancelledProbesBackOff(mesh):
+	'''players matched already cancel the probes of a third one, which probes them ever more rarely'''
+	alice, bob = mesh('alice', ['bob']), mesh('bob', ['alice'])
+	waitFor(lambda: alice.match and bob.match)
+	carol = mesh('carol', ['alice', 'bob'])
+	time.sleep(1.5)  # 15 rounds
+	assert carol.match is None and carol.timeouts == 0, 'a cancel frees the probe at once'
+	assert carol._misses['alice-disc'] >= 4 and carol.probesSent <= 2 * 6
+	assert alice.match[0] == 'bob-disc' and bob.match[0] == 'alice-disc'
+
+def testSilentNodeIsRested(mesh):
+	'''a player whose discovery stopped, e.g. in a match, doesn't answer'''
+	busy = mesh('busy', looking=False)
+	carol = mesh('carol', ['busy'])
+	waitFor(lambda: carol.timeouts == 3)
+	assert carol._restedUntil['busy-disc'] - time.monotonic() > OpponentDiscovery.ROUND_PAUSE, 'left out of the next rounds'
+	assert carol.probesSent == 3 and len(busy.unsolicited()) == 3
+
+def listen(session):
+	'''@return: the PAIR messages the session is going to hear'''
+	heard = []
+	session.unsolicitedHandlers[COM.PAIR] = lambda id_val, payload, seq: heard.append((id_val, payload))
+	return heard
+
+def testLostMatch(mesh):
+	alice = mesh('alice')
+	xena = mesh('xena', looking=False)
+	heard = listen(xena)
+	xena.sendTo('alice-disc', COM.PAIR, {'name': 'xena', 'id': xena.id})
+	waitFor(lambda: heard)
+	[(id_val, payload)] = heard
+	assert alice.match == ('xena-disc', {'id': xena.id, 'name': 'xena'})
+	assert payload['paired'] is True and payload['opponent'] == {'id': alice.session.id, 'name': 'alice'}
+	xena.sendTo('alice-disc', COM.PAIR, {'name': 'xena', 'id': xena.id, 'paired': False})
+	waitFor(lambda: alice.lost == 1)
+	assert alice.match is None
+
+def testStopRightAfterMatchingSendsTheAccept(mesh):
+	'''the game stops discovery as soon as it sees the match, the accept still goes out'''
+	alice = mesh('alice')
+	xena = mesh('xena', looking=False)
+	heard = listen(xena)
+	alice.onPair(xena.id, {'name': 'xena', 'id': xena.id, 'node': 'xena-disc'}, seq=1)
+	alice.stop()
+	waitFor(lambda: heard)
+	[(id_val, payload)] = heard
+	assert (id_val, payload['paired'], payload['re']) == (alice.session.id, True, 1)
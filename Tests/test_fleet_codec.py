@@ -0,0 +1,94 @@
+import random
+import pytest
+
+from Shared.FleetCodec import Fleet, FleetError, GRID_SIZE
+
+def ship(x, y, size=1, horizontal=True, hitted=None):
+	return {'pos': [x, y], 'size': size, 'horizontal': horizontal, 'hitted': hitted or [False] * size}
+
+def cellsOf(d):
+	x, y = d['pos']
+	return [(x + i * d['horizontal'], y + i * (not d['horizontal'])) for i in range(d['size'])]
+
+def legal(dicts):
+	'''the rules checked without bitboards: inside the grid, no two ships touching, not even diagonally'''
+	cells = [cellsOf(d) for d in dicts]
+	if any(not (0 <= x < GRID_SIZE and 0 <= y < GRID_SIZE) for ship in cells for x, y in ship): return False
+	for i, a in enumerate(cells):
+		for b in cells[i + 1:]:
+			if any(abs(ax - bx) <= 1 and abs(ay - by) <= 1 for ax, ay in a for bx, by in b): return False
+	return True
+
+def randomLayout(rnd, sizes=(4, 3, 3, 2, 2, 2, 1, 1, 1, 1)):
+	dicts = []
+	for size in sizes:
+		for _ in range(200):
+			d = ship(rnd.randrange(GRID_SIZE), rnd.randrange(GRID_SIZE), size, rnd.random() < .5)
+			d['hitted'] = [rnd.random() < .3 for _ in range(size)]
+			if legal(dicts + [d]):
+				dicts.append(d)
+				break
+	return dicts
+
+def canonical(dicts):
+	return sorted(dicts, key=lambda d: (d['pos'][1], d['pos'][0]))
+
+def assertRoundTrip(dicts):
+	fleet = Fleet.from_dicts(dicts)
+	assert fleet.to_dicts() == canonical(dicts)
+	assert Fleet.decode(fleet.encode()).to_dicts() == canonical(dicts)
+
+@ pytest.mark.parametrize('dicts', [
+	[ship(0, 9), ship(9, 9)],
+	[ship(0, 7, 3, False), ship(9, 8, 2, False)],
+	[ship(9, 0), ship(0, 1)],
+	[ship(9, 8), ship(0, 9)],
+	[ship(0, 0), ship(9, 0), ship(0, 9), ship(9, 9)],
+	[ship(6, 9, 4), ship(0, 8, 2)],
+	[ship(9, 6, 4, False), ship(0, 0, 4, False)],
+	[ship(0, 0, 4), ship(6, 0, 4)],
+])
+def test_edges_and_corners(dicts):
+	assertRoundTrip(dicts)
+
+def test_all_single_cell_pairs():
+	'''every legal placement of two one-cell ships, the edges and corners included'''
+	cells = [(x, y) for y in range(GRID_SIZE) for x in range(GRID_SIZE)]
+	for i, a in enumerate(cells):
+		for b in cells[i + 1:]:
+			dicts = [ship(*a), ship(*b, horizontal=False)]
+			if legal(dicts): assertRoundTrip(dicts)
+			else:
+				with pytest.raises(FleetError): Fleet.from_dicts(dicts)
+
+def test_random_layouts():
+	rnd = random.Random(10)
+	for _ in range(500):
+		assertRoundTrip(randomLayout(rnd))
+
+@ pytest.mark.parametrize('dicts', [
+	[ship(0, 0, 2), ship(2, 0)],  # side by side
+	[ship(0, 0), ship(1, 1)],  # diagonal
+	[ship(9, 9), ship(8, 8)],
+	[ship(0, 0, 3), ship(1, 0, 2, False)],  # crossing
+	[ship(8, 0, 3)],  # out of the grid
+	[ship(0, 8, 3, False)],
+])
+def test_illegal_layouts(dicts):
+	with pytest.raises(FleetError):
+		Fleet.from_dicts(dicts)
+
+def test_shooting():
+	fleet = Fleet.from_dicts([ship(0, 9, 2), ship(9, 9)])
+	assert fleet.shoot([5, 5]) == (False, None, False)
+	assert fleet.shoot([0, 9]) == (True, None, False)
+	hit, sunk, won = fleet.shoot([1, 9])
+	assert hit and sunk['pos'] == [0, 9] and not won
+	hit, sunk, won = fleet.shoot([9, 9])
+	assert hit and sunk['pos'] == [9, 9] and won
+	assert Fleet.decode(fleet.encode()).to_dicts() == fleet.to_dicts()
+
+@ pytest.mark.parametrize('data', [b'', b'\x00' * 12, (1 << 100).to_bytes(13, 'little'), (1).to_bytes(13, 'little'), (1).to_bytes(13, 'little') + b'\x00\x00\x00'])
+def test_malformed(data):
+	with pytest.raises(FleetError):
+		Fleet.decode(data)
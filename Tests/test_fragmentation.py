@@ -0,0 +1,148 @@
+import base64
+import random
+import sys
+import threading
+import pytest
+
+from Shared.Fragmentation import Fragmenter, ReassemblyBuffer, parse_fragment, FRAGMENT_MARKER, MAX_FRAGMENTS
+
+FRAME_SIZE = 40
+
+def message(n, seed=0):
+	return random.Random(seed).randbytes(n)
+
+def fragments(data, fragmenter=None):
+	return (fragmenter or Fragmenter(FRAME_SIZE)).fragment(data)
+
+def newBuffer(**kwargs):
+	return ReassemblyBuffer(Fragmenter(FRAME_SIZE).data_chars, **kwargs)
+
+def feed(buffer, frames, sender='a', now=0.):
+	'''@return: the messages completed'''
+	return [msg for frame in frames if (msg := buffer.add(sender, parse_fragment(frame), now)) is not None]
+
+@pytest.mark.parametrize('n', [1, 27, 28, 29, 100, 500])
+def testFramesAreExactlyFull(n):
+	frames = fragments(message(n))
+	assert all(len(frame) == FRAME_SIZE for frame in frames[:-1])
+	assert 0 < len(frames[-1]) <= FRAME_SIZE
+	dataChars = Fragmenter(FRAME_SIZE).data_chars
+	assert len(frames) == -(-len(base64.b85encode(message(n))) // dataChars), 'minimal number of fragments'
+
+def testTooLong():
+	fragmenter = Fragmenter(FRAME_SIZE)
+	with pytest.raises(ValueError): fragmenter.fragment(message(fragmenter.data_chars * MAX_FRAGMENTS))
+
+def testParse():
+	frames = fragments(message(100))
+	msgId, index, total, data = parse_fragment(frames[2])
+	assert index == 2 and total == len(frames) and data
+	assert parse_fragment('{"id": 1}') is None
+	assert parse_fragment(FRAGMENT_MARKER + 'ab') is None
+
+@pytest.mark.parametrize('n', [1, 50, 500])
+def testInOrder(n):
+	data = message(n)
+	assert feed(newBuffer(), fragments(data)) == [data]
+
+def testReordered():
+	rnd = random.Random(1)
+	for n in [30, 200, 1000]:
+		data = message(n, n)
+		frames = fragments(data)
+		rnd.shuffle(frames)
+		buffer = newBuffer()
+		assert feed(buffer, frames) == [data]
+		assert buffer.stats()['pending'] == 0 and buffer.stats()['completed'] == 1
+
+def testDuplicates():
+	data = message(300)
+	frames = fragments(data)
+	buffer = newBuffer()
+	assert feed(buffer, frames[:3] + frames[:3] + frames[3:]) == [data]
+	assert feed(buffer, frames) == [], 'late copies of a completed message are no new message'
+	assert buffer.stats()['duplicates'] == 3 + len(frames)
+
+def testLossThenRetransmission():
+	data = message(400)
+	frames = fragments(data)
+	lost = {1, 4, len(frames) - 1}
+	buffer = newBuffer()
+	assert feed(buffer, [frame for i, frame in enumerate(frames) if i not in lost]) == []
+	msgId = parse_fragment(frames[0])[0]
+	assert buffer.missing('a', msgId) == sorted(lost)
+	assert feed(buffer, [frames[i] for i in reversed(sorted(lost))]) == [data]
+	assert buffer.missing('a', msgId) is None
+
+def testInterleavedSenders():
+	fragmenter = Fragmenter(FRAME_SIZE)
+	a, b = message(200, 1), message(300, 2)
+	framesA, framesB = fragments(a, fragmenter), fragments(b, fragmenter)
+	buffer = newBuffer()
+	done = []
+	for i in range(max(len(framesA), len(framesB))):
+		if i < len(framesB): done += feed(buffer, [framesB[i]], 'b')
+		if i < len(framesA): done += feed(buffer, [framesA[i]], 'a')
+	assert sorted(done) == sorted([a, b])
+
+def testSameIdFromTwoSenders():
+	fragmenter = Fragmenter(FRAME_SIZE)
+	a, b = message(100, 1), message(100, 2)
+	framesA, framesB = fragmenter.fragment(a, msg_id=7), fragmenter.fragment(b, msg_id=7)
+	buffer = newBuffer()
+	assert feed(buffer, framesA[:-1], 'a') + feed(buffer, framesB, 'b') + feed(buffer, framesA[-1:], 'a') == [b, a]
+
+def testExpiry():
+	frames = fragments(message(200))
+	buffer = newBuffer(timeout=10)
+	feed(buffer, frames[:-1], now=0.)
+	buffer.expire(now=11.)
+	assert buffer.stats()['expired'] == 1 and buffer.stats()['pending'] == 0
+	assert feed(buffer, frames[-1:], now=11.) == [], 'the rest of the message is gone'
+
+def testCapsEvictOldest():
+	fragmenter = Fragmenter(FRAME_SIZE)
+	buffer = newBuffer(max_messages=3)
+	partials = [fragmenter.fragment(message(100, i)) for i in range(4)]
+	for frames in partials: feed(buffer, frames[:1])
+	assert buffer.stats()['pending'] == 3 and buffer.stats()['dropped'] == 1
+	assert feed(buffer, partials[0][1:]) == [], 'the oldest was evicted'
+	assert feed(buffer, partials[3][1:]) == [message(100, 3)]
+
+def testByteCap():
+	buffer = newBuffer(max_bytes=100)
+	assert feed(buffer, fragments(message(500))) == []
+	assert buffer.stats()['dropped'] == len(fragments(message(500))) and buffer.stats()['pending_bytes'] == 0
+
+def testListener():
+	frames = fragments(message(150))
+	buffer = newBuffer()
+	heard = []
+	buffer.listener = lambda sender, msgId, total, received, index: heard.append((sender, total, received, index))
+	feed(buffer, [frames[2], frames[0], frames[0]])
+	total = len(frames)
+	assert heard == [('a', total, 0b100, 2), ('a', total, 0b101, 0), ('a', total, 0b101, 0)]
+
+def testDifferentFrameSizeIsDropped():
+	frames = fragments(message(200), Fragmenter(FRAME_SIZE + 10))
+	buffer = newBuffer()
+	assert feed(buffer, frames) == []
+	assert buffer.stats()['dropped'] >= 1
+
+def testCopiesOnSeveralThreadsCompleteOnce():
+	'''the ARQ resends from its own thread while the first copies still arrive'''
+	fragmenter = Fragmenter(FRAME_SIZE)
+	buffer = newBuffer(max_messages=1000, max_bytes=10 ** 7)
+	frames = [frame for i in range(300) for frame in fragmenter.fragment(message(60, i))]
+	completed = []
+	def copy():
+		completed.extend(feed(buffer, frames))
+	threads = [threading.Thread(target=copy) for _ in range(4)]
+	interval = sys.getswitchinterval()
+	sys.setswitchinterval(1e-6)  # switch threads often, in the middle of an add
+	try:
+		for thread in threads: thread.start()
+		for thread in threads: thread.join()
+	finally:
+		sys.setswitchinterval(interval)
+	assert sorted(completed) == sorted(message(60, i) for i in range(300)), 'every message completes exactly once'
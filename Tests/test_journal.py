@@ -0,0 +1,83 @@
+import pytest
+
+from Shared import Journal
+from Shared.Journal import JournalWriter, JournalReader, JournalError, SENT, RECEIVED, NOTE
+from Shared.Enums import COM
+
+RECORDS = [
+	(SENT, 'bob', 'pair frame', COM.PAIR),
+	(RECEIVED, 'bob', 'pair answer', COM.PAIR),
+	(SENT, 'bob', '~ack 1', None),
+	(RECEIVED, 'čáp', 'shot', COM.SHOOT),
+	(NOTE, 'bob', '{"moves": 1}', None),
+]
+
+def writeJournal(path, records=RECORDS):
+	writer = JournalWriter(str(path))
+	for direction, peer, frame, command in records:
+		writer.record(direction, peer, frame, Journal.OPCODE_OF[command] if command else Journal.NO_COMMAND)
+	writer.close()
+	return writer
+
+def summary(records):
+	return [(record.direction, record.peer, record.frame, record.command) for record in records]
+
+def testRoundTrip(tmp_path):
+	path = tmp_path / 'a.journal'
+	assert writeJournal(path).records == len(RECORDS)
+	with JournalReader(str(path)) as reader:
+		records = list(reader)
+		assert summary(records) == RECORDS
+		assert all(a.time <= b.time for a, b in zip(records, records[1:]))
+		assert reader.count() == len(RECORDS)
+
+def testFilters(tmp_path):
+	path = tmp_path / 'a.journal'
+	writeJournal(path)
+	with JournalReader(str(path)) as reader:
+		assert summary(reader.records(direction=SENT)) == [RECORDS[0], RECORDS[2]]
+		assert summary(reader.records(direction=RECEIVED, peer='bob')) == [RECORDS[1]]
+		assert summary(reader.records(peer='čáp')) == [RECORDS[3]]
+		assert summary(reader.records(commands=[COM.SHOOT, COM.DISCONNECT])) == [RECORDS[3]]
+		assert reader.count(direction=NOTE) == 1 and reader.count(peer='carol') == 0
+		stamps = [record.time for record in reader]
+		assert reader.count(since=stamps[1], until=stamps[3]) == sum(stamps[1] <= t <= stamps[3] for t in stamps)
+		assert reader.count(since=stamps[-1] + 1) == 0
+
+def testAppends(tmp_path):
+	path = tmp_path / 'a.journal'
+	writeJournal(path, RECORDS[:2])
+	writeJournal(path, RECORDS[2:])
+	with JournalReader(str(path)) as reader:
+		assert summary(reader) == RECORDS
+
+def testTruncatedTail(tmp_path):
+	'''a record cut short by a crash ends the journal'''
+	path = tmp_path / 'a.journal'
+	writeJournal(path)
+	data = path.read_bytes()
+	for cut in [1, len(RECORDS[-1][2]), len(RECORDS[-1][2]) + Journal.RECORD.size - 1]:
+		path.write_bytes(data[:-cut])
+		with JournalReader(str(path)) as reader:
+			assert summary(reader) == RECORDS[:-1]
+
+def testNotAJournal(tmp_path):
+	path = tmp_path / 'a.journal'
+	for data in [b'', b'BSJ', b'garbage']:
+		path.write_bytes(data)
+		with pytest.raises(JournalError): JournalReader(str(path))
+	with pytest.raises(JournalError): JournalWriter(str(path))
+
+def testOneWriterPerPath(tmp_path):
+	'''transports of one process journal into the same writer'''
+	path = tmp_path / 'a.journal'
+	writer = Journal.open_journal(str(path))
+	try:
+		assert Journal.open_journal(str(tmp_path / '.' / 'a.journal')) is writer
+		writer.record(SENT, 'bob', 'frame')
+		writer.flush()
+		with JournalReader(str(path)) as reader:
+			[record] = reader
+			assert (record.direction, record.command, record.frame) == (SENT, None, 'frame')
+	finally:
+		writer.close()
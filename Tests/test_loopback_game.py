@@ -0,0 +1,120 @@
+import random
+import time
+
+from Shared.Transport import LoopbackTransport
+from Shared.Enums import COM, STAGES, SHOTS
+from Client.Session import Session
+from Shared import Journal
+from Client import Game, Checkpoint
+from Client.Replay import Replayer
+
+TIMEOUT = 60.  # s, a match over the loopback takes about 10
+
+def newPlayer(name, tmp_path):
+	game = Game.Game(Session(LoopbackTransport(name)))
+	game.options.playerName = list(name)
+	game.checkpoint = Checkpoint.MatchCheckpoint(str(tmp_path / f'{name}.json'))
+	game.newGameStage(STAGES.CONNECTING)
+	return game
+
+def step(players):
+	'''one iteration of each player's game loop'''
+	for game in players:
+		game.handleConnections()
+		game.drawGame(game.updateTransition())
+
+def place(game):
+	'''what a player clicks: places its fleet and gets ready'''
+	if game.gameStage == STAGES.PLACING and not game.grid.allShipsPlaced():
+		game.grid.autoplace()
+		game.toggleGameReady()
+
+def shooter(rnd):
+	def shoot(game):
+		'''on its turn a player shoots a random cell it didn't shoot yet'''
+		if game.gameStage == STAGES.SHOOTING and game.player_on_turn == game.session.id and game.resumeStarted is None and not game.session.alreadySent[COM.SHOOT]:
+			x, y = rnd.choice([(x, y) for y in range(10) for x in range(10) if game.opponentGrid.shots[y][x] == SHOTS.NOT_SHOTTED])
+			game.opponentGrid.shots[y][x] = SHOTS.SHOTTED_UNKNOWN
+			game.shootReq([x, y])
+	return shoot
+
+def runUntil(players, condition, act=lambda game: None):
+	deadline = time.monotonic() + TIMEOUT
+	while not condition():
+		assert time.monotonic() < deadline, f'stuck in {[game.gameStage.name for game in players]}'
+		step(players)
+		for game in players: act(game)
+		time.sleep(.002)
+
+def crash(game):
+	'''the player's program dies, its networking stops without a word to the opponent'''
+	game.session.quitNowEvent.set()
+	game.session._stopWorkers()
+	game.session.transport.close()
+	if game.discovery: game.discovery.stop()
+	if game.subscription: game.subscription.stop()
+
+def close(players):
+	for game in players:
+		if game.gameStage != STAGES.CLOSING: game.quit()
+	for game in players: game.handleConnections()  # CLOSING joins the session's threads
+
+def testFullGame(tmp_path):
+	alice, bob = players = [newPlayer('alice-loopback', tmp_path), newPlayer('bob-loopback', tmp_path)]
+	try:
+		runUntil(players, lambda: all(game.gameStage == STAGES.PLACING for game in players))
+		assert alice.options.opponentName == 'bob-loopback' and bob.options.opponentName == 'alice-loopback'
+		assert alice.session.opponent_node_name == 'bob-loopback' and bob.session.opponent_node_name == 'alice-loopback'
+
+		runUntil(players, lambda: all(game.gameStage == STAGES.SHOOTING for game in players), place)
+		assert alice.player_on_turn == bob.player_on_turn in (alice.session.id, bob.session.id)
+		assert alice.opponentFleet.to_dicts() and bob.opponentFleet.to_dicts(), 'layouts exchanged'
+
+		runUntil(players, lambda: all(game.gameStage in [STAGES.GAME_END, STAGES.END_GRID_SHOW] for game in players), shooter(random.Random(1)))
+		winner, loser = (alice, bob) if alice.options.gameWon else (bob, alice)
+		assert winner.options.gameEndMsg == 'You won!   :)' and loser.options.gameEndMsg == 'You lost!   :('
+		assert all(all(ship.hitted) for ship in loser.grid.ships)
+		assert alice.moves == bob.moves and alice.moves[-1][0] == winner.session.id
+		assert winner.matchSnapshot()['opponentGrid']['ships'] == loser.matchSnapshot()['grid']['ships'], 'the loser reveals its fleet'
+		for game in players:
+			assert game.session.noPendingReqs() and not game.session.dispatcher.pending()
+			assert not game.checkpoint.load(), 'a finished match is not resumed'
+	finally:
+		close(players)
+	assert all(not game.session.sendThread.is_alive() and not game.session.recvThread.is_alive() for game in players)
+
+def testResumeAfterCrash(tmp_path):
+	'''a player restarted mid-match picks it up from its checkpoint, and the match is finished'''
+	alice, bob = players = [newPlayer('alice-resume', tmp_path), newPlayer('bob-resume', tmp_path)]
+	try:
+		runUntil(players, lambda: all(game.gameStage == STAGES.SHOOTING for game in players), place)
+		shoot = shooter(random.Random(2))
+		runUntil(players, lambda: len(bob.moves) >= 10, shoot)
+		fleet, moves = bob.matchSnapshot()['grid']['ships'], list(bob.moves)
+		crash(bob)
+		players[1] = bob = newPlayer('bob-resume', tmp_path)
+		runUntil(players, lambda: bob.gameStage == STAGES.SHOOTING and bob.resumeStarted is None and alice.resumeStarted is None)
+		assert bob.session.opponent_node_name == 'alice-resume' and bob.options.opponentName == 'alice-resume'
+		assert bob.matchSnapshot()['grid']['ships'] == fleet and bob.moves[:len(moves)] == moves, 'restored from the checkpoint'
+		assert bob.moves == alice.moves[:len(bob.moves)]
+
+		runUntil(players, lambda: all(game.gameStage in [STAGES.GAME_END, STAGES.END_GRID_SHOW] for game in players), shoot)
+		assert alice.options.gameWon != bob.options.gameWon and alice.moves == bob.moves
+		assert all(not game.checkpoint.load() for game in players)
+	finally:
+		close(players)
+
+def testReplayOfARecordedMatch(tmp_path):
+	'''one side of a match is recorded, replaying it ends the same'''
+	path = str(tmp_path / 'alice.journal')
+	alice, bob = players = [newPlayer('alice-replay', tmp_path), newPlayer('bob-replay', tmp_path)]
+	journal = alice.session.transport.journal = Journal.open_journal(path)
+	try:
+		runUntil(players, lambda: all(game.gameStage == STAGES.SHOOTING for game in players), place)
+		runUntil(players, lambda: all(game.gameStage in [STAGES.GAME_END, STAGES.END_GRID_SHOW] for game in players), shooter(random.Random(3)))
+	finally:
+		close(players)
+		journal.close()
+	replayer = Replayer(path, draw=False)
+	assert replayer.run(), replayer.report()
+	assert replayer.matches == 1 and 'where they differ' not in replayer.report()
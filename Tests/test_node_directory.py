@@ -0,0 +1,81 @@
+import time
+import threading
+
+from Shared.NodeDirectory import NodeDirectory
+
+def waitFor(condition, timeout=5.):
+	deadline = time.monotonic() + timeout
+	while not condition():
+		assert time.monotonic() < deadline, 'timed out'
+		time.sleep(.005)
+
+class Radio:
+	'''contacts and name of a radio, fetching blocks while `slow` is cleared'''
+	def __init__(self, contacts):
+		self.contacts = contacts
+		self.name = 'me'
+		self.fetches = 0
+		self.slow = threading.Event()
+		self.slow.set()
+	def fetchContacts(self):
+		self.fetches += 1
+		self.slow.wait()
+		return None if self.contacts is None else list(self.contacts)
+	def fetchOwnName(self):
+		return self.name
+
+def newDirectory(radio, ttl=60.):
+	return NodeDirectory(radio.fetchContacts, radio.fetchOwnName, ttl)
+
+def testFirstLookupWaits():
+	radio = Radio(['a', 'b'])
+	directory = newDirectory(radio)
+	assert directory.contacts() == ['a', 'b'] and directory.own_name() == 'me'
+	radio.contacts = ['c']
+	assert directory.contacts() == ['a', 'b'] and radio.fetches == 1, 'fresh, answered from memory'
+
+def testStaleIsRefreshedInTheBackground():
+	radio = Radio(['a', 'b'])
+	directory = newDirectory(radio, ttl=.05)
+	directory.contacts()
+	time.sleep(.1)
+	radio.contacts = ['b', 'c', 'a']
+	radio.slow.clear()
+	start = time.monotonic()
+	assert directory.contacts() == ['a', 'b'], 'the cached contacts meanwhile'
+	assert directory.contacts() == ['a', 'b'] and time.monotonic() - start < .05
+	radio.slow.set()
+	waitFor(lambda: directory.refreshes == 2)
+	assert directory.contacts() == ['a', 'b', 'c'], 'the known order is kept'
+	assert radio.fetches == 2, 'one refresh at a time'
+
+def testFailedFetchKeepsTheContacts():
+	radio = Radio(['a'])
+	directory = newDirectory(radio, ttl=0.)
+	directory.contacts()
+	radio.contacts = None
+	directory.refresh(wait=True)
+	assert directory.contacts() == ['a']
+
+def testAdverts():
+	'''an advert adds the contact at once, the next refresh has the final say'''
+	radio = Radio([])
+	directory = newDirectory(radio)
+	directory.contacts()
+	directory.add_contact('a')
+	directory.add_contact('a')
+	directory.add_contact('')
+	assert directory.contacts() == ['a'] and directory.adverts == 2
+
+def testInvalidateDropsRunningRefresh():
+	radio = Radio(['old'])
+	directory = newDirectory(radio)
+	radio.slow.clear()
+	directory.refresh()
+	waitFor(lambda: radio.fetches == 1)
+	directory.invalidate()
+	radio.slow.set()
+	directory._refreshing.join()
+	assert directory.refreshes == 0, "the old connection's contacts are dropped"
+	radio.contacts = ['new']
+	assert directory.contacts() == ['new']
@@ -0,0 +1,193 @@
+import random
+import threading
+import time
+import pytest
+
+from Shared.Fragmentation import Fragmenter, ReassemblyBuffer, parse_fragment
+from Shared.Reliability import RttEstimator, ArqEndpoint, encode_control, parse_control
+
+FRAME_SIZE = 40
+
+class Link:
+	'''sender 'a' and receiver 'b', each with its ArqEndpoint, frames pass through drop(dest, frames) -> frames delivered
+	sending a frame to 'b' takes delay s, like on the radio'''
+	def __init__(self, drop=lambda dest, frames: frames, delay=0.):
+		self.drop = drop
+		self.delay = delay
+		self.fragmenter = Fragmenter(FRAME_SIZE)
+		self.buffer = ReassemblyBuffer(self.fragmenter.data_chars)
+		self.sender = ArqEndpoint(self._send)
+		self.receiver = ArqEndpoint(self._send)
+		self.buffer.listener = self.receiver.on_fragment
+		self.delivered: list[bytes] = []
+		self.sent: list[tuple[str, list[str]]] = []  # everything put on the link, lost or not
+		self._lock = threading.Lock()
+
+	def send(self, data: bytes):
+		'''what the transport does for a message to 'b' '''
+		frames = self.fragmenter.fragment(data)
+		self.sender.track('b', frames)
+		self.sender.sent('b', frames, self._send('b', frames))
+
+	def _send(self, dest: str, frames: list[str]) -> bool:
+		with self._lock:
+			self.sent.append((dest, frames))
+			frames = self.drop(dest, frames)
+		for frame in frames:
+			if dest == 'b':
+				time.sleep(self.delay)
+				if (msg := self.buffer.add('a', parse_fragment(frame))) is not None: self.delivered.append(msg)
+			else:
+				self.sender.handle_control('b', frame)
+		return True
+
+	def close(self):
+		self.sender.close()
+		self.receiver.close()
+
+def waitFor(condition, timeout=5.):
+	deadline = time.monotonic() + timeout
+	while not condition():
+		assert time.monotonic() < deadline, 'timed out'
+		time.sleep(.005)
+
+@pytest.fixture(autouse=True)
+def quickTimeouts(monkeypatch):
+	monkeypatch.setattr(RttEstimator, 'INITIAL_RTO', .05)
+	monkeypatch.setattr(RttEstimator, 'MIN_RTO', .02)
+	monkeypatch.setattr(RttEstimator, 'MAX_RTO', .2)
+
+def message(n=300, seed=0):
+	return random.Random(seed).randbytes(n)
+
+def dropOnce(indices):
+	'''loses the fragments with these indices the first time they are sent'''
+	seen = set()
+	def drop(dest, frames):
+		kept = []
+		for frame in frames:
+			fragment = parse_fragment(frame)
+			if fragment and fragment[1] in indices and fragment[1] not in seen:
+				seen.add(fragment[1])
+				continue
+			kept.append(frame)
+		return kept
+	return drop
+
+def fragmentsSent(link, after=1):
+	'''indices of fragments sent again, after the first burst'''
+	return [parse_fragment(frame)[1] for dest, frames in link.sent[after:] if dest == 'b' for frame in frames]
+
+# RTT -------------------------------------------------------
+def testRttEstimator():
+	rtt = RttEstimator()
+	assert rtt.rto == RttEstimator.INITIAL_RTO
+	rtt.sample(.04)
+	assert rtt.srtt == .04 and rtt.rto == pytest.approx(.12)  # srtt + 4 * rtt / 2
+	for _ in range(50): rtt.sample(.04)
+	assert rtt.rto == pytest.approx(.04, rel=.01), 'a steady rtt leaves no variance'
+	for _ in range(50): rtt.sample(.001)
+	assert rtt.rto == RttEstimator.MIN_RTO
+	rtt.backoff()
+	assert rtt.rto == 2 * RttEstimator.MIN_RTO
+	for _ in range(10): rtt.backoff()
+	assert rtt.rto == RttEstimator.MAX_RTO
+	rtt.sample(100.)
+	assert rtt.rto == RttEstimator.MAX_RTO
+
+# control frames ---------------------------------------------
+@pytest.mark.parametrize('total, received', [(1, 1), (2, 0b10), (9, 0b101010101), (255, (1 << 255) - 1), (255, 1 << 200)])
+def testControlRoundTrip(total, received):
+	assert parse_control(encode_control(1234, total, received)) == (1234, total, received)
+
+def testControlParse():
+	assert parse_control(encode_control(1, 3, 0b11111)) == (1, 3, 0b111), 'bits beyond the count are ignored'
+	for text in ['', '^', '^!!', '%abcde', '{"id": 1}']:
+		assert parse_control(text) is None
+
+# ARQ --------------------------------------------------------
+def testLossless():
+	link = Link()
+	link.send(message())
+	waitFor(lambda: link.sender.stats()['acked'] == 1)
+	assert link.delivered == [message()]
+	assert link.sender.stats() == {'in_flight': 0, 'retransmissions': 0, 'acked': 1, 'gave_up': 0, 'controls_sent': 0}
+	assert link.receiver.stats()['controls_sent'] == 1
+	assert link.sender.rtt('b').srtt is not None
+	link.close()
+
+def testSingleFrameIsNotTracked():
+	link = Link(lambda dest, frames: [])
+	link.send(message(10))
+	assert len(link.sent) == 1 and len(link.sent[0][1]) == 1
+	assert link.sender.stats()['in_flight'] == 0
+	link.close()
+
+def testSelectiveRepeat():
+	link = Link(dropOnce({1, 3}))
+	link.send(message())
+	waitFor(lambda: link.sender.stats()['acked'] == 1)
+	assert link.delivered == [message()]
+	assert fragmentsSent(link) == [1, 3], 'exactly the lost fragments are sent again'
+	link.close()
+
+def testTailLoss():
+	'''nothing arrives after the gap, so only the sender's timeout reveals it'''
+	total = len(Fragmenter(FRAME_SIZE).fragment(message()))
+	link = Link(dropOnce({total - 2, total - 1}))
+	link.send(message())
+	waitFor(lambda: link.sender.stats()['acked'] == 1)
+	assert link.delivered == [message()]
+	assert fragmentsSent(link) == [total - 1, total - 2]
+	link.close()
+
+def testLostControls():
+	lost = [0]
+	def drop(dest, frames):
+		if dest == 'a' and lost[0] < 2:
+			lost[0] += 1
+			return []
+		return frames
+	link = Link(drop)
+	link.send(message())
+	waitFor(lambda: link.sender.stats()['acked'] == 1)
+	assert link.delivered == [message()], 'delivered once despite the retransmissions'
+	assert link.buffer.stats()['duplicates'] >= 1 and link.sender.stats()['retransmissions'] >= 2
+	link.close()
+
+def testReorderedBurst():
+	link = Link(lambda dest, frames: frames[::-1] if dest == 'b' else frames)
+	link.send(message(600))
+	waitFor(lambda: link.sender.stats()['acked'] == 1)
+	assert link.delivered == [message(600)]
+	assert link.sender.stats()['retransmissions'] <= 1, 'the gaps of a reordered burst are no losses to resend again and again'
+	link.close()
+
+def testRandomLoss():
+	rnd = random.Random(4)
+	link = Link(lambda dest, frames: [frame for frame in frames if rnd.random() > .3])
+	messages = [message(200 + 50 * i, i) for i in range(5)]
+	for data in messages: link.send(data)
+	waitFor(lambda: link.sender.stats()['in_flight'] == 0, 20.)
+	stats = link.sender.stats()
+	assert stats['acked'] + stats['gave_up'] == len(messages)
+	assert len(set(link.delivered)) == len(link.delivered) >= stats['acked'] and set(link.delivered) <= set(messages)
+	link.close()
+
+def testGivesUp():
+	link = Link(lambda dest, frames: [] if dest == 'b' else frames)
+	link.send(message())
+	waitFor(lambda: link.sender.stats()['gave_up'] == 1)
+	assert link.sender.stats()['retransmissions'] == ArqEndpoint.MAX_RETRIES
+	assert link.sender.stats()['in_flight'] == 0
+	link.close()
+
+def testSlowSend():
+	'''sending the burst takes longer than the retransmission timeout, which runs once it is out'''
+	link = Link(delay=.01)
+	link.send(message(600))
+	assert len(link.sent[0][1]) * link.delay > RttEstimator.MAX_RTO
+	waitFor(lambda: link.sender.stats()['acked'] == 1)
+	assert link.delivered == [message(600)]
+	assert link.sender.stats()['retransmissions'] == 0 and len(link.sent) == 2, 'the burst and its answer'
+	link.close()
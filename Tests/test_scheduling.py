@@ -0,0 +1,65 @@
+import time
+from collections import namedtuple
+
+from Shared.Enums import COM
+from Client.Scheduling import SendScheduler, AirtimeBudget, lora_airtime_ms, frame_airtime_ms, message_airtime_ms
+
+Req = namedtuple('Req', 'command name')
+
+def cost(req):
+	return 100.
+
+def testAirtime():
+	assert 0 < lora_airtime_ms(10) < lora_airtime_ms(50) < lora_airtime_ms(200)
+	assert frame_airtime_ms('x' * 40) == lora_airtime_ms(40 + 16)
+	assert message_airtime_ms(1, COM.SHOOT, {'pos': [1, 2], 'seq': 5}) < message_airtime_ms(1, COM.PAIR, {'name': 'player', 'id': 1, 'seq': 5})
+
+def testBudget():
+	budget = AirtimeBudget(1000, window_s=1)
+	assert budget.delay() == 0. and budget.available() == 1000
+	budget.charge(1500)
+	assert .4 < budget.delay() <= .51 and budget.available() < 0
+	time.sleep(.6)
+	assert budget.delay() == 0. and 0 < budget.available() < 200
+	time.sleep(1.)
+	assert budget.available() == 1000, 'no more than the budget is saved up'
+
+def testPriorities():
+	scheduler = SendScheduler()
+	for req in [Req(COM.STATE, 's1'), Req(COM.GAME_READINESS, 'r'), Req(COM.SHOOT, 'x1'), Req(COM.STATE, 's2'), Req(COM.SHOOT, 'x2')]:
+		scheduler.push(req)
+	assert len(scheduler) == 5 and scheduler.headClass() == 0
+	assert [req.name for req in scheduler.popBurst(cost)] == ['x1', 'x2', 'r', 's1', 's2'], 'no budget, all of them'
+	assert scheduler.headClass() is None and scheduler.popBurst() == []
+
+def testBurstsFitTheBudget():
+	'''a backlog goes out as the budget allows, what comes meanwhile may overtake the rest'''
+	budget = AirtimeBudget(250, window_s=3600)
+	scheduler = SendScheduler(budget)
+	for i in range(4): scheduler.push(Req(COM.STATE, f's{i}'))
+	scheduler.push(Req(COM.GAME_READINESS, 'r'))
+	assert [req.name for req in scheduler.popBurst(cost)] == ['r', 's0', 's1']
+	budget.charge(300)
+	assert scheduler.delay() > 0 and len(scheduler) == 2
+	budget.tokens = 50
+	scheduler.push(Req(COM.SHOOT, 'x'))
+	assert [req.name for req in scheduler.popBurst(cost)] == ['x'], 'the first goes even if it costs more than is left'
+	budget.tokens = 1000
+	assert [req.name for req in scheduler.popBurst(cost)] == ['s2', 's3']
+	assert [req.name for req in scheduler.popBurst()] == []
+
+def testStats():
+	budget = AirtimeBudget(1000)
+	scheduler = SendScheduler(budget)
+	scheduler.push(Req(COM.SHOOT, 'x'))
+	scheduler.push(Req(COM.STATE, 's'))
+	scheduler.push(Req(COM.STATE, 's'))
+	time.sleep(.01)
+	scheduler.popBurst()
+	scheduler.chargeFrames('bob', ['x' * 40, 'y' * 40])
+	scheduler.noteThrottled()
+	stats = scheduler.stats()
+	assert stats['sent'] == {'urgent': 1, 'control': 0, 'state': 2} and stats['max_depth']['state'] == 2
+	assert stats['max_wait']['state'] >= .01 and stats['mean_wait']['control'] == 0.
+	assert stats['frames'] == 2 and stats['throttled'] == 1
+	assert stats['airtime_ms'] == 2 * frame_airtime_ms('x' * 40) and 1000 - stats['budget_ms'] >= stats['airtime_ms'] - 1
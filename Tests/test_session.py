@@ -0,0 +1,185 @@
+import time
+import pytest
+
+from Shared.Transport import LoopbackTransport
+from Shared.Enums import COM
+from Client.Session import Session, Request, Dispatcher, ReplayWindow
+
+def waitFor(condition, timeout=5.):
+	deadline = time.monotonic() + timeout
+	while not condition():
+		assert time.monotonic() < deadline, 'timed out'
+		time.sleep(.005)
+
+def newSession(name, id_val, opponent=None):
+	session = Session(LoopbackTransport(name))
+	session.id = id_val
+	session.connected = opponent is not None
+	session.opponent_node_name = opponent
+	return session
+
+@pytest.fixture
+def sessions():
+	'''alice and bob in a match, carol a node looking for a game'''
+	alice, bob, carol = newSession('alice-session', 1001, 'bob-session'), newSession('bob-session', 1002, 'alice-session'), newSession('carol-session', 1003)
+	yield alice, bob, carol
+	for session in [alice, bob, carol]:
+		session.connected = False
+		session.quitNowEvent.set()  # all threads stop at once, not one poll timeout after another
+	for session in [alice, bob, carol]: session.quit()
+
+def dropNext(session, command):
+	'''loses the next message of command the session sends'''
+	send = session.transport.send_messages
+	def dropping(node, id_val, messages):
+		if messages[0][0] == command:
+			session.transport.send_messages = send
+			return True
+		return send(node, id_val, messages)
+	session.transport.send_messages = dropping
+
+def shoot(alice, bob, lostAnswer=False, meanwhile=lambda: None):
+	'''alice shoots, bob answers, @return: what alice's callback got'''
+	answers = []
+	alice.tryToSend(COM.SHOOT, {'pos': [3, 4]}, answers.append, blocking=False)
+	waitFor(lambda: bob.dispatcher.inbox)
+	[(id_val, command, payload)] = bob.unsolicited()
+	assert (id_val, command, payload['pos']) == (alice.id, COM.SHOOT, [3, 4])
+	if lostAnswer: dropNext(bob, COM.SHOOT)
+	bob.notify(COM.SHOOT, {'hitted': True}, re=payload['seq'])
+	meanwhile()
+	if lostAnswer:
+		time.sleep(.05)
+		assert not alice.responseQueue.qsize()
+		alice.resend()
+	waitFor(lambda: alice.responseQueue.qsize())
+	alice.loadResponses()
+	return answers
+
+def request(command, seq, sentAt=0.):
+	return Request(command, {}, lambda res: None, False, state=1, seq=seq, sentAt=sentAt)
+
+def reply(re):
+	return Request(COM.SHOOT, {'hitted': False}, None, False, oneway=True, re=re)
+
+# replay window ---------------------------------------------
+def testReplayWindow():
+	window = ReplayWindow()
+	assert window.accept(1) and window.accept(3)
+	assert not window.accept(3) and not window.accept(1)
+	assert window.accept(2), 'late, but not seen yet'
+	assert window.accept(100)
+	assert not window.accept(100 - ReplayWindow.SIZE), 'older than the window'
+	assert window.accept(101 - ReplayWindow.SIZE) and not window.accept(101 - ReplayWindow.SIZE)
+
+# dispatcher ------------------------------------------------
+def testDispatchByRe():
+	dispatcher = Dispatcher()
+	shot, rematch = request(COM.SHOOT, 1), request(COM.UPDATE_REMATCH, 2)
+	dispatcher.expect(shot)
+	dispatcher.expect(rematch)
+	assert dispatcher.dispatch((7, COM.UPDATE_REMATCH, {}), re=2, seq=10) is rematch
+	assert dispatcher.dispatch((7, COM.UPDATE_REMATCH, {}), re=2, seq=11) is None, 'already answered'
+	assert dispatcher.dispatch((7, COM.UPDATE_REMATCH, {}), re=1, seq=12) is None, 'another command'
+	assert dispatcher.stale == 2 and not dispatcher.inbox
+	assert dispatcher.dispatch((7, COM.SHOOT, {}), re=1, seq=13) is shot
+	assert len(dispatcher) == 0
+
+def testDispatchByCommand():
+	'''a peer which doesn't number its messages gets the oldest request of the command'''
+	dispatcher = Dispatcher()
+	first, second = request(COM.SHOOT, 1), request(COM.SHOOT, 2)
+	dispatcher.expect(first)
+	dispatcher.expect(second)
+	assert dispatcher.dispatch((7, COM.SHOOT, {})) is first
+	assert dispatcher.dispatch((7, COM.SHOOT, {}), seq=5) is None, 'numbered without re, unsolicited'
+	assert dispatcher.popInbox() == [(7, COM.SHOOT, {'seq': 5})]
+	assert dispatcher.dispatch((7, COM.SHOOT, {}), re=2) is second
+	assert dispatcher.dispatch((7, COM.SHOOT, {})) is None, 'answered by re meanwhile'
+	assert dispatcher.popInbox() == [(7, COM.SHOOT, {})]
+
+def testExpectPrunesAnswered():
+	dispatcher = Dispatcher()
+	for seq in range(1, 101):
+		dispatcher.expect(request(COM.SHOOT, seq))
+		assert dispatcher.dispatch((7, COM.SHOOT, {}), re=seq)
+	assert len(dispatcher._byCommand[COM.SHOOT]) == 1
+
+def testInbox():
+	dispatcher = Dispatcher()
+	for seq in range(1, Dispatcher.INBOX_SIZE + 3):
+		dispatcher.dispatch((7, COM.STATE, {'version': seq}), seq=seq)
+	assert dispatcher.dropped == 2
+	inbox = dispatcher.popInbox()
+	assert len(inbox) == Dispatcher.INBOX_SIZE and inbox[0][2]['seq'] == 3, 'the newest are kept, oldest first'
+	assert not dispatcher.popInbox()
+
+def testPendingAndAbandon():
+	dispatcher = Dispatcher()
+	assert dispatcher.lastSent() is None
+	shot, rematch = request(COM.SHOOT, 1, 5.), request(COM.UPDATE_REMATCH, 2, 7.)
+	dispatcher.expect(shot)
+	dispatcher.expect(rematch)
+	assert dispatcher.lastSent() == 7. and sorted(req.seq for req in dispatcher.pending()) == [1, 2]
+	dispatcher.forget(rematch)
+	assert dispatcher.pending() == [shot]
+	dispatcher.abandon()
+	assert not dispatcher.pending() and dispatcher.dispatch((7, COM.SHOOT, {})) is None
+
+def testReplies():
+	dispatcher = Dispatcher()
+	dispatcher.remember('bob', reply(4))
+	dispatcher.remember('carol', reply(4))
+	assert dispatcher.replyTo('bob', 4).re == 4 and dispatcher.replyTo('bob', 5) is None
+	dispatcher.forgetReplies('carol')
+	assert dispatcher.replyTo('carol', 4) is None and dispatcher.replyTo('bob', 4), "only carol's are forgotten"
+	for re in range(10, 10 + Dispatcher.REPLIES_KEPT):
+		dispatcher.remember('bob', reply(re))
+	assert dispatcher.replyTo('bob', 4) is None and dispatcher.replyTo('bob', 10), 'the oldest goes'
+
+# sessions --------------------------------------------------
+def testRequestAndReply(sessions):
+	alice, bob, carol = sessions
+	assert shoot(alice, bob) == [{'hitted': True}]
+	assert alice.noPendingReqs() and not alice.dispatcher.pending()
+
+def testLostReplyIsSentAgain(sessions):
+	alice, bob, carol = sessions
+	assert shoot(alice, bob, lostAnswer=True) == [{'hitted': True}]
+	assert bob.duplicates == 1
+
+def testDuplicatesAreDropped(sessions):
+	alice, bob, carol = sessions
+	for _ in range(3): alice.transport.send_messages('bob-session', alice.id, [(COM.STATE, {'version': 1, 'seq': 1000})])
+	waitFor(lambda: bob.duplicates == 2)
+	assert bob.unsolicited() == [(alice.id, COM.STATE, {'version': 1, 'seq': 1000})]
+
+def testPairOfAnotherNodeKeepsTheReplies(sessions):
+	'''a node looking for a game probes the players of a match too'''
+	alice, bob, carol = sessions
+	def probe():
+		carol.sendTo('bob-session', COM.PAIR, {'name': 'carol', 'id': carol.id})
+		waitFor(lambda: bob.dispatcher.inbox)
+		assert bob.unsolicited()[0][2]['node'] == 'carol-session'
+	assert shoot(alice, bob, lostAnswer=True, meanwhile=probe) == [{'hitted': True}], "bob's answer is sent again"
+
+def testOtherNodesDontKeepTheOpponentAlive(sessions):
+	alice, bob, carol = sessions
+	alice.liveness.check(None)  # starts watching bob
+	alice.liveness.probing(Request(COM.HEARTBEAT, {}, None, False, oneway=True))
+	carol.sendTo('alice-session', COM.STATE, {'version': 1})
+	carol.sendTo('alice-session', COM.HEARTBEAT, {})
+	waitFor(lambda: alice.foreign == 2)
+	assert alice.liveness.unanswered == 1 and not alice.dispatcher.inbox
+	bob.sendTo('alice-session', COM.STATE, {'version': 1})
+	waitFor(lambda: alice.dispatcher.inbox)
+	assert alice.liveness.unanswered == 0
+
+def testDisconnectOfAnotherNode(sessions):
+	alice, bob, carol = sessions
+	carol.sendTo('alice-session', COM.DISCONNECT, {})
+	waitFor(lambda: alice.foreign == 1)
+	assert alice.loadResponses() == ('', None), 'the match goes on'
+	bob.disconnect()
+	waitFor(lambda: alice.responseQueue.qsize())
+	assert alice.loadResponses()[0] == 'Opponent left'
@@ -0,0 +1,72 @@
+import random
+import time
+import pytest
+
+from Shared.Transport import LoopbackTransport
+from Shared.Enums import COM, STAGES, SHOTS
+from Client.Session import Session
+from Client.SessionMux import SessionMux
+from Client.Discovery import OpponentDiscovery
+from Client import Game, Checkpoint
+
+TIMEOUT = 60.  # s
+
+class Node(LoopbackTransport):
+	'''a loopback node which knows only the given contacts'''
+	def __init__(self, name, contacts):
+		super().__init__(name)
+		self.contacts = contacts
+	def get_contacts(self):
+		return list(self.contacts)
+
+def newPlayer(session, name, tmp_path):
+	game = Game.Game(session)
+	game.options.playerName = list(name)
+	game.checkpoint = Checkpoint.MatchCheckpoint(str(tmp_path / f'{name}.json'))
+	game.newGameStage(STAGES.CONNECTING)
+	return game
+
+def play(players, rnd):
+	'''one iteration of every player's game loop without drawing, a player places its fleet and shoots when it's its turn'''
+	for game in players:
+		game.handleConnections()
+		game.updateTransition()
+		if game.gameStage == STAGES.PLACING and game.session.opponent_node_name and not game.grid.allShipsPlaced():
+			game.grid.autoplace()
+			game.toggleGameReady()
+		if game.gameStage == STAGES.SHOOTING and game.player_on_turn == game.session.id and not game.session.alreadySent[COM.SHOOT]:
+			x, y = rnd.choice([(x, y) for y in range(10) for x in range(10) if game.opponentGrid.shots[y][x] == SHOTS.NOT_SHOTTED])
+			game.opponentGrid.shots[y][x] = SHOTS.SHOTTED_UNKNOWN
+			game.shootReq([x, y])
+
+@pytest.fixture(autouse=True)
+def quickRounds(monkeypatch):
+	'''a guest whose probe reached a hosted game matched already probes the gateway again soon'''
+	monkeypatch.setattr(OpponentDiscovery, 'ROUND_PAUSE', .2)
+
+def testTwoMatchesOverOneRadio(tmp_path):
+	'''a gateway node hosts two games, each played against another node'''
+	mux = SessionMux(Node('gateway-mux', []))
+	hosted = [newPlayer(mux.open(), f'host{i}-mux', tmp_path) for i in range(2)]
+	remote = [newPlayer(Session(Node(f'guest{i}-mux', ['gateway-mux'])), f'guest{i}-mux', tmp_path) for i in range(2)]
+	players = hosted + remote
+	rnd = random.Random(3)
+	try:
+		deadline = time.monotonic() + TIMEOUT
+		while not all(game.gameStage in [STAGES.GAME_END, STAGES.END_GRID_SHOW] for game in players):
+			assert time.monotonic() < deadline, f'stuck in {[game.gameStage.name for game in players]}'
+			play(players, rnd)
+			time.sleep(.002)
+		assert sorted(game.session.opponent_node_name for game in hosted) == ['guest0-mux', 'guest1-mux']
+		for game in remote:
+			host = next(host for host in hosted if host.session.opponent_node_name == game.session.transport.name)
+			assert game.session.opponent_node_name == 'gateway-mux' and game.options.opponentName == host.options.submittedPlayerName()
+			assert game.options.gameWon != host.options.gameWon and game.moves == host.moves, 'the two sides played the same match'
+		stats = mux.stats()
+		assert stats['sessions'] == 2 and stats['frames'] > 0
+		assert all(game.session.duplicates == 0 for game in hosted)
+	finally:
+		for game in players:
+			if game.gameStage != STAGES.CLOSING: game.quit()
+		for game in players: game.handleConnections()
+		mux.quit()
@@ -0,0 +1,57 @@
+import time
+import pytest
+
+from Shared.Transport import LoopbackTransport
+from Client.Session import Session
+from Client.Subscriptions import StateSubscription
+
+def waitFor(condition, timeout=5.):
+	deadline = time.monotonic() + timeout
+	while not condition():
+		assert time.monotonic() < deadline, 'timed out'
+		time.sleep(.005)
+
+@pytest.fixture
+def players():
+	'''the subscriptions of alice and bob to each other'''
+	sessions = [Session(LoopbackTransport(name)) for name in ['alice-state', 'bob-state']]
+	for session, id_val, opponent in zip(sessions, [2001, 2002], ['bob-state', 'alice-state']):
+		session.id, session.connected, session.opponent_node_name = id_val, True, opponent
+	alice, bob = StateSubscription(sessions[0], 2002), StateSubscription(sessions[1], 2001)
+	alice.start()
+	bob.start()
+	yield alice, bob
+	for session in sessions:
+		session.connected = False
+		session.quitNowEvent.set()
+	for session in sessions: session.quit()
+
+def testChangesArePushed(players):
+	alice, bob = players
+	waitFor(lambda: alice.peerVersion == 1)
+	assert alice.changes() == StateSubscription.DEFAULTS and alice.changes() is None
+	bob.publish(ready=True)
+	bob.publish(ready=True)
+	waitFor(lambda: alice.peerVersion == 2)
+	assert alice.changes() == {**StateSubscription.DEFAULTS, 'ready': True}
+	assert bob.notifications == 1, 'no change, no notification'
+
+def testStaleStateIsIgnored(players):
+	alice, bob = players
+	waitFor(lambda: alice.peerVersion == 1)
+	alice.onState(2002, {'version': 1, 'ready': True, 'on_turn': 5, 'rematch_desired': True})
+	assert alice.peer == StateSubscription.DEFAULTS
+
+def testStateOfAnotherPlayerIsIgnored(players):
+	alice, bob = players
+	alice.onState(2003, {'version': 100, 'ready': True, 'on_turn': 2003, 'rematch_desired': True})
+	assert alice.peerVersion < 100 and alice.peer['on_turn'] == 0
+
+def testPeerRestarted(players):
+	alice, bob = players
+	bob.publish(on_turn=2001)
+	waitFor(lambda: alice.peerVersion == 2)
+	alice.peerRestarted()
+	alice.onState(2002, {'version': 1, 'ready': True, 'on_turn': 2001, 'rematch_desired': False})
+	assert alice.changes() == {'ready': True, 'on_turn': 2001, 'rematch_desired': False}, 'versions start over'
+	waitFor(lambda: bob.peerVersion == 2)
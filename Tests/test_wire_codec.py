@@ -0,0 +1,127 @@
+import hashlib
+import random
+import pytest
+
+from Shared import WireCodec
+from Shared.WireCodec import CodecError, encode, decode
+from Shared.Enums import COM
+from Shared.Transport import LoopbackTransport
+from Shared import MeshCorePrimitives
+
+def ship(x, y, size=1, horizontal=True, hitted=None):
+	return {'pos': [x, y], 'size': size, 'horizontal': horizontal, 'hitted': hitted or [False] * size}
+
+FLEET = [ship(0, 0, 4), ship(0, 2, 3), ship(4, 2, 3), ship(0, 4, 2), ship(3, 4, 2), ship(6, 4, 2), ship(0, 6), ship(2, 6), ship(4, 6), ship(6, 6)]  # canonical order
+SHOT_ANSWER = {'hitted': True, 'sunken_ship': ship(0, 0, 4, hitted=[True] * 4), 'game_won': False, 'stay_connected': True}
+
+def assertRoundTrip(command, payload, playerId=123456):
+	data = encode(playerId, command, payload)
+	assert decode(data) == (playerId, command, payload)
+	return data
+
+@pytest.mark.parametrize('command, payload', [
+	(COM.SHOOT, {'pos': [9, 9]}),
+	(COM.PAIR, {'name': 'alice', 'id': 42}),
+	(COM.PAIR, {'name': 'bob', 'id': 7, 'caps': WireCodec.CAP_DEFLATE}),
+	(COM.GAME_READINESS, {'ships': FLEET, 'ready': True, 'id': 99}),
+	(COM.GAME_READINESS, {'ships': [ship(0, 0, 2), ship(0, 0, 1, False)], 'ready': False, 'id': 99}),  # overlapping, no bitboard
+	(COM.STATE, {'version': 3, 'ready': True, 'on_turn': 0, 'rematch_desired': False}),
+	(COM.RESUME, {'turn': 1, 'hash': 2 ** 40, 'moves': [[1, 2, 3]]}),
+	(COM.HEARTBEAT, {}),
+])
+def testSchemaRoundTrip(command, payload):
+	data = assertRoundTrip(command, payload)
+	assert data[0] & 0x0F, 'a schema should have been used'
+
+def testShotIsFourBytes():
+	assert len(encode(1, COM.SHOOT, {'pos': [3, 4]})) == 4
+	assert decode(encode(1, COM.SHOOT, {'pos': [3, 4]}))[2] == {'pos': [3, 4]}
+
+def testFleetFitsOneFrame():
+	assert len(encode(1, COM.GAME_READINESS, {'ships': FLEET, 'ready': True, 'id': 1})) < 30
+
+@pytest.mark.parametrize('payload', [
+	SHOT_ANSWER,
+	{**SHOT_ANSWER, 'game_won': True, 'opponent_grid': {'ships': FLEET}, 'game_end_msg': 'You lost!   :('},
+	{'approved': True},
+	{'unknown_key': [1, -2, 3.5, None, 'x', {'nested': False}], 'id': -(2 ** 70)},
+	{'pos': [0, 0], 'rematch_desired': True},  # SHOOT schema doesn't fit
+	{},
+])
+def testGenericRoundTrip(payload):
+	data = assertRoundTrip(COM.SHOOT, payload)
+	assert not data[0] & 0x0F, 'no schema fits'
+
+def testSequenceNumbers():
+	assertRoundTrip(COM.SHOOT, {'pos': [1, 2], 'seq': 1})
+	assertRoundTrip(COM.SHOOT, {**SHOT_ANSWER, 'seq': 2 ** 32, 're': 5})
+	assert encode(1, COM.SHOOT, {'pos': [1, 2], 'seq': 3})[0] >> 4 == WireCodec.SEQUENCED
+	assert encode(1, COM.SHOOT, {'pos': [1, 2]})[0] >> 4 == WireCodec.VERSION
+	for bad in [{'seq': 0}, {'seq': -1}, {'seq': 1, 're': 0}, {'seq': 'x'}, {'seq': True}]:
+		with pytest.raises(CodecError): encode(1, COM.SHOOT, {'pos': [1, 2], **bad})
+
+def testEveryCommandRoundTrips():
+	for command in COM:
+		assertRoundTrip(command, {'seq': 1})
+
+def testBatch():
+	messages = [encode(1, COM.SHOOT, {'pos': [i, i], 'seq': i + 1}) for i in range(10)] + [encode(1, COM.HEARTBEAT, {'seq': 300})]
+	batch = WireCodec.encode_batch(messages)
+	assert WireCodec.is_batch(batch) and not WireCodec.is_batch(messages[0])
+	assert WireCodec.decode_batch(batch) == messages
+	with pytest.raises(CodecError): WireCodec.decode_batch(batch[:-1])
+	with pytest.raises(CodecError): WireCodec.decode_batch(messages[0])
+
+def testCompression():
+	data = encode(1, COM.SHOOT, {**SHOT_ANSWER, 'game_won': True, 'opponent_grid': {'ships': FLEET}, 'game_end_msg': 'You lost!   :(', 'seq': 9, 're': 8})
+	packed = WireCodec.compress(data)
+	assert packed is not None and len(packed) < len(data) and WireCodec.is_compressed(packed)
+	assert WireCodec.decompress(packed) == data
+	assert WireCodec.compress(encode(1, COM.SHOOT, {'pos': [1, 1]})) is None, 'too short to gain anything'
+	with pytest.raises(CodecError): WireCodec.decompress(packed[:-2])
+	with pytest.raises(CodecError): WireCodec.decompress(data)
+
+@pytest.mark.parametrize('caps, negotiated', [(WireCodec.CAP_DEFLATE | 0x80, WireCodec.CAP_DEFLATE), ('1', 0), (True, 0), (None, 0)])
+def testAnnouncedCapabilities(caps, negotiated):
+	'''only the known bits of an integer 'caps' count, anything else announces none'''
+	transport = LoopbackTransport()
+	try:
+		[[frame]] = MeshCorePrimitives.encode_messages(5, [(COM.PAIR, {'name': 'peer', 'id': 5, 'caps': caps})])
+		[(id_val, command, payload)] = transport._decode_frame('peer-codec', frame)
+		assert transport.peer_caps['peer-codec'] == negotiated and 'caps' not in payload
+	finally:
+		transport.close()
+
+def testPresetDictionaryIsFrozen():
+	'''peers deflate against it, a change breaks decompression between versions'''
+	assert hashlib.md5(WireCodec.preset_dictionary()).hexdigest() == '5305be8c061ed055bfa996e3dcc6f4cf'
+
+def testTextArmour():
+	data = bytes(range(256))
+	text = WireCodec.to_text(data)
+	assert text.startswith(WireCodec.BINARY_MARKER) and text.isascii()
+	assert WireCodec.from_text(text) == data
+	assert WireCodec.from_text('{"command": "!SHOOT"}') is None
+	assert WireCodec.from_text(WireCodec.BINARY_MARKER + '~~~~') is None
+
+@pytest.mark.parametrize('data', [
+	b'', b'\x10', bytes([0x30, 0, 1]), bytes([0x10, 200, 1]),  # short, bad version, unknown opcode
+	bytes([0x1F, list(COM).index(COM.SHOOT), 1, 0]),  # unknown schema
+	encode(1, COM.SHOOT, {'pos': [1, 1]}) + b'\x00',  # trailing
+	encode(1, COM.SHOOT, {**SHOT_ANSWER, 'seq': 1})[:-1],  # truncated
+])
+def testMalformed(data):
+	with pytest.raises(CodecError): decode(data)
+
+def testGarbageOnlyRaisesCodecError():
+	rnd = random.Random(5)
+	data = encode(77, COM.SHOOT, {**SHOT_ANSWER, 'opponent_grid': {'ships': FLEET}, 'name': 'x' * 40, 'seq': 1000, 're': 999})
+	for n in range(len(data)):
+		with pytest.raises(CodecError): decode(data[:n])
+	for _ in range(5000):
+		garbled = bytearray(data)
+		garbled[rnd.randrange(len(data))] = rnd.randrange(256)
+		try:
+			decode(bytes(garbled))
+		except CodecError:
+			pass
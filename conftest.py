@@ -0,0 +1,8 @@
+'''
+pytest setup: the tests import `Client` and `Shared` from the repository
+root (this directory is put on sys.path for them) and the game draws into
+memory instead of opening a window.
+'''
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'